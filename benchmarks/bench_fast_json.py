@@ -0,0 +1,95 @@
+"""Micro-benchmark: `response.json()` against the FAST_JSON path, per answer.
+
+    python -m benchmarks.bench_fast_json
+
+Both sides decode a real `requests.Response` holding the bytes a server would
+have sent, so the stdlib side pays what it pays in production: the encoding
+guess, the bytes -> str decode and the parse. The payloads are synthetic but
+shaped and sized like the real ones:
+
+  * hypercore-holdings: a wallet with 200 positions, each with the handful of
+    fields purrfolio returns for a position, plus `grandTotal`;
+  * fetch_table: the Wallets table as Grist sends it — column-major, 10 columns
+    — at 1 000 and at 10 000 rows.
+"""
+
+import json
+import random
+import timeit
+
+import requests  # type: ignore
+
+import src.fast_json
+from src.fast_json import response_json
+
+
+def hypercore_holdings(positions=200):
+    rng = random.Random(1)
+    return {
+        "grandTotal": "{:.6f}".format(rng.uniform(0, 1e6)),
+        "holdings": [{
+            "coin": "TOKEN{}".format(n),
+            "total": "{:.8f}".format(rng.uniform(0, 1e4)),
+            "hold": "0.0",
+            "entryNtl": "{:.6f}".format(rng.uniform(0, 1e5)),
+            "usdValue": rng.uniform(0, 1e5),
+            "price": rng.uniform(0, 100),
+            "change24h": rng.uniform(-0.5, 0.5),
+        } for n in range(positions)],
+    }
+
+
+def wallets_table(rows):
+    rng = random.Random(2)
+    return {
+        "id": list(range(1, rows + 1)),
+        "manualSort": list(range(1, rows + 1)),
+        "Address": ["0x{:040x}".format(rng.getrandbits(160)) for _ in range(rows)],
+        "Name": ["wallet {}".format(n) for n in range(rows)],
+        "Hypercore": [rng.uniform(0, 1e4) for _ in range(rows)],
+        "Hyperevm": [rng.uniform(0, 1e4) for _ in range(rows)],
+        "Value": [rng.uniform(0, 1e4) for _ in range(rows)],
+        "Comment": ["" for _ in range(rows)],
+        "Lease_owner": ["" for _ in range(rows)],
+        "Lease_expires": [0 for _ in range(rows)],
+    }
+
+
+PAYLOADS = {
+    "hypercore-holdings": hypercore_holdings(),
+    "fetch_table 1k": wallets_table(1_000),
+    "fetch_table 10k": wallets_table(10_000),
+}
+
+
+def as_response(payload):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps(payload).encode("utf-8")
+    return response
+
+
+def per_call_ms(response, fast, number):
+    src.fast_json.enable_fast_json(fast)
+    try:
+        return min(timeit.repeat(lambda: response_json(response), number=number, repeat=5)) / number * 1e3
+    finally:
+        src.fast_json.enable_fast_json(False)
+
+
+def main():
+    if src.fast_json.orjson is None:
+        raise SystemExit("orjson is not installed: `pip install -r requirements.txt` first")
+    print(f"{'payload':<20}{'KiB':>8}{'json ms':>10}{'orjson ms':>11}{'speedup':>10}")
+    for name, payload in PAYLOADS.items():
+        response = as_response(payload)
+        number = max(1, 2_000_000 // len(response.content))
+        old = per_call_ms(response, False, number)
+        new = per_call_ms(response, True, number)
+        kib = len(response.content) / 1024
+        print(f"{name:<20}{kib:>8.0f}{old:>10.3f}{new:>11.3f}{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Load test: a round's Grist traffic against the local stand-in, over real HTTP.
+
+    python -m benchmarks.bench_grist_round [--rows 100000] [--latency 0.02] [--wallets 100]
+
+The real `GRIST` client and the real round (`check_wallets`) against
+benchmarks/grist_standin.py, with purrfolio replaced by a constant answer so
+only the Grist side is timed. Each line compares one read or write path with
+the one it replaced, on the same synthetic document:
+
+  * the settings: one `find_optional_setting` per setting, or one snapshot;
+  * the pending wallets: the whole table filtered here, the SQL query, or the
+    mirror after an unchanged document;
+  * a round's results: a write per wallet, or the round's batch;
+  * small calls: a connection per call, as grist_api's `requests.request`
+    made them, or the client's kept-alive session;
+  * whole rounds: `run()`'s own round (`_round`: snapshot, selection, claim,
+    checks, writes) for one document, with a write per wallet or with
+    `Write batch size`, without and then with `Lease minutes`. The round's
+    Settings rows are the only thing that changes between the two columns.
+
+Every path pays `latency` per request, so the differences are round trips and
+payload size, which is what a remote Grist charges for.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+# src.checker reads its configuration at import and exits without the three
+# Grist variables. Their values do not matter here: every client below is built
+# against the stand-in's own address.
+for _name in ("GRIST_SERVER", "GRIST_DOC_ID", "GRIST_API_KEY"):
+    os.environ.setdefault(_name, "standin")
+
+import requests  # noqa: E402  pylint: disable=wrong-import-position
+
+import src.checker  # noqa: E402  pylint: disable=wrong-import-position
+from benchmarks.grist_standin import DOC_ID, SETTINGS, Document, GristStandIn, populate  # noqa: E402
+from src.settings import settings  # noqa: E402
+from src.balances import find_none_values  # noqa: E402
+from src.grist import GRIST, BatchWriter  # noqa: E402
+from src.wallet_mirror import WalletMirror  # noqa: E402
+
+# The settings `run()` reads every round, known rows and optional ones alike.
+ROUND_SETTINGS = list(SETTINGS) + ["Price max age", "Concurrency", "Engine", "Rate limit", "Rate burst",
+                                   "Write batch size", "Write batch seconds", "Lease minutes", "Refresh hours",
+                                   "Prefetch seconds", "Round seconds", "Wallet seconds"]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def client(standin, mirror=None):
+    return GRIST(standin.url, DOC_ID, "key", "Wallets", "Settings", logging.getLogger("bench"), mirror=mirror)
+
+
+def use_settings(document, rows):
+    """Replace the stand-in's Settings table with SETTINGS and `rows` on top."""
+    document.create("Settings", {"Setting": "TEXT", "Value": "TEXT"})
+    with document.lock, document.transaction():
+        document.db.executemany("INSERT INTO Settings (Setting, Value) VALUES (?, ?)",
+                                list({**SETTINGS, **rows}.items()))
+
+
+def one_round(standin, document, rows):
+    """Seconds of one `_round` of a fresh document client under `rows`; each takes new pending wallets."""
+    use_settings(document, rows)
+    round_document = src.checker._Document(DOC_ID)  # pylint: disable=protected-access
+    try:
+        seconds, (_, finished) = timed(
+            lambda: src.checker._round(round_document, src.checker._Shared()))  # pylint: disable=protected-access
+    finally:
+        round_document.prefetch.close()
+        round_document.grist.close()
+    # A round that failed returns early, and its time would read as a speedup.
+    if not finished:
+        raise RuntimeError("the round failed, see the log above")
+    return seconds
+
+
+class ConnectionPerCall:
+    """grist_api's own transport: module-level `requests.request`, a new session per call."""
+
+    @staticmethod
+    def request(*args, **kwargs):
+        return requests.request(*args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--checked", type=float, default=0.9)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--wallets", type=int, default=100)
+    args = parser.parse_args()
+
+    document = Document()
+    populate(document, args.rows, args.checked)
+    # purrfolio is not what is measured: every wallet resolves at once.
+    src.checker.check_balance = lambda address, logger, proxy=None, **kwargs: (1.0, 2.0)
+    src.checker.write_heartbeat = lambda path, logger=None: None
+
+    with GristStandIn(document, latency=args.latency) as standin:
+        grist = client(standin)
+        print(f"{args.rows} wallets, {args.checked:.0%} checked, {args.latency * 1000:.0f} ms per request")
+        print(f"{'path':<34}{'old s':>9}{'new s':>9}{'speedup':>9}")
+
+        def compare(name, old, new):
+            print(f"{name:<34}{old:>9.3f}{new:>9.3f}{old / new:>8.1f}x")
+
+        old, _ = timed(lambda: [grist.find_optional_setting(name) for name in ROUND_SETTINGS])
+        def one_snapshot():
+            snapshot = grist.settings_snapshot()
+            return [snapshot.find_optional_setting(name) for name in ROUND_SETTINGS]
+
+        new, _ = timed(one_snapshot)
+        compare("settings for one round", old, new)
+
+        def whole_table():
+            grist.sql_enabled = False
+            try:
+                return find_none_values(grist, count=args.wallets)
+            finally:
+                grist.sql_enabled = True
+
+        old, _ = timed(whole_table)
+        new, _ = timed(lambda: find_none_values(grist, count=args.wallets))
+        compare("pending wallets: SQL", old, new)
+        mirrored = client(standin, mirror=WalletMirror())
+        find_none_values(mirrored, count=args.wallets)
+        hit, _ = timed(lambda: find_none_values(mirrored, count=args.wallets))
+        compare("pending wallets: unchanged mirror", old, hit)
+
+        wallets = find_none_values(grist, count=args.wallets)
+        old, _ = timed(lambda: src.checker.check_wallets(grist, wallets, None, None, None))
+        new, _ = timed(lambda: src.checker.check_wallets(grist, wallets, None, None, None,
+                                                         batch=BatchWriter(grist, len(wallets) or 1)))
+        compare(f"round of {len(wallets)} results", old, new)
+
+        throwaway = GRIST(standin.url, DOC_ID, "key", "Wallets", "Settings", logging.getLogger("bench"),
+                          session=ConnectionPerCall())
+        old, _ = timed(lambda: [throwaway.doc_state() for _ in range(100)])
+        new, _ = timed(lambda: [grist.doc_state() for _ in range(100)])
+        compare("100 small calls", old, new)
+
+        # The round as run() runs it, client and all, against the stand-in.
+        settings.grist_server = standin.url
+        settings.grist_api_key = "key"
+        settings.grist_doc_id = DOC_ID
+        settings.balance_cache_ttl = 0
+        settings.write_behind = False
+        count = {"Walled count max": str(args.wallets), "Walled count min": str(args.wallets)}
+        batched = {**count, "Write batch size": str(args.wallets)}
+        leased = {"Lease minutes": "10"}
+        old = one_round(standin, document, count)
+        new = one_round(standin, document, batched)
+        compare(f"run() round of {args.wallets}", old, new)
+        old = one_round(standin, document, {**count, **leased})
+        new = one_round(standin, document, {**batched, **leased})
+        compare(f"run() round of {args.wallets}, leased", old, new)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Micro-benchmark: `parse_amount` against the regex-strip path it replaced.
+
+    python -m benchmarks.bench_parse_amount
+
+The old path was `float(re.sub(r'[^\\d.]', '', str(value)))` for every field of
+every wallet. Both are timed on the shapes the purrfolio endpoints return; the
+old path is timed on the inputs it reads at all (it cannot read "1.5e-3" and
+"-$12.50" correctly, but it does return a number, so they stay in the table).
+"""
+
+import re
+import timeit
+
+from src.balances import parse_amount
+
+SAMPLES = {
+    "json float": 1234.56,
+    "json int": 98765,
+    "bare string": "1234.56",
+    "formatted": "$1,234.56",
+    "exponent": "1.5e-3",
+    "negative": "-$12.50",
+}
+
+NUMBER = 200_000
+
+
+def old_parse(value):
+    return float(re.sub(r'[^\d.]', '', str(value)))
+
+
+def main():
+    print(f"{'input':<14}{'old µs':>10}{'new µs':>10}{'speedup':>10}")
+    for name, value in SAMPLES.items():
+        old = min(timeit.repeat(lambda: old_parse(value), number=NUMBER, repeat=3)) / NUMBER * 1e6
+        new = min(timeit.repeat(lambda: parse_amount(value), number=NUMBER, repeat=3)) / NUMBER * 1e6
+        print(f"{name:<14}{old:>10.3f}{new:>10.3f}{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
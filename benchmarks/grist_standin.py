@@ -0,0 +1,296 @@
+"""A local stand-in for the Grist document, for load tests that must not touch ours.
+
+    python -m benchmarks.grist_standin --rows 100000 --latency 0.02 --port 8484
+
+The in-process doubles in tests/ answer instantly and without HTTP, so they can
+say nothing about what a Grist-side change costs or saves. This is the subset
+of Grist's REST API the service uses, over real HTTP, backed by SQLite:
+
+  * GET   /api/docs/{doc}/tables/{table}/data   (with `?filter=`), columnar;
+  * PATCH /api/docs/{doc}/tables/{table}/data   update, columnar;
+  * POST  /api/docs/{doc}/tables/{table}/data   add, columnar, answers the ids;
+  * POST  /api/docs/{doc}/sql                   SELECT only, `{"sql", "args"}`;
+  * GET   /api/docs/{doc}/states                the action counter.
+
+Every answer waits `latency` seconds first, which is where a remote Grist's cost
+lives. Errors come back the way Grist's do, `{"error": "..."}` with a 4xx, so
+grist_api raises the same exceptions it would in production. The document holds
+`rows` synthetic wallets, a `checked` share of them with both values filled and
+every one with a long `Notes` cell — the width operators give the real table —
+and a Settings table with the rows `run()` needs; `--setting Name=Value` adds or
+replaces one. Point the service at it with the two lines it prints.
+
+Nothing here is shipped: benchmarks/ is in .dockerignore.
+"""
+
+import argparse
+import contextlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DOC_ID = "standin"
+
+WALLET_COLUMNS = {
+    "Address": "TEXT",
+    "hypercore_hype_value": "REAL",
+    "hyperevm_hype_value": "REAL",
+    "Value": "TEXT",
+    "Comment": "TEXT",
+    "Lease_owner": "TEXT",
+    "Lease_expires": "INTEGER",
+    "Checked_at": "INTEGER",
+    "Notes": "TEXT",
+}
+
+SETTINGS = {
+    # Never dialled: the stand-in serves Grist, not purrfolio.
+    "Proxy": "http://proxy.invalid:8080",
+    "Walled count max": "100",
+    "Walled count min": "100",
+    "Wait time max": "1",
+    "Wait time min": "1",
+}
+
+
+class GristError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Document:
+    """The SQLite side: two tables and an action counter, behind one lock."""
+
+    def __init__(self, path=":memory:"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.actions = 0
+
+    def create(self, table, columns):
+        with self.lock:
+            self.db.execute('DROP TABLE IF EXISTS "{}"'.format(table))
+            self.db.execute('CREATE TABLE "{}" (id INTEGER PRIMARY KEY, {})'.format(
+                table, ", ".join('"{}" {}'.format(name, kind) for name, kind in columns.items())))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def columns(self, table):
+        names = [row[1] for row in self.db.execute('PRAGMA table_info("{}")'.format(table))]
+        if not names:
+            raise GristError(404, "Table not found \"{}\"".format(table))
+        return names
+
+    def _check(self, table, names):
+        known = set(self.columns(table))
+        for name in names:
+            if name not in known:
+                raise GristError(400, "Invalid column \"{}\"".format(name))
+
+    def fetch(self, table, filters=None):
+        with self.lock:
+            names = self.columns(table)
+            filters = filters or {}
+            self._check(table, filters)
+            where, args = [], []
+            for name, values in filters.items():
+                where.append('"{}" IN ({})'.format(name, ", ".join("?" * len(values))))
+                args.extend(values)
+            query = 'SELECT * FROM "{}"'.format(table) + (" WHERE " + " AND ".join(where) if where else "")
+            rows = self.db.execute(query, args).fetchall()
+        return {name: [row[position] for row in rows] for position, name in enumerate(names)}
+
+    def add(self, table, data):
+        names = [name for name in data if name != "id"]
+        with self.lock:
+            self._check(table, names)
+            count = len(next(iter(data.values()))) if data else 0
+            ids = []
+            with self.transaction():
+                for position in range(count):
+                    cursor = self.db.execute('INSERT INTO "{}" ({}) VALUES ({})'.format(
+                        table, ", ".join('"{}"'.format(name) for name in names), ", ".join("?" * len(names))),
+                        [data[name][position] for name in names])
+                    ids.append(cursor.lastrowid)
+            self.actions += 1
+        return ids
+
+    def update(self, table, data):
+        if "id" not in data:
+            raise GristError(400, "Missing id")
+        names = [name for name in data if name != "id"]
+        with self.lock:
+            self._check(table, names)
+            with self.transaction():
+                self.db.executemany('UPDATE "{}" SET {} WHERE id = ?'.format(
+                    table, ", ".join('"{}" = ?'.format(name) for name in names)),
+                    [[data[name][position] for name in names] + [row_id]
+                     for position, row_id in enumerate(data["id"])])
+            self.actions += 1
+
+    def sql(self, query, args):
+        if not query.lstrip().upper().startswith("SELECT"):
+            raise GristError(400, "Only select statements are supported")
+        with self.lock:
+            try:
+                cursor = self.db.execute(query, args)
+            except sqlite3.Error as error:
+                raise GristError(400, str(error))
+            names = [column[0] for column in cursor.description]
+            return [{"fields": dict(zip(names, row))} for row in cursor.fetchall()]
+
+
+def populate(document, rows, checked=0.9, seed=0, settings=None):
+    """`rows` synthetic wallets and the Settings table, replacing what was there."""
+    generator = random.Random(seed)
+    document.create("Wallets", WALLET_COLUMNS)
+    document.create("Settings", {"Setting": "TEXT", "Value": "TEXT"})
+    notes = "operator note " * 12
+    wallets = []
+    for number in range(rows):
+        done = generator.random() < checked
+        wallets.append(("0x{:040x}".format(number + 1), 1.0 if done else None, 2.0 if done else None, notes))
+    with document.lock, document.transaction():
+        document.db.executemany('INSERT INTO Wallets (Address, hypercore_hype_value, hyperevm_hype_value, Notes) '
+                                'VALUES (?, ?, ?, ?)', wallets)
+        document.db.executemany("INSERT INTO Settings (Setting, Value) VALUES (?, ?)",
+                                list({**SETTINGS, **(settings or {})}.items()))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so a client's kept-alive connection stays open between calls as
+    # it does against Grist; every answer carries its Content-Length for that.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as two writes; with Nagle on, the second one waits
+    # for the client's delayed ACK (~40 ms) on every answer of a kept connection.
+    disable_nagle_algorithm = True
+    document = None
+    latency = 0.0
+    connections = None
+
+    def setup(self):
+        super().setup()
+        # One handler per accepted connection: the count a kept-alive client keeps low.
+        with self.document.lock:
+            self.connections[0] += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _answer(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _route(self, method):
+        if self.latency:
+            time.sleep(self.latency)
+        # Read before anything can fail: on a kept-alive connection, a body left
+        # unread would be taken for the start of the next request.
+        body = self._body()
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        try:
+            if parts[:2] != ["api", "docs"] or len(parts) < 4 or parts[2] != DOC_ID:
+                raise GristError(404, "Not found")
+            if parts[3:] == ["states"] and method == "GET":
+                return self._answer(200, {"states": [{"n": self.document.actions, "h": str(self.document.actions)}]})
+            if parts[3:] == ["sql"] and method == "POST":
+                return self._answer(200, {"statement": body["sql"],
+                                          "records": self.document.sql(body["sql"], body.get("args") or [])})
+            if len(parts) == 6 and parts[3] == "tables" and parts[5] == "data":
+                table = parts[4]
+                if method == "GET":
+                    filters = json.loads(parse_qs(url.query)["filter"][0]) if "filter" in parse_qs(url.query) else None
+                    return self._answer(200, self.document.fetch(table, filters))
+                if method == "PATCH":
+                    self.document.update(table, body)
+                    return self._answer(200, None)
+                if method == "POST":
+                    return self._answer(200, self.document.add(table, body))
+            raise GristError(404, "Not found")
+        except GristError as error:
+            return self._answer(error.status, {"error": str(error)})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._route("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._route("POST")
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        self._route("PATCH")
+
+
+class GristStandIn:
+    """The server, on `port` (0 picks a free one), in a daemon thread once started."""
+
+    def __init__(self, document, port=0, latency=0.0):
+        self.connections = [0]
+        handler = type("Handler", (_Handler,), {"document": document, "latency": latency,
+                                                "connections": self.connections})
+        self.document = document
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="grist-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--checked", type=float, default=0.9, help="share of wallets already checked")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--port", type=int, default=8484)
+    parser.add_argument("--db", default=":memory:", help="SQLite file, or :memory:")
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE")
+    args = parser.parse_args()
+    document = Document(args.db)
+    populate(document, args.rows, args.checked, settings=dict(item.split("=", 1) for item in args.setting))
+    standin = GristStandIn(document, args.port, args.latency)
+    print(f"GRIST_SERVER={standin.url}\nGRIST_DOC_ID={DOC_ID}", flush=True)
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -123,7 +123,18 @@ SHIPPED_FILES = (
     "src/balances.py",
     "src/heartbeat.py",
     "src/healthcheck.py",
-    "src/http_timeout.py",
+    "src/http_pool.py",
+    "src/leases.py",
+    "src/fast_json.py",
+    "src/balance_cache.py",
+    "src/rate_limit.py",
+    "src/retry.py",
+    "src/wallet_mirror.py",
+    "src/write_behind.py",
+    "src/import_wallets.py",
+    "src/scheduler.py",
+    "src/prefetch.py",
+    "src/deadline.py",
 )
 
 # The importable form of the same set. `main` is included on purpose: it is the module the
@@ -138,7 +149,18 @@ FIRST_PARTY_MODULES = (
     "src.grist",
     "src.balances",
     "src.heartbeat",
-    "src.http_timeout",
+    "src.http_pool",
+    "src.leases",
+    "src.fast_json",
+    "src.balance_cache",
+    "src.rate_limit",
+    "src.retry",
+    "src.wallet_mirror",
+    "src.write_behind",
+    "src.import_wallets",
+    "src.scheduler",
+    "src.prefetch",
+    "src.deadline",
 )
 
 # Top-level names that are this project's own packages/modules rather than distributions
@@ -169,7 +191,8 @@ IGNORED_SRC_DIRS = ("__pycache__",)
 # `pydantic` is separate from `pydantic_settings` because src/config_errors.py imports it
 # directly — a requirements file that pinned only the latter would still resolve today and
 # break the day pydantic-settings stops depending on it.
-EXPECTED_THIRD_PARTY = ("colorama", "grist_api", "pydantic", "pydantic_settings", "requests")
+EXPECTED_THIRD_PARTY = ("colorama", "grist_api", "httpx", "orjson", "pydantic",
+                        "pydantic_settings", "requests")
 
 # The module the Dockerfile's HEALTHCHECK runs, in the form it runs it: `python -m`. `-m`
 # is what makes that work from WORKDIR /app — running the file by path would put src/ on
@@ -0,0 +1,105 @@
+"""An on-disk cache of resolved wallets, so a restart does not pay for them twice.
+
+A wallet's two values are only safe once Grist has them, and between the
+purrfolio answer and the Grist write there is a crash, a restart by auto-heal, or
+a write Grist rejects. Every one of those leaves the wallet pending, so a later
+round checks it again — three more requests through the paid proxy for numbers
+this process already had. This cache keeps each answer for `ttl` seconds:
+
+  * written right after `check_balance` returns, BEFORE the Grist write, because
+    the write is the step it exists to survive;
+  * read right before `check_balance` would go to the network, and a live entry
+    is written to Grist instead.
+
+One SQLite file in the `data/` volume (the image creates /app/data owned by
+`app`, and the entrypoint refuses to start when it is not writable), one row per
+address. The TTL is what keeps a cached answer from standing in for a balance
+that has since changed; past it a row is a miss and is pruned on the next start.
+
+The cache is an optimisation, never a dependency: a file that cannot be opened
+turns it off for the life of the process, a read or write that fails is a miss,
+and both only log a warning. A wallet is never failed because of it.
+"""
+
+import sqlite3
+import threading
+import time
+
+# Relative to WORKDIR, i.e. /app/data in the image and ./data in a checkout.
+DEFAULT_BALANCE_CACHE_FILE = "data/balance_cache.sqlite3"
+
+# Long enough to outlive a crash loop and the rounds after a Grist outage, short
+# enough that a cached answer is still the wallet's balance. 0 turns it off.
+DEFAULT_BALANCE_CACHE_TTL = 3600  # seconds
+
+
+class BalanceCache:
+    def __init__(self, path, ttl, logger=None, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.logger = logger
+        self.clock = clock
+        # One connection, shared by the pooled round's threads under a lock.
+        # Autocommit: every put is its own transaction, which is the point of
+        # writing it before Grist is asked.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS balances ("
+                         "address TEXT PRIMARY KEY, hypercore REAL NOT NULL, "
+                         "hyperevm REAL NOT NULL, fetched_at REAL NOT NULL)")
+        self.prune()
+
+    def _warn(self, action, error):
+        if self.logger is not None:
+            self.logger.warning(f"Balance cache: {action} failed, going to the network: "
+                                f"{type(error).__name__}: {error}")
+
+    def get(self, address):
+        """`(hypercore, hyperevm)` for `address` if a live entry exists, else None."""
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT hypercore, hyperevm, fetched_at FROM balances "
+                                       "WHERE address = ?", (address,)).fetchone()
+        except sqlite3.Error as error:
+            self._warn("read", error)
+            return None
+        if row is None or row[2] + self.ttl <= self.clock():
+            return None
+        return row[0], row[1]
+
+    def put(self, address, hypercore, hyperevm):
+        try:
+            with self._lock:
+                self._db.execute("INSERT OR REPLACE INTO balances VALUES (?, ?, ?, ?)",
+                                 (address, hypercore, hyperevm, self.clock()))
+        except sqlite3.Error as error:
+            self._warn("write", error)
+
+    def prune(self):
+        """Drop every expired entry; the file never grows past one TTL of answers."""
+        with self._lock:
+            self._db.execute("DELETE FROM balances WHERE fetched_at <= ?",
+                             (self.clock() - self.ttl,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM balances").fetchone()[0]
+
+
+def open_balance_cache(path, ttl, logger=None):
+    """The cache at `path`, or None when `ttl` turns it off or the file cannot be opened."""
+    if ttl <= 0:
+        return None
+    try:
+        return BalanceCache(path, ttl, logger=logger)
+    except sqlite3.Error as error:
+        if logger is not None:
+            logger.warning(f"Balance cache: cannot open {path}, running without it: "
+                           f"{type(error).__name__}: {error}")
+        return None
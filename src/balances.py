@@ -2,23 +2,41 @@
 
 Moved out of the old top-level `airdrop_checker.py` with their logic unchanged.
 The arithmetic below decides the numbers that land in the Grist document, so the
-formulas and the ORDER of the three requests are kept exactly as they were: the
-HYPE price is fetched first and is the divisor for both values, so a change there
-silently rescales every wallet checked afterwards.
+formulas and the ORDER of the requests are kept as they were where it matters:
+the HYPE price is fetched first and is the divisor for both values, so a change
+there silently rescales every wallet checked afterwards. The two per-wallet
+requests after it are independent of each other and run concurrently.
 
 The jsonpath helpers that used to live beside these (`get_value_by_jsonpath`,
 `parse_and_sum_jsonpaths`) and the single-wallet `find_none_value` did not come
 along: nothing called them — the loop has used `find_none_values` since it
 started taking several wallets per round. Dropping the two jsonpath ones is what
 removed `jsonpath-ng` (and its `ply` dependency) from requirements.txt.
+
+The price is the one answer that does not depend on the wallet, so a round no
+longer has to ask for it once per address: `HypePriceCache` holds it for a round
+(or for a bounded number of seconds) and `check_balance` still asks for it FIRST,
+before either per-wallet call, so the order above is unchanged from the point of
+view of every wallet.
 """
 
+import asyncio
+import heapq
+import math
 import random
 import re
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import requests  # type: ignore
 
+from src.deadline import REQUEST_TIMEOUT
+from src.fast_json import response_json
+from src.grist import CHECKED_AT_COLUMN
+from src.retry import CircuitOpen, raise_for_transient_status
+
 
 # `user:password@` in front of a host, with or without a scheme in front of it.
 #
@@ -146,40 +164,270 @@ def generate_proxy(proxy_string):
     return proxy_string.replace("{random_token}", random_token)
 
 
-def check_balance(address, logger, proxy=None):
+class HypePriceCache:
+    """The HYPE price, fetched once per round or once per `max_age` seconds.
+
+    `max_age=None` is the round-scoped mode: the price is kept until the loop
+    calls `start_round()`, so a round of N wallets pays for one price request
+    instead of N. A number bounds the staleness in seconds instead, across
+    rounds — that is the mode for a long round, where the first wallet and the
+    last one can be many minutes apart.
+
+    Only a price that parsed AND is positive is kept. A failed or zero answer is
+    handed back to that one wallet (which then fails exactly as it did before
+    this cache existed) and the next wallet asks again: caching it would turn one
+    bad answer into a whole round of `--` in the document.
+
+    The lock makes the fetch single-flight when several wallets are checked at
+    once: the first caller fetches, the others wait for its answer rather than
+    all going out for the same number.
+    """
+
+    def __init__(self, max_age=None, clock=time.monotonic):
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._price = None
+        self._fetched_at = None
+
+    def start_round(self):
+        """Forget a round-scoped price. A `max_age` price keeps its own clock."""
+        with self._lock:
+            if self.max_age is None:
+                self._price = None
+
+    def _is_fresh(self):
+        if self._price is None:
+            return False
+        if self.max_age is None:
+            return True
+        return self._clock() - self._fetched_at < self.max_age
+
+    def _store(self, price):
+        if price > 0:
+            self._price = price
+            self._fetched_at = self._clock()
+
+    def get(self, fetch):
+        """The cached price, or `fetch()` when there is none or it is too old."""
+        with self._lock:
+            if self._is_fresh():
+                return self._price
+            price = fetch()
+            self._store(price)
+            return price
+
+    def peek(self):
+        """The cached price while it is fresh, else None. Never fetches.
+
+        With `store`, this is the interface for a caller that cannot fetch under
+        this lock — the asyncio engine, whose fetch is a coroutine.
+        """
+        with self._lock:
+            return self._price if self._is_fresh() else None
+
+    def store(self, price):
+        """Keep a price fetched elsewhere, under the same rules as `get`."""
+        with self._lock:
+            self._store(price)
+
+
+class AsyncHypePrice:
+    """A `HypePriceCache` seen from inside one event loop.
+
+    The cache's own lock cannot be held across an `await`, so this adapter does
+    the single-flight part itself: while the price is stale, the first wallet
+    starts the fetch and every other wallet awaits that same task. A price that
+    failed or was not positive is not kept (the cache decides that), and the
+    next wallet to ask starts a fresh fetch — the same rule as the threaded path.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._inflight = None
+
+    async def get(self, fetch):
+        price = self.cache.peek()
+        if price is not None:
+            return price
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(fetch())
+        # Shielded, so one wallet being cancelled does not cancel the fetch the
+        # others are waiting on.
+        price = await asyncio.shield(self._inflight)
+        self.cache.store(price)
+        return price
+
+
+HYPE_PRICE_URL = "https://purrfolio.com/api/hype-price"
+DEBANK_URL = "https://purrfolio.com/api/debank-data?address="
+HYPERCORE_URL = "https://purrfolio.com/api/hypercore-holdings?address="
+
+
+# The two shapes `parse_amount` accepts as text, both precompiled once. PLAIN is
+# whatever `float()` would read anyway — sign, digits, one point, an exponent —
+# and is tried first because it is by far the common case. FORMATTED adds the two
+# decorations purrfolio actually puts on a number: a leading "$" (after the sign,
+# "-$12.50") and "," as a thousands separator, which must then group by three.
+#
+# Deliberately NOT accepted, each of which `float()` or the old
+# `re.sub(r'[^\d.]', '', ...)` let through: "nan"/"inf", "1_000" (a python
+# literal, not an API answer), "1.2.3" (the old path turned it into an opaque
+# ValueError), "2 500,00 USD" (read as 250000 by the old path — the comma there is
+# a decimal point), and any minus sign it would have silently dropped.
+_PLAIN_AMOUNT = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_FORMATTED_AMOUNT = re.compile(r"[-+]?\$?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d*)?(?:[eE][-+]?\d+)?")
+
+
+def parse_amount(value, field=None):
+    """A purrfolio number as a float: JSON numbers, "1234.5", "$1,234.56", "-1.5e-3".
+
+    Anything else raises a ValueError that quotes the value and, when given, the
+    field it came from — the message lands in the wallet's `Comment` cell, so it
+    has to say what was unreadable, not just that something was.
+    """
+    kind = type(value)
+    if kind is float or kind is int:
+        number = float(value)
+    else:
+        text = value.strip() if kind is str else ""
+        if "$" not in text and "," not in text:
+            number = float(text) if _PLAIN_AMOUNT.fullmatch(text) else None
+        elif _FORMATTED_AMOUNT.fullmatch(text):
+            number = float(text.replace("$", "").replace(",", ""))
+        else:
+            number = None
+    if number is None or not math.isfinite(number):
+        raise ValueError("{}is not an amount: {!r}".format(
+            "{} ".format(field) if field else "", value))
+    return number
+
+
+def _require_positive_price(hype_price):
+    """Raise unless `hype_price` is one the two values can be divided by.
+
+    `parse_amount` reads a minus sign, and a price of "-$10.00" would otherwise
+    come out as two negative HYPE values written to Grist as a success; zero
+    would be a bare ZeroDivisionError. Either fails the wallet instead, naming
+    the field like any other unreadable answer.
+    """
+    if hype_price <= 0:
+        raise ValueError("price is not a positive amount: {!r}".format(hype_price))
+
+
+def _usd_value(payload, key):
+    """One numeric field of a purrfolio answer."""
+    return parse_amount(payload[key], key)
+
+
+class _BothLookupsFailed(Exception):
+    """Debank and hypercore both raised. Only ever caught inside check_balance."""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = errors
+
+
+def check_balance(address, logger, proxy=None, price=None, session=None, limiter=None, retry=None,
+                  deadline=None):
     """HYPE held by `address`, as (hypercore, hyperevm), via purrfolio.com.
 
     Three requests through the same proxy, and all three have to succeed: the
     price is the divisor for both returned values, so a partial answer would be
-    written to Grist as a number rather than as a failure.
-
-    The `re.sub` on each field is not decoration — these endpoints return values
-    like "$1,234.56" as often as bare numbers, and `float()` on that raises a
-    ValueError that says nothing about which of the three calls produced it.
+    written to Grist as a number rather than as a failure. The price comes first;
+    the debank and hypercore requests then run concurrently, so a wallet costs
+    two round trips of latency rather than three.
+
+    `price` is an optional `HypePriceCache`. With one, the first request is
+    answered from it whenever it holds a fresh price — it is still the first
+    thing asked for, and a price that cannot be had still fails the wallet.
+    Without one every call fetches its own price, as it always did.
+
+    `session` is the kept-alive `requests.Session` for this proxy exit (see
+    `src/http_pool.py`). The proxy is still passed on every call rather than
+    trusted to the session, so a session handed over for the wrong exit cannot
+    quietly send a wallet out direct. Without one, the module-level
+    `requests.get` is used — a fresh connection per call.
+
+    Every field goes through `parse_amount`, not `float()`: these endpoints
+    return values like "$1,234.56" as often as bare numbers, and `float()` on
+    that raises a ValueError that says nothing about which field produced it.
+
+    `limiter` is the process's `TokenBucket` (see `src/rate_limit.py`); each of
+    the three requests takes a token from it before it is sent. A price answered
+    from the cache sends nothing and takes nothing.
+
+    `retry` is the process's `RetryPolicy` (see `src/retry.py`): each request is
+    retried on its own while it fails transiently, behind its endpoint's circuit
+    breaker. A 429 or 5xx answer fails as `UpstreamStatusError` with or without
+    one. `CircuitOpen` is the one exception that does NOT become a wallet
+    failure — it is raised as it is, for the round to stop on.
+
+    `deadline` is the wallet's `Deadline` (see `src/deadline.py`): every request's
+    timeout is cut to what is left of it, and none is sent once it has passed.
     """
-    hype_price_url = "https://purrfolio.com/api/hype-price"
-    debank_url = "https://purrfolio.com/api/debank-data?address="
-    hypercore_url = "https://purrfolio.com/api/hypercore-holdings?address="
-
     proxies = None
     if proxy:
         proxies = {'http': proxy, 'https': proxy}
+    http = requests if session is None else session
 
-    try:
-        hype_price_response = requests.get(hype_price_url, proxies=proxies, timeout=10)
-        hype_price = float(re.sub(r'[^\d.]', '', str(hype_price_response.json()["price"])))
+    def get(endpoint, url):
+        def send():
+            if limiter is not None:
+                limiter.acquire()
+            timeout = REQUEST_TIMEOUT if deadline is None else deadline.timeout()
+            return raise_for_transient_status(endpoint, http.get(url, proxies=proxies, timeout=timeout))
+        return send() if retry is None else retry.call(endpoint, send, deadline=deadline)
 
-        debank_response = requests.get(debank_url + address, proxies=proxies, timeout=10)
-        debank_usd_value = float(re.sub(r'[^\d.]', '', str(debank_response.json()["usd_value"])))
+    def fetch_hype_price():
+        hype_price_response = get("price", HYPE_PRICE_URL)
+        return _usd_value(response_json(hype_price_response), "price")
 
-        hypercore_response = requests.get(hypercore_url + address, proxies=proxies, timeout=10)
-        hypercore_usd_value = float(re.sub(r'[^\d.]', '', str(hypercore_response.json()["grandTotal"])))
+    def fetch_debank_usd_value():
+        debank_response = get("debank", DEBANK_URL + address)
+        return _usd_value(response_json(debank_response), "usd_value")
+
+    def fetch_hypercore_usd_value():
+        hypercore_response = get("hypercore", HYPERCORE_URL + address)
+        return _usd_value(response_json(hypercore_response), "grandTotal")
+
+    try:
+        if price is None:
+            hype_price = fetch_hype_price()
+        else:
+            hype_price = price.get(fetch_hype_price)
+        _require_positive_price(hype_price)
+
+        # The two per-wallet lookups do not depend on each other, only on the
+        # price above, so they go out side by side: hypercore on a helper thread,
+        # debank on this one. Both are waited for before anything is computed —
+        # a wallet is still three successes or a failure.
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="hypercore") as executor:
+            hypercore_future = executor.submit(fetch_hypercore_usd_value)
+            try:
+                debank_usd_value = fetch_debank_usd_value()
+                debank_error = None
+            except Exception as error:
+                debank_error = error
+            hypercore_error = hypercore_future.exception()
+        for error in (debank_error, hypercore_error):
+            if isinstance(error, CircuitOpen):
+                raise error
+        if debank_error is not None and hypercore_error is not None:
+            raise _BothLookupsFailed(debank_error, hypercore_error)
+        if debank_error is not None:
+            raise debank_error
+        if hypercore_error is not None:
+            raise hypercore_error
+        hypercore_usd_value = hypercore_future.result()
 
         hypercore_hype_value = hypercore_usd_value / hype_price
         hyperevm_hype_value = debank_usd_value / hype_price
 
         return hypercore_hype_value, hyperevm_hype_value
 
+    except CircuitOpen:
+        raise
     except Exception as e:
         # Logged AND re-raised with the address in the text: the caller writes the
         # message into the wallet's own Grist row, so an error that does not name
@@ -201,26 +449,173 @@ def check_balance(address, logger, proxy=None):
         # three purrfolio calls raised. What replaces it: `describe_error` puts the
         # original's CLASS NAME in front of its redacted text, so the message still
         # says ConnectionError vs ProxyError vs KeyError, the address still names
-        # the wallet, and the line below logs the same thing at the point of
+        # the wallet, and `wallet_failure` logs the same thing at the point of
         # failure, where the surrounding log lines say which round it belongs to.
-        reason = describe_error(e)
-        logger.error(f"Error while checking token transactions for address {address}: {reason}")
-        raise Exception(f"Error while checking token transactions for address {address}: {reason}") from None
+        raise wallet_failure(address, logger, e) from None
+
+
+async def async_check_balance(client, address, logger, price=None, limiter=None, retry=None, deadline=None):
+    """The asyncio twin of `check_balance`, on an httpx-style `AsyncClient`.
 
+    Same three requests, same order (price first, then the two lookups side by
+    side), same arithmetic and the same failure: logged and raised through
+    `wallet_failure`, `from None`, for the reasons given in check_balance.
 
-def find_none_values(grist, table=None, do_random=False, count=1):
+    There is no `proxy` argument because httpx binds the proxy to the client, not
+    to the request — the caller opens one client per generated proxy string.
+    `price` is an `AsyncHypePrice`; without one every call fetches its own.
+    `limiter` and `retry` are the same `TokenBucket` and `RetryPolicy` the
+    threaded engine uses, waited on without blocking the event loop, and
+    `deadline` cuts each request's timeout the same way.
+    """
+    async def get(endpoint, url):
+        async def send():
+            if limiter is not None:
+                await limiter.acquire_async()
+            if deadline is None:
+                return raise_for_transient_status(endpoint, await client.get(url))
+            return raise_for_transient_status(endpoint, await client.get(url, timeout=deadline.timeout()))
+        return await (send() if retry is None else retry.call_async(endpoint, send, deadline=deadline))
+
+    async def fetch_hype_price():
+        hype_price_response = await get("price", HYPE_PRICE_URL)
+        return _usd_value(response_json(hype_price_response), "price")
+
+    async def fetch_debank_usd_value():
+        debank_response = await get("debank", DEBANK_URL + address)
+        return _usd_value(response_json(debank_response), "usd_value")
+
+    async def fetch_hypercore_usd_value():
+        hypercore_response = await get("hypercore", HYPERCORE_URL + address)
+        return _usd_value(response_json(hypercore_response), "grandTotal")
+
+    try:
+        if price is None:
+            hype_price = await fetch_hype_price()
+        else:
+            hype_price = await price.get(fetch_hype_price)
+        _require_positive_price(hype_price)
+
+        debank_usd_value, hypercore_usd_value = await asyncio.gather(
+            fetch_debank_usd_value(), fetch_hypercore_usd_value(), return_exceptions=True)
+        errors = [value for value in (debank_usd_value, hypercore_usd_value)
+                  if isinstance(value, BaseException)]
+        for error in errors:
+            # A cancellation is the round being given up, not a wallet failing,
+            # and an open breaker is the round being stopped; both must travel
+            # as themselves rather than become a `Comment`.
+            if not isinstance(error, Exception) or isinstance(error, CircuitOpen):
+                raise error
+        if len(errors) == 2:
+            raise _BothLookupsFailed(*errors)
+        if errors:
+            raise errors[0]
+
+        hypercore_hype_value = hypercore_usd_value / hype_price
+        hyperevm_hype_value = debank_usd_value / hype_price
+
+        return hypercore_hype_value, hyperevm_hype_value
+
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        raise wallet_failure(address, logger, e) from None
+
+
+def wallet_failure(address, logger, error):
+    """Log why `address` failed and return the exception to raise for it.
+
+    The caller raises it `from None` — see the comment in check_balance. Shared
+    with the asyncio engine so both word a failure identically.
+
+    When debank and hypercore BOTH failed, both are named, each through
+    describe_error: they ran side by side, so neither is "the" failure, and
+    reporting only one would hide half the diagnosis.
+    """
+    if isinstance(error, _BothLookupsFailed):
+        reason = "; ".join(describe_error(each) for each in error.errors)
+    else:
+        reason = describe_error(error)
+    logger.error(f"Error while checking token transactions for address {address}: {reason}")
+    return Exception(f"Error while checking token transactions for address {address}: {reason}")
+
+
+def find_none_values(grist, table=None, do_random=False, count=1, claimable=None, extra_columns=(),
+                     scheduler=None, pending=None):
     """Up to `count` wallets that have an address and are still missing a value.
 
     Shuffled twice on purpose, and both shuffles are the original behaviour: the
     first spreads the fetch order, the second decides WHICH of the pending
     wallets this round takes. Without the second one a document with more pending
     wallets than `count` would keep re-checking the same head of the list.
+
+    `claimable`, when given, is a predicate applied BEFORE the cut to `count` —
+    the lease check of src/leases.py — so wallets another replica holds do not
+    take up places in this round.
+
+    The rows come from `GRIST.fetch_pending`, which lets Grist do the filtering
+    below when it can; the filter stays here for the times it cannot. They carry
+    the wallet columns and `extra_columns`, which is what `claimable` reads.
+
+    With a `scheduler` (src/scheduler.py) the cut takes the wallets due earliest
+    instead of the head of the second shuffle; the shuffle then only orders the
+    wallets that are due together.
+
+    `pending`, when given, is the rows a prefetch already read (src/prefetch.py)
+    with the same `extra_columns`, and no read is made here.
     """
-    wallets = grist.fetch_table(table)
+    if pending is not None:
+        wallets = list(pending)
+    else:
+        wallets = grist.fetch_pending(table, extra_columns=extra_columns)
     if do_random:
         random.shuffle(wallets)
     wallets_non_empty_address = [wallet for wallet in wallets if (wallet.Address is not None and wallet.Address != "")]
     wallets_to_check = [wallet for wallet in wallets_non_empty_address if (wallet.hypercore_hype_value is None or wallet.hypercore_hype_value == "") or (wallet.hyperevm_hype_value is None or wallet.hyperevm_hype_value == "")]
+    # Before `claimable`: a wallet it leaves out this round is still pending.
+    pending_ids = {wallet.id for wallet in wallets_to_check}
+    if claimable is not None:
+        wallets_to_check = [wallet for wallet in wallets_to_check if claimable(wallet)]
     if do_random:
         random.shuffle(wallets_to_check)
+    if scheduler is not None:
+        return scheduler.pick(wallets_to_check, count, pending=pending_ids)
     return wallets_to_check[:count]
+
+
+def _filled(value):
+    return value is not None and value != ""
+
+
+def find_stale_values(grist, before, table=None, count=1, claimable=None, extra_columns=(), scheduler=None):
+    """Up to `count` checked wallets whose `Checked_at` stamp is older than `before`, oldest first.
+
+    The refresh mode's counterpart of `find_none_values`: rows with an address
+    and both values, stamped before `before` (a Unix timestamp) or never stamped
+    — a row filled before the mode was turned on is as old as a row can be. The
+    rows come from `GRIST.fetch_stale` and are filtered again here, for a Grist
+    that answers with the whole table.
+
+    `heapq.nsmallest` keeps a heap of `count` rows over the candidates instead of
+    sorting all of them: a document where most wallets went stale at once (the
+    mode just turned on) is refreshed `count` oldest wallets a round, not in one
+    round that takes them all.
+
+    With a `scheduler` — its own, not the pending wallets' one — a wallet whose
+    refreshes keep failing steps back like a failing pending wallet does: a
+    failure writes `Comment` and no stamp, so the row stays the oldest there is.
+    The stamp then only orders the wallets due together.
+    """
+    def stamp(wallet):
+        checked_at = getattr(wallet, CHECKED_AT_COLUMN, None)
+        return checked_at if _filled(checked_at) else 0
+
+    wallets = [wallet for wallet in grist.fetch_stale(before, table, extra_columns=extra_columns)
+               if _filled(wallet.Address) and _filled(wallet.hypercore_hype_value)
+               and _filled(wallet.hyperevm_hype_value) and stamp(wallet) < before]
+    stale_ids = {wallet.id for wallet in wallets}
+    if claimable is not None:
+        wallets = [wallet for wallet in wallets if claimable(wallet)]
+    if scheduler is not None:
+        return scheduler.pick(wallets, count, key=stamp, pending=stale_ids)
+    return heapq.nsmallest(count, wallets, key=stamp)
@@ -10,29 +10,50 @@
 
 """The single-process loop: read wallets from Grist, ask purrfolio, write back."""
 
+import asyncio
+import functools
+import heapq
 import logging
+import os
 import random
 import time
 import traceback
-from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 
 import colorama  # type: ignore
+import httpx  # type: ignore
 
+from src.balance_cache import open_balance_cache
 from src.balances import (
+    AsyncHypePrice,
+    HypePriceCache,
+    async_check_balance,
     check_balance,
     describe_error,
     find_none_values,
+    find_stale_values,
     generate_proxy,
     redact_credentials,
+    wallet_failure,
 )
-from src.grist import GRIST
+from src.deadline import DeadlineExceeded, RoundBudget, WalletDeferred
+from src.fast_json import enable_fast_json
+from src.grist import CHECKED_AT_COLUMN, DEFAULT_GRIST_POOL_SIZE, GRIST, BatchWriter, grist_session
 from src.heartbeat import write_heartbeat
-from src.http_timeout import install_default_timeout
+from src.http_pool import DEFAULT_POOL_MAXSIZE, SessionPool
+from src.leases import LEASE_COLUMNS, claim, is_claimable
+from src.prefetch import RoundPrefetch
+from src.rate_limit import TokenBucket
+from src.retry import CircuitOpen, RetryPolicy
+from src.scheduler import WalletScheduler
 from src.settings import settings
+from src.wallet_mirror import WalletMirror
+from src.write_behind import WriteBehind
 
 # Naming the logger is not a side effect — getLogger() only registers a name, and
 # `_write_heartbeat` below needs the object. Everything that CHANGES process-wide
-# state (the handler, colorama's stdout wrapper, the requests patch) happens in
+# state (the handler, colorama's stdout wrapper, the decoder switch) happens in
 # _configure_process(), called from run().
 logger = logging.getLogger("airdrop_checker")
 
@@ -56,23 +77,24 @@ HEARTBEAT_FILE = settings.heartbeat_file
 # from work, which is what it should have been all along.
 HEARTBEAT_SLEEP_CHUNK = 30  # seconds
 
+# The two values the optional `Engine` row of the Settings table accepts.
+ENGINE_THREADS = "threads"
+ENGINE_ASYNC = "async"
+ENGINES = (ENGINE_THREADS, ENGINE_ASYNC)
+
 
 def _configure_process():
     """Process-wide setup, done once when the loop starts — never at import.
 
-    All three of these reach outside this module: colorama replaces `sys.stdout`
-    with a wrapper, the handler makes this logger write to stderr, and the
-    timeout patch rewrites `requests.Session.request` for everything in the
-    process. Doing them at import time means merely IMPORTING `src.checker` —
-    which the test suite and `ci/smoke.py` both do, without any intention of
-    running the loop — silently reshapes stdout and the HTTP library for whoever
-    imported it. A program's side effects belong to running it.
+    All of these reach outside this module: colorama replaces `sys.stdout`
+    with a wrapper, the handler makes this logger write to stderr, and
+    FAST_JSON switches the decoder of every response. Doing them at import
+    time means merely IMPORTING `src.checker` — which the test suite and
+    `ci/smoke.py` both do, without any intention of running the loop —
+    silently reshapes stdout and the JSON decoding for whoever imported it. A
+    program's side effects belong to running it.
     """
-    # FIRST in this function, which run() calls before it builds the Grist client:
-    # grist_api issues its requests without a timeout, so a stalled Grist
-    # connection hangs this process forever. A patch installed after the first
-    # fetch protects every call except the one that is already hanging.
-    install_default_timeout()
+    fast_json = enable_fast_json(settings.fast_json)
 
     colorama.init(autoreset=True)
 
@@ -86,6 +108,9 @@ def _configure_process():
         handler.setFormatter(formatter)
         logger.addHandler(handler)
 
+    if settings.fast_json and not fast_json:
+        logger.warning("FAST_JSON is set but orjson is not installed, decoding with the stdlib json")
+
 
 def _write_heartbeat():
     write_heartbeat(HEARTBEAT_FILE, logger=logger)
@@ -106,13 +131,585 @@ def sleep_with_heartbeat(total_seconds):
         _write_heartbeat()
 
 
+def sleep_then_prefetch(total_seconds, prefetch, lead):
+    """`sleep_with_heartbeat`, starting `prefetch` `lead` seconds before the sleep ends.
+
+    Without a `lead` (no `Prefetch seconds`) it is the plain sleep. A sleep
+    shorter than the lead starts the prefetch at once.
+    """
+    if not lead:
+        sleep_with_heartbeat(total_seconds)
+        return
+    sleep_with_heartbeat(max(0.0, total_seconds - lead))
+    prefetch.start()
+    sleep_with_heartbeat(min(float(lead), total_seconds))
+
+
+def _cached(cache, wallet):
+    """The wallet's live entry in the balance cache, if there is a cache and one."""
+    if cache is None:
+        return None
+    cached = cache.get(wallet.Address)
+    if cached is not None:
+        logger.info(f"Check wallet {wallet.Address}: resolved earlier, taken from the balance cache")
+    return cached
+
+
+def _check_wallet(wallet, proxy, hype_price, session, cache=None, limiter=None, retry=None, budget=None):
+    cached = _cached(cache, wallet)
+    if cached is not None:
+        return cached
+    # A wallet starts here, so this is where a round out of time defers it.
+    deadline = None if budget is None else budget.start_wallet(wallet)
+    # The proxy is redacted even on the happy path: the string comes from Grist
+    # with `user:password@` in it, and this line runs once per wallet, so an
+    # unredacted one puts the password in `docker logs` on every single round.
+    logger.info(f"Check wallet {wallet.Address} with proxy {redact_credentials(proxy)}...")
+    values = check_balance(wallet.Address, logger, proxy, price=hype_price, session=session,
+                           limiter=limiter, retry=retry, deadline=deadline)
+    # Before the Grist write, which is the step the cache exists to survive.
+    if cache is not None:
+        cache.put(wallet.Address, *values)
+    return values
+
+
+def record_wallet(grist, wallet, check, stamp=False):
+    """Run `check()` for one wallet and write what came of it into the wallet's row.
+
+    `check` is the lookup itself in the serial loop and a finished future's
+    `result` in the pooled one, so both modes go through one success write and
+    one failure write — there is no second copy of either to drift.
+
+    With `stamp` (the refresh mode, `Refresh hours`) the success write also sets
+    `Checked_at`, which is what the next refresh of the wallet is timed from.
+
+    Returns False for a wallet the round deferred (`WalletDeferred`, see
+    src/deadline.py), which writes nothing, and True for every other outcome.
+    """
+    try:
+        hypercore_hype_value, hyperevm_hype_value = check()
+        values = {"hypercore_hype_value": hypercore_hype_value, "hyperevm_hype_value": hyperevm_hype_value}
+        if stamp:
+            values[CHECKED_AT_COLUMN] = datetime.now(timezone.utc)
+        grist.update(wallet.id, values)
+    except WalletDeferred:
+        return False
+    except CircuitOpen:
+        # purrfolio is down, not this wallet: nothing is written, and the round
+        # ends here instead of failing every wallet left in it.
+        raise
+    except Exception as e:
+        # Redacted on the way out in both directions: this text is logged AND
+        # written into the wallet's Grist row below, and a proxy failure carries
+        # the proxy URL — credentials included — in its message. A password in a
+        # Grist cell outlives the log: people open that document and it goes into
+        # backups.
+        #
+        # `describe_error` and not `redact_credentials` alone: the `Comment` cell
+        # is read long after the log is gone, and several of the exceptions that
+        # reach here stringify to nothing at all (`ConnectionError()`), which used
+        # to write a bare `Error: ` — indistinguishable, weeks later, from a
+        # redaction that ate the whole message.
+        reason = describe_error(e)
+        logger.error(f"Error occurred: {reason}")
+        # KNOWN RISK, deliberately left as it was found. The success path above
+        # writes `hypercore_hype_value` / `hyperevm_hype_value`; this failure path
+        # writes `Value` and `Comment` instead — two columns nothing else in this
+        # repository touches. If the Wallets table does not have them, Grist
+        # rejects the whole batch with 400 and this update raises INSIDE the except
+        # block, so the wallet's failure is replaced by a second, unrelated one and
+        # the round dies on the outer handler. Whether those columns exist is a
+        # property of a document this repository does not own, so changing the
+        # names is the owner's call, not a refactor's.
+        grist.update(wallet.id, {"Value": "--", "Comment": f"Error: {reason}"})
+    return True
+
+
+def _selectable(in_flight, claimable=None):
+    """`find_none_values`' predicate: not on its way to Grist, and `claimable` if given."""
+    if not in_flight:
+        return claimable
+    if claimable is None:
+        return lambda wallet: wallet.id not in in_flight
+    return lambda wallet: wallet.id not in in_flight and claimable(wallet)
+
+
+def check_wallets(grist, wallets, proxy, hype_price, session, workers=1, cache=None, limiter=None,
+                  retry=None, batch=None, stamp=False, budget=None):
+    """Check one round's wallets, `workers` at a time, writing each result as it lands.
+
+    With one worker this is the serial loop the service always ran. With more,
+    the lookups run on a thread pool while THIS thread does everything else: it
+    writes each result to Grist as its future completes (so the Grist client is
+    only ever used from one thread, and a result is never held back for the
+    slowest wallet of the round), and it marks the heartbeat whenever a wallet
+    finishes and at least every HEARTBEAT_SLEEP_CHUNK while none does.
+
+    A Grist write that raises ends the round exactly as it does in the serial
+    loop; the wallets that had not started yet are cancelled first, and the ones
+    already in flight are waited for, so no lookup outlives its round.
+
+    With `batch` (a `BatchWriter`, see src/grist.py) the rows are buffered
+    instead of written one call each, flushed whenever the batch says it is
+    due, and once more however the round ends. `stamp` is `record_wallet`'s.
+
+    With a `budget` (a `RoundBudget`, see src/deadline.py) a wallet that would
+    start after the round's deadline is deferred instead, and each one that does
+    start gets its own. The deferred wallets are returned.
+
+    With `stamp` the balance cache is not used: a stamp says when the values
+    were looked up, and a cached answer up to BALANCE_CACHE_TTL old stamped now
+    would be a refresh that refreshed nothing.
+    """
+    if stamp:
+        cache = None
+    # With a batch the rows go to it, and whatever it still holds is sent when
+    # the round ends — finished, stopped by a breaker, or failed.
+    writer = grist if batch is None else batch
+    deferred = []
+    # The ids whose result was written: on a breaker the rest were never checked.
+    written = set()
+    try:
+        if workers <= 1:
+            for wallet in wallets:
+                # A progress mark per wallet, and it is the load-bearing one for a
+                # busy round. How many wallets a round takes is `Walled count max` in
+                # the Grist Settings table — the operator's number, not the code's —
+                # and each wallet costs three purrfolio requests through a proxy plus
+                # a Grist write. Without this the whole round is one unmarked stretch,
+                # and a round longer than HEARTBEAT_MAX_AGE gets a perfectly healthy
+                # service restarted by auto-heal in the middle of its work, then again
+                # on the next round, forever. A long round is as normal a phase of
+                # this service as a long pause, and the probe has to answer "healthy"
+                # during both.
+                _write_heartbeat()
+                if record_wallet(writer, wallet, functools.partial(_check_wallet, wallet, proxy, hype_price, session, cache, limiter, retry, budget), stamp):
+                    written.add(wallet.id)
+                else:
+                    deferred.append(wallet)
+                if batch is not None:
+                    batch.flush_if_due()
+        else:
+            _write_heartbeat()
+            executor = ThreadPoolExecutor(max_workers=min(workers, len(wallets)),
+                                          thread_name_prefix="wallet")
+            try:
+                futures = {executor.submit(_check_wallet, wallet, proxy, hype_price, session, cache, limiter, retry, budget): wallet
+                           for wallet in wallets}
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=HEARTBEAT_SLEEP_CHUNK, return_when=FIRST_COMPLETED)
+                    _write_heartbeat()
+                    for future in done:
+                        if record_wallet(writer, futures[future], future.result, stamp):
+                            written.add(futures[future].id)
+                        else:
+                            deferred.append(futures[future])
+                        if batch is not None:
+                            batch.flush_if_due()
+                    # The age check, on the ticks when nothing finished.
+                    if batch is not None:
+                        batch.flush_if_due()
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+    except CircuitOpen as error:
+        # The one that raised it, those queued or in flight behind it, and
+        # any deferred before it: none of their results were written.
+        error.unchecked = [wallet for wallet in wallets if wallet.id not in written]
+        _flush_after_failure(batch)
+        raise
+    except BaseException:
+        _flush_after_failure(batch)
+        raise
+    if batch is not None:
+        batch.flush()
+    return deferred
+
+
+def _flush_after_failure(batch):
+    """The last flush of a round that is ending on an exception.
+
+    A flush error is logged, not raised: raised from here it would replace the
+    exception on its way out — a breaker's `CircuitOpen`, whose quiet pause
+    would become a failed round with a traceback.
+    """
+    if batch is None:
+        return
+    rows = len(batch)
+    try:
+        batch.flush()
+    except Exception as error:
+        logger.error(f"Write batch: {rows} rows left as the round ended, not all written: {describe_error(error)}")
+
+
+async def _check_wallet_async(client, wallet, proxy, price, cache=None, limiter=None, retry=None, budget=None):
+    cached = _cached(cache, wallet)
+    if cached is not None:
+        return cached
+    deadline = None if budget is None else budget.start_wallet(wallet)
+    # Redacted for the same reason as in _check_wallet.
+    logger.info(f"Check wallet {wallet.Address} with proxy {redact_credentials(proxy)}...")
+    lookup = async_check_balance(client, wallet.Address, logger, price=price, limiter=limiter, retry=retry,
+                                 deadline=deadline)
+    if deadline is None:
+        values = await lookup
+    else:
+        # Here the budget is a hard one: what is still running at the deadline
+        # is cancelled, not just denied its next request.
+        try:
+            values = await asyncio.wait_for(lookup, deadline.remaining())
+        except asyncio.TimeoutError:
+            raise wallet_failure(wallet.Address, logger, DeadlineExceeded(
+                f"still running after its {deadline.seconds:g}s budget")) from None
+    if cache is not None:
+        cache.put(wallet.Address, *values)
+    return values
+
+
+async def check_wallets_async(grist, wallets, proxy, hype_price, concurrency=1, cache=None, limiter=None,
+                              retry=None, batch=None, stamp=False, budget=None):
+    """The asyncio engine's round: `concurrency` wallets in flight on ONE thread.
+
+    The thread pool in `check_wallets` costs a thread per wallet in flight (two,
+    with the helper thread each lookup uses); this costs a coroutine. One
+    `httpx.AsyncClient` per round carries every request — httpx binds the proxy
+    to the client, so one client per generated proxy string is the same "one
+    pool per exit" rule `SessionPool` follows, and leaving the `async with`
+    closes the exit's connections when the round ends.
+
+    The rest is the pooled round's contract unchanged: results are written as
+    they land, through the same `record_wallet`; the heartbeat is marked on
+    every completion and at least every HEARTBEAT_SLEEP_CHUNK; a Grist write
+    that raises ends the round after cancelling what is still in flight. The
+    writes themselves go through `asyncio.to_thread`, so a slow Grist does not
+    stall the requests that are still open — they are still made one at a time.
+    A `batch` is flushed the same way as in `check_wallets`, on the same thread,
+    and a `budget` defers and bounds wallets the same way; a wallet starts when
+    it gets one of the `concurrency` places. `stamp` skips the balance cache
+    here too.
+    """
+    if stamp:
+        cache = None
+    writer = grist if batch is None else batch
+    deferred = []
+    written = set()
+    limit = asyncio.Semaphore(max(1, concurrency))
+    price = AsyncHypePrice(hype_price)
+    limits = httpx.Limits(max_connections=max(1, concurrency) * 2,
+                          max_keepalive_connections=max(1, concurrency) * 2)
+    _write_heartbeat()
+    async with httpx.AsyncClient(proxy=proxy or None, timeout=10, limits=limits) as client:
+        async def bounded(wallet):
+            async with limit:
+                return await _check_wallet_async(client, wallet, proxy, price, cache, limiter, retry, budget)
+
+        tasks = {asyncio.ensure_future(bounded(wallet)): wallet for wallet in wallets}
+        pending = set(tasks)
+        # Cleared only when every task was recorded; see `_flush_after_failure`.
+        failing = True
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=HEARTBEAT_SLEEP_CHUNK,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                _write_heartbeat()
+                for task in done:
+                    if await asyncio.to_thread(record_wallet, writer, tasks[task], task.result, stamp):
+                        written.add(tasks[task].id)
+                    else:
+                        deferred.append(tasks[task])
+                    if batch is not None:
+                        await asyncio.to_thread(batch.flush_if_due)
+                if batch is not None:
+                    await asyncio.to_thread(batch.flush_if_due)
+            failing = False
+        except CircuitOpen as error:
+            error.unchecked = [wallet for wallet in tasks.values() if wallet.id not in written]
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if failing:
+                await asyncio.to_thread(_flush_after_failure, batch)
+            elif batch is not None:
+                await asyncio.to_thread(batch.flush)
+    return deferred
+
+
+def check_wallets_in_event_loop(grist, wallets, proxy, hype_price, concurrency=1, cache=None, limiter=None,
+                                retry=None, batch=None, stamp=False, budget=None):
+    """The synchronous door into the asyncio engine: one event loop per round.
+
+    The loop in `run()` stays what it is — reading settings, sleeping with the
+    heartbeat — and only a round's checking runs inside `asyncio.run`, so
+    `main.py` and everything that drives `run()` work unchanged.
+    """
+    return asyncio.run(check_wallets_async(grist, wallets, proxy, hype_price, concurrency=concurrency,
+                                           cache=cache, limiter=limiter, retry=retry, batch=batch, stamp=stamp,
+                                           budget=budget))
+
+
+class _Shared:
+    """What the rounds of every document share: the purrfolio side of the process.
+
+    One for the life of the process, not one per round or per document: in its
+    `Price max age` mode the cached price outlives the round it was fetched in,
+    and the connections, the cache, the rate limit and the breakers are about
+    purrfolio and the proxy, which are the same whichever document a wallet is
+    in. The bucket is reconfigured from the Settings table of whichever
+    document's round is starting, so documents served together should agree on
+    `Rate limit`.
+    """
+
+    def __init__(self):
+        self.hype_price = HypePriceCache()
+        # Kept-alive purrfolio connections, one session per generated proxy string.
+        self.sessions = SessionPool()
+        # Answers already paid for, kept across restarts in the data/ volume; None
+        # when BALANCE_CACHE_TTL is 0 or the file cannot be opened.
+        self.balance_cache = open_balance_cache(settings.balance_cache_file, settings.balance_cache_ttl,
+                                                logger=logger)
+        # One bucket for every purrfolio request of the process, reconfigured from
+        # the Settings table each round; unlimited until `Rate limit` is set.
+        self.limiter = TokenBucket()
+        # Retries of transient purrfolio failures and one circuit breaker per
+        # endpoint (src/retry.py); the breakers' state has to outlive the round.
+        self.retry = RetryPolicy()
+
+
+def _document_file(path, doc_id, several):
+    """`path` as configured for a lone document; with several, one per document, its id before the extension."""
+    if not path or not several:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{doc_id}{extension}"
+
+
+class _Document:
+    """One Grist document: its client, and what its rounds keep from one to the next."""
+
+    def __init__(self, doc_id, session=None, several=False):
+        self.doc_id = doc_id
+        # The pending wallets are re-read only when the document changed (see
+        # src/wallet_mirror.py); WALLET_MIRROR_FILE keeps them across restarts too.
+        mirror_file = _document_file(settings.wallet_mirror_file, doc_id, several)
+        self.grist = GRIST(settings.grist_server, doc_id, settings.grist_api_key,
+                           NODES_TABLE, SETTINGS_TABLE, logger,
+                           mirror=WalletMirror(mirror_file or None, logger=logger), session=session,
+                           wallet_columns=settings.wallet_columns)
+        # WRITE_BEHIND: the rounds' results go to a spool and a writer thread rather
+        # than straight to Grist (src/write_behind.py), and whatever an earlier
+        # process left in the spool is written first.
+        self.write_behind = None
+        if settings.write_behind:
+            spool_file = _document_file(settings.write_spool_file, doc_id, several)
+            self.write_behind = WriteBehind(self.grist, spool_file, logger=logger).start()
+        self.writes = self.grist if self.write_behind is None else self.write_behind
+        # Which pending wallets a round takes: the longest-waiting first, and a
+        # wallet whose rounds keep failing it further back each time.
+        self.scheduler = WalletScheduler()
+        # The same for the refresh mode's stale wallets, kept apart: each
+        # scheduler forgets the ids missing from the list it picks from.
+        self.refresh_scheduler = WalletScheduler()
+        # `Prefetch seconds`: the next round's reads, started before the pause ends
+        # (src/prefetch.py). Zero until a round reads the setting.
+        self.prefetch = RoundPrefetch(self.grist, logger=logger, write_behind=self.write_behind)
+        self.prefetch_lead = 0
+        # Whether the pause before the next round may prefetch it: not after a
+        # failed round, whose pause is no time to be reading Grist again early.
+        self.prefetch_next = False
+
+    def release(self, wallets, refreshing):
+        """Hand `wallets`, taken this round but not checked, back to whichever scheduler picked them."""
+        self.scheduler.release([wallet for wallet in wallets if wallet.id not in refreshing])
+        self.refresh_scheduler.release([wallet for wallet in wallets if wallet.id in refreshing])
+
+    def pause(self, seconds):
+        """Sleep `seconds` before this document's next round, prefetching it when that is on."""
+        if seconds > 0:
+            sleep_then_prefetch(seconds, self.prefetch, self.prefetch_lead if self.prefetch_next else 0)
+
+
+def _round(document, shared):
+    """One round of `document`. Returns the pause before its next one and whether that may prefetch."""
+    _write_heartbeat()                     # liveness mark each iteration
+    try:
+        prefetched = document.prefetch.take()
+        # The whole Settings table in one request; every lookup below is a
+        # dict access into it (see SettingsSnapshot).
+        round_settings = document.grist.settings_snapshot() if prefetched is None else prefetched.settings
+        proxy_string = round_settings.find_settings("Proxy")
+        random.seed(datetime.now().timestamp())
+        # `Walled count` is a typo in the Grist document's own Setting column.
+        # It is spelled that way HERE because it is spelled that way THERE —
+        # the document belongs to someone else, and find_settings raises on a
+        # name it cannot find, so "fixing" this string stops the service.
+        wallet_count_max = int(round_settings.find_settings("Walled count max"))
+        wallet_count_min = int(round_settings.find_settings("Walled count min"))
+        wait_time_max = int(round_settings.find_settings("Wait time max"))
+        wait_time_min = int(round_settings.find_settings("Wait time min"))
+        # Optional, in seconds: absent means one price per round. Read every
+        # round like the rest, so the operator can change it without a restart.
+        price_max_age = round_settings.find_optional_setting("Price max age")
+        shared.hype_price.max_age = int(price_max_age) if price_max_age is not None else None
+        shared.hype_price.start_round()
+        # Optional: how many wallets are checked at once. Absent or 1 is the
+        # serial loop this service always ran. The session pool is sized to
+        # match, so parallel lookups reuse connections instead of queueing
+        # for one; it takes effect with the next session the pool opens.
+        workers = int(round_settings.find_optional_setting("Concurrency", 1))
+        shared.sessions.pool_maxsize = max(DEFAULT_POOL_MAXSIZE, workers)
+        # Optional: which engine checks the round. `threads` (the default) is
+        # the requests-based one above; `async` keeps `Concurrency` requests
+        # in flight on one event loop instead of one thread per wallet.
+        engine = round_settings.find_optional_setting("Engine", ENGINE_THREADS)
+        if engine not in ENGINES:
+            raise ValueError("Setting Engine must be one of {}, not {!r}".format(", ".join(ENGINES), engine))
+        # Optional: purrfolio requests per second and how many may go out
+        # back to back (src/rate_limit.py). Absent, nothing is throttled and
+        # the rounds are paced by `Wait time min/max` alone.
+        rate_limit = round_settings.find_optional_setting("Rate limit")
+        shared.limiter.configure(float(rate_limit) if rate_limit is not None else None,
+                                 int(round_settings.find_optional_setting("Rate burst", 1)))
+        # Optional: how many wallets' rows go to Grist in one call, and how
+        # long a row may wait for the rest of its batch. Absent or 1, every
+        # row is its own call as it always was (see BatchWriter).
+        batch_rows = int(round_settings.find_optional_setting("Write batch size", 1))
+        batch_seconds = float(round_settings.find_optional_setting("Write batch seconds", HEARTBEAT_SLEEP_CHUNK))
+        logger.info(f"wallet_count_max: {wallet_count_max}, wallet_count_min: {wallet_count_min}, wait_time_max: {wait_time_max}, wait_time_min: {wait_time_min}")
+        wallets_count = random.randint(wallet_count_min, wallet_count_max)
+        # Optional: leasing, for several replicas against one document (see
+        # src/leases.py). Absent, a round takes its wallets as it always did.
+        lease_minutes = round_settings.find_optional_setting("Lease minutes")
+        # Optional: the refresh mode. Every successful check stamps the row's
+        # `Checked at`, and the places a round has left after the pending
+        # wallets go to the checked ones stamped longest ago, once the stamp
+        # is older than this many hours. Needs a `Checked at` column.
+        refresh_hours = round_settings.find_optional_setting("Refresh hours")
+        # Optional: how many seconds before the pause ends the next round's
+        # reads start. Absent, each round reads when it starts.
+        document.prefetch_lead = float(round_settings.find_optional_setting("Prefetch seconds", 0))
+        # Optional: the round's time budget and each wallet's (src/deadline.py).
+        # Absent, a round takes as long as its wallets do.
+        round_seconds = round_settings.find_optional_setting("Round seconds")
+        wallet_seconds = round_settings.find_optional_setting("Wallet seconds")
+        extra_columns = () if lease_minutes is None else LEASE_COLUMNS
+        # Wallets whose results are still queued look unchecked in Grist.
+        in_flight = document.write_behind.pending_ids() if document.write_behind is not None else set()
+        # The prefetched rows, if they were read with the columns this round needs.
+        # Those that were queued when they were read may have landed since, and
+        # left `in_flight` while still reading as pending: they are left out too.
+        pending = None
+        if prefetched is not None and prefetched.extra_columns == extra_columns:
+            pending = prefetched.pending
+            in_flight = set(in_flight) | prefetched.in_flight
+        now = time.time()
+        if lease_minutes is None:
+            claimable = _selectable(in_flight)
+        else:
+            claimable = _selectable(in_flight, functools.partial(is_claimable, owner=settings.worker_id, now=now))
+        wallets = find_none_values(document.grist, do_random=True, count=wallets_count, claimable=claimable,
+                                   extra_columns=extra_columns, scheduler=document.scheduler, pending=pending)
+        refreshing = set()
+        if refresh_hours is not None and len(wallets) < wallets_count:
+            stale = find_stale_values(document.grist, now - float(refresh_hours) * 3600,
+                                      count=wallets_count - len(wallets), claimable=claimable,
+                                      extra_columns=extra_columns, scheduler=document.refresh_scheduler)
+            refreshing = {wallet.id for wallet in stale}
+            wallets = wallets + stale
+        if lease_minutes is not None:
+            wallets = claim(document.grist, wallets, settings.worker_id, float(lease_minutes) * 60, now=now,
+                            logger=logger)
+        # After the claim: a wallet another replica won was not this round's.
+        wallets = wallets or []
+        document.scheduler.attempted([wallet for wallet in wallets if wallet.id not in refreshing])
+        document.refresh_scheduler.attempted([wallet for wallet in wallets if wallet.id in refreshing])
+        # Every line above this one that reaches Grist is network: the
+        # Settings snapshot, the Wallets fetch inside find_none_values, and
+        # the lease writes when leasing is on. On a slow Grist the mark at the top of the
+        # iteration is already old by the time execution reaches here, so the
+        # round is re-marked before the per-wallet work begins.
+        _write_heartbeat()
+        try:
+            proxy = generate_proxy(proxy_string)
+            # A new token is a new exit: the previous round's connections
+            # go out through the old one and are closed here, not reused.
+            session = shared.sessions.rotate(proxy)
+            if not wallets:
+                logger.info("No wallets to check, sleep 10s")
+                return 10, True
+            batch = BatchWriter(document.writes, batch_rows, batch_seconds) if batch_rows > 1 else None
+            # Timed from here, when the round's checking starts.
+            budget = RoundBudget(float(round_seconds) if round_seconds is not None else None,
+                                 float(wallet_seconds) if wallet_seconds is not None else None)
+            if engine == ENGINE_ASYNC:
+                deferred = check_wallets_in_event_loop(document.writes, wallets, proxy, shared.hype_price,
+                                                       concurrency=workers, cache=shared.balance_cache,
+                                                       limiter=shared.limiter, retry=shared.retry,
+                                                       batch=batch, stamp=refresh_hours is not None, budget=budget)
+            else:
+                deferred = check_wallets(document.writes, wallets, proxy, shared.hype_price, session,
+                                         workers=workers, cache=shared.balance_cache,
+                                         limiter=shared.limiter, retry=shared.retry,
+                                         batch=batch, stamp=refresh_hours is not None, budget=budget)
+            if deferred:
+                logger.info(f"Round out of its {round_seconds}s: {len(deferred)} wallets deferred to the next one")
+                document.release(deferred, refreshing)
+        except CircuitOpen as e:
+            # Not an error to dump a traceback for: an endpoint failed past
+            # its retries often enough in a row that sending more is waste.
+            # The next round starts when the breaker lets requests through.
+            logger.warning(f"Round stopped: {e}")
+            # The wallets it stopped before their result was written were
+            # not tried, and keep no failure for it.
+            document.release(e.unchecked, refreshing)
+            return e.retry_after, False
+        except Exception as e:
+            # The traceback goes through the redaction too, not just the
+            # message, and it stays that way now that `check_balance` re-raises
+            # with `from None`. That suppression cleans the ONE chain this
+            # module builds itself; format_exc() here renders whatever exception
+            # actually arrived, and the loop's own Grist calls go out through
+            # `requests`, which honours HTTP_PROXY/HTTPS_PROXY and puts the
+            # whole proxy URL into the text of a ProxyError. So a chain reaching
+            # this handler can still carry credentials that nothing upstream of
+            # it ever touched.
+            logger.error(f"Error occurred: {describe_error(e)}")
+            logger.error(f"Fail: {describe_error(e)}\n{redact_credentials(traceback.format_exc())}")
+            return 10, False
+
+        # With a rate limit the bucket paces the requests, and a pause here
+        # would only leave it full and the proxy idle: the next round starts
+        # at once. `Wait time min/max` still has to be in the document — it
+        # is read above like always — so removing `Rate limit` brings the
+        # old pacing straight back.
+        if shared.limiter.rate is not None:
+            logger.info(f"Rate limit {shared.limiter.rate}/s, burst {shared.limiter.burst}: next round without a pause")
+            return 0, False
+        time_to_sleep = random.uniform(wait_time_min*60, wait_time_max*60)
+        logger.info(f"Sleep {time_to_sleep/60} minutes")
+        return time_to_sleep, True
+    except Exception as e:
+        # The outermost net, and the one that catches the settings fetches: those
+        # go out through `requests`, so a broken HTTP(S)_PROXY in the stack's
+        # environment arrives here as a ProxyError quoting the whole proxy URL.
+        logger.error(f"Error occurred, sleep 10s: {describe_error(e)}")
+        return 10, False
+
+
 def run():
-    """The main loop. Fetch the round's settings from Grist, check some wallets, sleep."""
+    """The main loop. Fetch the round's settings from Grist, check some wallets, sleep.
 
-    _configure_process()
+    GRIST_DOC_ID may name several documents, served by the one process: one
+    Grist connection pool and the purrfolio side (`_Shared`) for all of them,
+    and per document its own client, Settings table, scheduler, mirror, spool
+    and prefetch. Each keeps its own pace — a round, then the pause its own
+    Settings ask for — and the loop runs whichever is due next, from a heap of
+    due times. Never two rounds at once: the documents share the proxy and the
+    rate limit, and one round at a time keeps both as they are with one document.
+    """
 
-    grist = GRIST(settings.grist_server, settings.grist_doc_id, settings.grist_api_key,
-                  NODES_TABLE, SETTINGS_TABLE, logger)
+    _configure_process()
 
     # The first mark, written BEFORE the first Grist call. It says "the process
     # started and its configuration parsed", which is precisely what the deploy
@@ -122,105 +719,27 @@ def run():
     # window if Grist is having a bad day.
     _write_heartbeat()
 
+    shared = _Shared()
+    doc_ids = settings.grist_doc_ids
+    several = len(doc_ids) > 1
+    # Every document is on the same Grist server: one kept-alive pool for all of
+    # them rather than one per document, sized so that each can have its reads
+    # and its writer's connection open at once.
+    grist_pool = grist_session(max(DEFAULT_GRIST_POOL_SIZE, 2 * len(doc_ids)))
+    documents = [_Document(doc_id, session=grist_pool, several=several) for doc_id in doc_ids]
+
+    if not several:
+        document = documents[0]
+        while True:
+            pause, document.prefetch_next = _round(document, shared)
+            document.pause(pause)
+
+    logger.info(f"Serving {len(documents)} Grist documents: {', '.join(doc_ids)}")
+    # (due, position, document): the position settles a tie in the configured order.
+    due = [(time.monotonic(), position, document) for position, document in enumerate(documents)]
     while True:
-        _write_heartbeat()                     # liveness mark each iteration
-        try:
-            proxy_string = grist.find_settings("Proxy")
-            random.seed(datetime.now().timestamp())
-            # `Walled count` is a typo in the Grist document's own Setting column.
-            # It is spelled that way HERE because it is spelled that way THERE —
-            # the document belongs to someone else, and find_settings raises on a
-            # name it cannot find, so "fixing" this string stops the service.
-            wallet_count_max = int(grist.find_settings("Walled count max"))
-            wallet_count_min = int(grist.find_settings("Walled count min"))
-            wait_time_max = int(grist.find_settings("Wait time max"))
-            wait_time_min = int(grist.find_settings("Wait time min"))
-            logger.info(f"wallet_count_max: {wallet_count_max}, wallet_count_min: {wallet_count_min}, wait_time_max: {wait_time_max}, wait_time_min: {wait_time_min}")
-            wallets_count = random.randint(wallet_count_min, wallet_count_max)
-            wallets = find_none_values(grist, do_random=True, count=wallets_count)
-            # Every line above this one is network: five find_settings calls, each
-            # fetching the Settings table over HTTP, and then the Wallets fetch
-            # inside find_none_values. On a slow Grist the mark at the top of the
-            # iteration is already old by the time execution reaches here, so the
-            # round is re-marked before the per-wallet work begins.
-            _write_heartbeat()
-            try:
-                proxy = generate_proxy(proxy_string)
-                if wallets is None or len(wallets) == 0:
-                    logger.info("No wallets to check, sleep 10s")
-                    sleep_with_heartbeat(10)
-                    continue
-                for wallet in wallets:
-                    # A progress mark per wallet, and it is the load-bearing one
-                    # for a busy round. How many wallets a round takes is
-                    # `Walled count max` in the Grist Settings table — the
-                    # operator's number, not the code's — and each wallet costs
-                    # three purrfolio requests through a proxy plus a Grist write.
-                    # Without this the whole round is one unmarked stretch, and a
-                    # round longer than HEARTBEAT_MAX_AGE gets a perfectly healthy
-                    # service restarted by auto-heal in the middle of its work,
-                    # then again on the next round, forever. A long round is as
-                    # normal a phase of this service as a long pause, and the
-                    # probe has to answer "healthy" during both.
-                    _write_heartbeat()
-                    try:
-                        # The proxy is redacted even on the happy path: the string
-                        # comes from Grist with `user:password@` in it, and this
-                        # line runs once per wallet, so an unredacted one puts the
-                        # password in `docker logs` on every single round.
-                        logger.info(f"Check wallet {wallet.Address} with proxy {redact_credentials(proxy)}...")
-                        hypercore_hype_value, hyperevm_hype_value = check_balance(wallet.Address, logger, proxy)
-                        grist.update(wallet.id, {"hypercore_hype_value": hypercore_hype_value, "hyperevm_hype_value": hyperevm_hype_value})
-                    except Exception as e:
-                        # Redacted on the way out in both directions: this text is
-                        # logged AND written into the wallet's Grist row below, and
-                        # a proxy failure carries the proxy URL — credentials
-                        # included — in its message. A password in a Grist cell
-                        # outlives the log: people open that document and it goes
-                        # into backups.
-                        #
-                        # `describe_error` and not `redact_credentials` alone: the
-                        # `Comment` cell is read long after the log is gone, and
-                        # several of the exceptions that reach here stringify to
-                        # nothing at all (`ConnectionError()`), which used to write
-                        # a bare `Error: ` — indistinguishable, weeks later, from a
-                        # redaction that ate the whole message.
-                        reason = describe_error(e)
-                        logger.error(f"Error occurred: {reason}")
-                        # KNOWN RISK, deliberately left as it was found. The
-                        # success path above writes `hypercore_hype_value` /
-                        # `hyperevm_hype_value`; this failure path writes `Value`
-                        # and `Comment` instead — two columns nothing else in this
-                        # repository touches. If the Wallets table does not have
-                        # them, Grist rejects the whole batch with 400 and this
-                        # update raises INSIDE the except block, so the wallet's
-                        # failure is replaced by a second, unrelated one and the
-                        # round dies on the outer handler. Whether those columns
-                        # exist is a property of a document this repository does
-                        # not own, so changing the names is the owner's call, not
-                        # a refactor's.
-                        grist.update(wallet.id, {"Value": "--", "Comment": f"Error: {reason}"})
-            except Exception as e:
-                # The traceback goes through the redaction too, not just the
-                # message, and it stays that way now that `check_balance` re-raises
-                # with `from None`. That suppression cleans the ONE chain this
-                # module builds itself; format_exc() here renders whatever exception
-                # actually arrived, and the loop's own Grist calls go out through
-                # `requests`, which honours HTTP_PROXY/HTTPS_PROXY and puts the
-                # whole proxy URL into the text of a ProxyError. So a chain reaching
-                # this handler can still carry credentials that nothing upstream of
-                # it ever touched.
-                logger.error(f"Error occurred: {describe_error(e)}")
-                logger.error(f"Fail: {describe_error(e)}\n{redact_credentials(traceback.format_exc())}")
-                sleep_with_heartbeat(10)
-                continue
-
-            time_to_sleep = random.uniform(wait_time_min*60, wait_time_max*60)
-            logger.info(f"Sleep {time_to_sleep/60} minutes")
-            sleep_with_heartbeat(time_to_sleep)
-        except Exception as e:
-            # The outermost net, and the one that catches the settings fetches: those
-            # go out through `requests`, so a broken HTTP(S)_PROXY in the stack's
-            # environment arrives here as a ProxyError quoting the whole proxy URL.
-            logger.error(f"Error occurred, sleep 10s: {describe_error(e)}")
-            sleep_with_heartbeat(10)
+        when, position, document = heapq.heappop(due)
+        document.pause(when - time.monotonic())
+        logger.info(f"Round of document {document.doc_id}")
+        pause, document.prefetch_next = _round(document, shared)
+        heapq.heappush(due, (time.monotonic() + pause, position, document))
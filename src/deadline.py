@@ -0,0 +1,73 @@
+"""Time budgets for a round and for each wallet in it.
+
+A round's length is `Walled count max` wallets times whatever purrfolio and the
+proxy take per wallet, and when they slow down nothing bounds it: every request
+has its own `timeout=10`, but a wallet is three requests, each retried, and a
+round is as many wallets as the draw said. A slow afternoon stretches the round,
+the pause after it comes later, and so does everything timed from rounds — the
+proxy's usage, the cadence of the heartbeat's "a round finished".
+
+Two optional rows of the Settings table bound it:
+
+  * `Round seconds`: a wallet the round has not started by then is DEFERRED —
+    not checked, nothing written, and handed back to the scheduler as if it had
+    not been picked, so it goes first next round. The wallets already running
+    finish (or run out of their own budget, below);
+  * `Wallet seconds`: one wallet's total, all of its requests and retries
+    included. Each request's timeout is cut to what is left of it, a request
+    that would start with nothing left is not sent, and the wallet fails with
+    `DeadlineExceeded` — written to its `Comment` like any other failure.
+
+A `requests` timeout bounds each wait on the socket rather than the whole
+answer, so a response trickling in can still outlast `Wallet seconds` by up to
+one such wait; the asyncio engine cancels the wallet outright at its deadline.
+"""
+
+import time
+
+# The per-request timeout of a purrfolio call, the ceiling a wallet's
+# remaining budget is cut from.
+REQUEST_TIMEOUT = 10
+
+
+class DeadlineExceeded(Exception):
+    """A wallet ran out of `Wallet seconds` before its lookups finished."""
+
+
+class WalletDeferred(Exception):
+    """A wallet the round reached only after `Round seconds`: not checked, nothing written."""
+
+
+class Deadline:
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - self.clock())
+
+    def expired(self):
+        return self.clock() >= self.expires
+
+    def timeout(self, ceiling=REQUEST_TIMEOUT):
+        """The timeout for a request sent now: `ceiling`, or less if that is all that is left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"no time left of its {self.seconds:g}s budget")
+        return min(float(ceiling), remaining)
+
+
+class RoundBudget:
+    """A round's `Round seconds` and `Wallet seconds`, either of which may be absent."""
+
+    def __init__(self, round_seconds=None, wallet_seconds=None, clock=time.monotonic):
+        self.clock = clock
+        self.round = Deadline(round_seconds, clock) if round_seconds else None
+        self.wallet_seconds = wallet_seconds
+
+    def start_wallet(self, wallet):
+        """The `Deadline` of a wallet starting now, or None; raises WalletDeferred past the round's."""
+        if self.round is not None and self.round.expired():
+            raise WalletDeferred(f"{wallet.Address}: the round's {self.round.seconds:g}s are up")
+        return Deadline(self.wallet_seconds, self.clock) if self.wallet_seconds else None
@@ -0,0 +1,47 @@
+"""Opt-in fast JSON decoding for the purrfolio and Grist responses.
+
+`response.json()` — requests' and httpx's alike — decodes the body's bytes to a
+`str` first and then hands the text to the stdlib `json` module. For the price and
+debank answers that is noise, but a `hypercore-holdings` answer lists every
+position of a wallet, and a Grist `fetch_table` answer carries every cell of the
+Wallets table on every round. orjson parses straight from the bytes, skips the
+intermediate string, and is several times faster on both (see
+benchmarks/bench_fast_json.py).
+
+Off by default and switched on with FAST_JSON=true (src/settings.py): the answer
+is the same dict either way, but a decoder swap is the kind of change worth being
+able to turn off without a redeploy of different code. With the switch on and
+orjson missing — a local venv built from an older requirements file — the stdlib
+path is used and `enable_fast_json` says so.
+
+There is no partial parse to be had: neither decoder can skip the keys nobody
+reads. What the callers keep is already one key per purrfolio answer
+(`_usd_value` in src/balances.py), so the saving here is the decode itself.
+"""
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - pinned in requirements.txt
+    orjson = None
+
+# Set once by `enable_fast_json`, from run(); read on every response.
+_fast = False
+
+
+def enable_fast_json(enabled=True):
+    """Switch the decoder for the whole process; True when orjson is now in use."""
+    global _fast
+    _fast = bool(enabled) and orjson is not None
+    return _fast
+
+
+def response_json(response):
+    """`response.json()`, through orjson when it is enabled.
+
+    Works on requests and httpx responses alike: both expose the raw body as
+    `content`. With the fast path off this IS `response.json()`, so the default
+    behaviour of the service does not depend on this module at all.
+    """
+    if _fast:
+        return orjson.loads(response.content)
+    return response.json()
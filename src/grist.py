@@ -14,20 +14,170 @@ that this document does not have. Carrying them here would have implied a schema
 that is not there.
 """
 
+import json
+import logging
+import time
+from collections import namedtuple
 from datetime import datetime, timedelta, timezone
 
+import requests  # type: ignore
 from grist_api import GristDocAPI  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+
+from src.fast_json import response_json
+
+# The columns a round reads from a wallet's row. Operators keep their own columns
+# in the Wallets table, notes and long `Comment` texts among them, and none of
+# that has to cross the wire for a round to pick its wallets.
+WALLET_COLUMNS = ("id", "Address", "hypercore_hype_value", "hyperevm_hype_value")
+
+# The pending-wallet test of `GRIST.fetch_pending`: an address and at least one of
+# the two values still empty — the same test `find_none_values` applies, written
+# as SQL so Grist answers with those rows only.
+PENDING_CONDITION = (
+    '"Address" IS NOT NULL AND "Address" != \'\''
+    ' AND ("hypercore_hype_value" IS NULL OR "hypercore_hype_value" = \'\''
+    ' OR "hyperevm_hype_value" IS NULL OR "hyperevm_hype_value" = \'\')'
+)
+
+# Seconds, connect and read, for every Grist call (see DocAPI).
+DEFAULT_GRIST_TIMEOUT = 30
+
+# Connections kept alive to the Grist server. The loop and the write-behind
+# thread are the two callers that can be in a call at the same moment; the rest
+# is headroom, and a caller past it still gets a connection, just not a kept one.
+DEFAULT_GRIST_POOL_SIZE = 4
+
+
+def grist_session(pool_maxsize=DEFAULT_GRIST_POOL_SIZE):
+    """A `requests.Session` for Grist traffic, keeping `pool_maxsize` connections alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# The column the refresh mode stamps on every successful check (`Refresh hours`
+# in the Settings table), as Grist's identifier for a `Checked at` label.
+CHECKED_AT_COLUMN = "Checked_at"
+
+# The refresh mode's test: an address, both values filled, and a stamp older
+# than the `?` argument or none at all — rows filled before the mode was turned
+# on count as the oldest there are.
+STALE_CONDITION = (
+    '"Address" IS NOT NULL AND "Address" != \'\''
+    ' AND "hypercore_hype_value" IS NOT NULL AND "hypercore_hype_value" != \'\''
+    ' AND "hyperevm_hype_value" IS NOT NULL AND "hyperevm_hype_value" != \'\''
+    ' AND ("{0}" IS NULL OR "{0}" = \'\' OR "{0}" < ?)'.format(CHECKED_AT_COLUMN)
+)
+
+# grist_api's own logger, so the messages of the `call` below land where the
+# library's always did.
+grist_api_log = logging.getLogger("grist_api")
+
+
+# The answers of an optional endpoint (`sql`, `states`) that mean it is not
+# there for this server or key: missing, forbidden, not allowed, not built.
+# Anything else — a 429, a 502 from the reverse proxy, a 503 while Grist
+# restarts — is a bad moment, and turning the endpoint off for the life of the
+# process over it would leave every later round on the slow path.
+UNSUPPORTED_STATUSES = (403, 404, 405, 501)
+
+
+def endpoint_unsupported(error):
+    """Whether the `requests.HTTPError` of an optional endpoint means it is unavailable for good."""
+    response = error.response
+    if response is None:
+        return False
+    if response.status_code in UNSUPPORTED_STATUSES:
+        return True
+    return response.status_code == 400 and "not supported" in response.text.lower()
+
+
+class DocAPI(GristDocAPI):
+    """`GristDocAPI` over a kept-alive session, decoding with src/fast_json.py.
+
+    `call` is grist_api 0.1.0's own, line for line — the SQLITE_BUSY retry and the
+    `{"error": ...}` message included — except for the request and its last line.
+    The library sends every call through module-level `requests.request`, which
+    builds a throwaway session: a new TCP connection and TLS handshake for every
+    settings read, table read and write. Here the calls go through `session`, one
+    pooled `requests.Session` for the client's lifetime, with `timeout` on each of
+    them — the library sets none, and a stalled Grist connection would otherwise
+    hang the loop forever. The body of a successful answer goes through
+    `response_json` instead of `resp.json()`: it is the only place a library
+    response can be reached before it is decoded, and `fetch_table`, the largest
+    answer this service receives, goes through it.
+    """
+
+    def __init__(self, doc_id, api_key=None, server='https://api.getgrist.com', dryrun=False,
+                 session=None, timeout=DEFAULT_GRIST_TIMEOUT):
+        super().__init__(doc_id, api_key=api_key, server=server, dryrun=dryrun)
+        self._session = session if session is not None else grist_session()
+        self._timeout = timeout
+
+    def call(self, url, json_data=None, method=None, prefix=None):
+        if prefix is None:
+            prefix = '/api/docs/%s/' % self._doc_id
+        data = json.dumps(json_data, sort_keys=True).encode('utf8') if json_data is not None else None
+        method = method or ('POST' if data else 'GET')
+
+        while True:
+            full_url = self._server + prefix + url
+            if self._dryrun and method != 'GET':
+                grist_api_log.info("DRYRUN NOT sending %s request to %s", method, full_url)
+                return None
+            grist_api_log.debug("sending %s request to %s", method, full_url)
+            resp = self._session.request(method, full_url, data=data, timeout=self._timeout, headers={
+                'Authorization': 'Bearer %s' % self._api_key,
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+            })
+            if not resp.ok:
+                err_msg = None
+                try:
+                    error_obj = resp.json()
+                    if error_obj and isinstance(error_obj.get("error"), str):
+                        err_msg = error_obj.get("error")
+                        if 'SQLITE_BUSY' in err_msg:
+                            grist_api_log.warning("Retrying after error: %s", err_msg)
+                            time.sleep(2)
+                            continue
+                except Exception:   # pylint: disable=broad-except
+                    pass
+
+                if err_msg:
+                    raise requests.HTTPError(err_msg, response=resp)
+                raise resp.raise_for_status()
+            return response_json(resp)
 
 
 class GRIST:
-    def __init__(self, server, doc_id, api_key, nodes_table, settings_table, logger):
+    def __init__(self, server, doc_id, api_key, nodes_table, settings_table, logger, mirror=None,
+                 session=None, timeout=DEFAULT_GRIST_TIMEOUT, wallet_columns=WALLET_COLUMNS):
         self.server = server
         self.doc_id = doc_id
         self.api_key = api_key
         self.nodes_table = nodes_table.replace(" ", "_")
         self.settings_table = settings_table.replace(" ", "_")
         self.logger = logger
-        self.grist = GristDocAPI(doc_id, server=server, api_key=api_key)
+        # Every call of this client goes over one kept-alive session, its own
+        # unless one is handed in; `close` ends only the one it opened.
+        self._owns_session = session is None
+        self.session = grist_session() if session is None else session
+        self.grist = DocAPI(doc_id, server=server, api_key=api_key, session=self.session, timeout=timeout)
+        # Cleared the first time Grist refuses the SQL endpoint (see fetch_pending).
+        self.sql_enabled = True
+        # What a wallet read asks for: WALLET_COLUMNS, and whatever a caller adds
+        # to them (WALLET_EXTRA_COLUMNS in src/settings.py).
+        self.wallet_columns = tuple(dict.fromkeys(WALLET_COLUMNS + tuple(wallet_columns)))
+        # The pending rows as last read, for fetch_pending (src/wallet_mirror.py).
+        self.mirror = mirror
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
 
     def to_timestamp(self, dtime: datetime) -> int:
         # Naive datetimes are read as Moscow time (UTC+3), which is what the
@@ -42,17 +192,169 @@ class GRIST:
         if isinstance(value, datetime):
             value = self.to_timestamp(value)
         column_name = column_name.replace(" ", "_")
-        self.grist.update_records(table or self.nodes_table, [{"id": row_id, column_name: value}])
+        self._write(table, [{"id": row_id, column_name: value}])
 
     def update(self, row_id, updates, table=None):
         for column_name, value in updates.items():
             if isinstance(value, datetime):
                 updates[column_name] = self.to_timestamp(value)
         updates = {column_name.replace(" ", "_"): value for column_name, value in updates.items()}
-        self.grist.update_records(table or self.nodes_table, [{"id": row_id, **updates}])
+        self._write(table, [{"id": row_id, **updates}])
+
+    def update_many(self, records, table=None):
+        """`update` for several rows: each record is a dict with its row's "id".
+
+        Records with different sets of columns are allowed; grist_api sends one
+        call per set (`group_if_needed`), so Grist never sees a column that only
+        some of the rows in a call were meant to change.
+        """
+        rows = []
+        for record in records:
+            row = {}
+            for column_name, value in record.items():
+                if isinstance(value, datetime):
+                    value = self.to_timestamp(value)
+                row[column_name.replace(" ", "_")] = value
+            rows.append(row)
+        if rows:
+            self._write(table, rows, group_if_needed=True)
+
+    def _write(self, table, rows, group_if_needed=False):
+        table = table or self.nodes_table
+        self.grist.update_records(table, rows, group_if_needed=group_if_needed)
+        if self.mirror is not None:
+            # One action per call, and grist_api makes one call per column set.
+            self.mirror.applied(table, rows, actions=len({frozenset(row) for row in rows}) if group_if_needed else 1)
+
+    def add_many(self, records, table=None, chunk_size=None):
+        """New rows from `records` (dicts without an "id"), `chunk_size` per call; their ids."""
+        rows = [{column_name.replace(" ", "_"): self.to_timestamp(value) if isinstance(value, datetime) else value
+                 for column_name, value in record.items()} for record in records]
+        if not rows:
+            return []
+        ids = self.grist.add_records(table or self.nodes_table, rows, chunk_size=chunk_size)
+        if self.mirror is not None:
+            # New rows are pending rows the mirror has never seen: it has to be
+            # read again, which `forget` makes sure of.
+            self.mirror.forget()
+        return ids
+
+    def fetch_table(self, table=None, filters=None):
+        """Every row of `table`, or only those whose columns equal `filters`' values."""
+        return self.grist.fetch_table(table or self.nodes_table, filters=filters)
+
+    def sql(self, query, args=None):
+        """The rows of a read-only SQL `query`, shaped like `fetch_table`'s."""
+        answer = self.grist.call("sql", json_data={"sql": query, "args": list(args or [])})
+        records = [record["fields"] for record in answer["records"]]
+        if not records:
+            return []
+        Record = namedtuple("Record", records[0].keys())  # pylint: disable=invalid-name
+        return [Record(**fields) for fields in records]
+
+    def fetch_columns(self, columns, table=None, filters=None, ids=None):
+        """`fetch_table` with only `columns` in each row, through the SQL endpoint.
+
+        Same rows and the same `filters` (column equals value); a Grist without
+        the endpoint gets the `fetch_table` call, all columns included. `ids`
+        narrows the answer to those row ids (`"id"` has to be among `columns`),
+        which Grist applies when it can and this method applies again for the
+        whole-table answer.
+        """
+        table = (table or self.nodes_table).replace(" ", "_")
+        filters = {column.replace(" ", "_"): value for column, value in (filters or {}).items()}
+        conditions = ['"{}" = ?'.format(column) for column in filters]
+        args = list(filters.values())
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return []
+            conditions.append('"id" IN ({})'.format(", ".join("?" * len(ids))))
+            args += ids
+        rows = self._select(table, columns, " AND ".join(conditions), args, filters=filters)
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row in rows if row.id in wanted]
+        return rows
+
+    def fetch_pending(self, table=None, extra_columns=()):
+        """The rows of `table` that may still need a check, filtered by Grist.
+
+        The Wallets table is mostly checked rows, and `fetch_table` carried all
+        of them over the wire every round for `find_none_values` to throw away.
+        This asks the SQL endpoint for the pending ones only, and for the
+        `wallet_columns` of each (plus `extra_columns`, which is how the lease
+        columns come along when leasing is on). A Grist that refuses it — an
+        older release, or a key without full read access — answers with an HTTP
+        error that says so (`endpoint_unsupported`); that is logged once, and
+        from then on this returns the whole table, exactly what the round read
+        before. Any other HTTP error fails the round, which retries. The caller
+        keeps its own filter either way, so both answers select the same wallets.
+
+        With a `mirror`, the rows are read only when the document changed since
+        the last read in ways our own writes do not account for.
+        """
+        table = (table or self.nodes_table).replace(" ", "_")
+        columns = tuple(self.wallet_columns) + tuple(extra_columns)
+        if self.mirror is None:
+            return self._select(table, columns, PENDING_CONDITION)
+        # Read BEFORE the rows: a change that lands in between makes the copy
+        # newer than its number, which costs a re-read next time and nothing else.
+        try:
+            state = self.doc_state()
+        except requests.HTTPError as e:
+            if not endpoint_unsupported(e):
+                raise
+            self.logger.warning(f"Grist states endpoint unavailable, the wallet mirror is off: {e}")
+            self.mirror = None
+            return self._select(table, columns, PENDING_CONDITION)
+        if self.mirror.is_fresh(state, (table, columns)):
+            self.logger.info(f"Wallet mirror: document unchanged at action {state}, {len(self.mirror)} rows reused")
+            rows = self.mirror.rows()
+        else:
+            rows = self._select(table, columns, PENDING_CONDITION)
+            self.mirror.replace(state, (table, columns), rows)
+        self.mirror.save()
+        return rows
 
-    def fetch_table(self, table=None):
-        return self.grist.fetch_table(table or self.nodes_table)
+    def fetch_stale(self, before, table=None, extra_columns=()):
+        """The checked rows of `table` whose `Checked_at` stamp is older than `before`.
+
+        `before` is a Unix timestamp, the form `to_timestamp` writes. Like
+        `fetch_pending`, a Grist without the SQL endpoint answers with the whole
+        table and the caller's own filter (`find_stale_values`) does the rest.
+        Never served from the mirror, which holds pending rows only.
+        """
+        table = (table or self.nodes_table).replace(" ", "_")
+        columns = tuple(self.wallet_columns) + (CHECKED_AT_COLUMN,) + tuple(extra_columns)
+        return self._select(table, columns, STALE_CONDITION, [before])
+
+    def doc_state(self):
+        """The document's newest action number: it moves with every change to it."""
+        return self.grist.call("states", method="GET")["states"][0]["n"]
+
+    def _select(self, table, columns, where, args=(), filters=None):
+        if self.sql_enabled:
+            query = 'SELECT {} FROM "{}"'.format(
+                ", ".join('"{}"'.format(column.replace(" ", "_")) for column in dict.fromkeys(columns)), table)
+            if where:
+                query += " WHERE " + where
+            try:
+                return self.sql(query, args)
+            except requests.HTTPError as e:
+                if not endpoint_unsupported(e):
+                    raise
+                self.sql_enabled = False
+                self.logger.warning(f"Grist SQL endpoint unavailable, reading the whole {table} table instead: {e}")
+        return self.fetch_table(table, filters=filters)
+
+    def settings_snapshot(self, table=None):
+        """The whole `Settings` table in one fetch, for a round's lookups (see `SettingsSnapshot`)."""
+        if table is None:
+            table = self.settings_table
+        else:
+            table = table.replace(" ", "_")
+        return SettingsSnapshot(self.grist.fetch_table(table), table)
 
     def find_settings(self, setting, table=None):
         """One row of the `Settings` table, looked up by its `Setting` column.
@@ -62,17 +364,121 @@ class GRIST:
         into the proxy string, so a `None` here would come back as an unreadable
         `TypeError` several frames away — or, worse, as a round that quietly ran
         with no proxy at all.
+
+        A fetch per call; a caller that needs several settings takes a
+        `settings_snapshot` and asks it instead.
         """
-        if table is None:
-            table = self.settings_table
-        else:
-            table = table.replace(" ", "_")
-        data = self.grist.fetch_table(table)
+        return self.settings_snapshot(table).find_settings(setting)
+
+    def find_optional_setting(self, setting, default=None, table=None):
+        """Like `find_settings`, but a row that is absent or empty gives `default`.
+
+        For the knobs added after the document already existed. The operator's
+        Settings table does not have those rows until somebody types them in, and
+        `find_settings` raising on them would stop a service that was running
+        fine the day before the upgrade. Only the two "not there" answers turn
+        into the default — a Grist that cannot be reached still raises.
+        """
+        return self.settings_snapshot(table).find_optional_setting(setting, default)
+
+
+class SettingsSnapshot:
+    """The `Settings` table as it was at one fetch, indexed by its `Setting` column.
+
+    `run()` reads a dozen settings each round; asking `GRIST.find_settings` for
+    each of them downloaded the same table a dozen times. A round now takes one
+    snapshot and every lookup is a dict access, with the answers `GRIST` gives:
+    missing or empty raises in `find_settings` and is the default in
+    `find_optional_setting`. As with the old scans, the first row of a name wins.
+    """
+
+    def __init__(self, rows, table):
+        self.table = table
+        self._values = {}
+        for row in rows:
+            self._values.setdefault(row.Setting, row.Value)
+
+    def find_settings(self, setting):
         if setting is None:
             raise ValueError("Setting name is not provided")
-        if setting not in [row.Setting for row in data]:
-            raise ValueError("Setting {} not found in table {}".format(setting, self.settings_table))
-        value = [row for row in data if row.Setting == setting][0].Value
+        if setting not in self._values:
+            raise ValueError("Setting {} not found in table {}".format(setting, self.table))
+        value = self._values[setting]
         if value == "" or value is None:
             raise ValueError("Setting {} is empty".format(setting))
         return value
+
+    def find_optional_setting(self, setting, default=None):
+        value = self._values.get(setting)
+        if value == "" or value is None:
+            return default
+        return value
+
+
+def results_first(groups, columns):
+    """`groups` of rows in the order to send them: results before failures.
+
+    `columns(group)` is the column set of a group's rows. A failure row is the
+    one that carries `Comment`; see BatchWriter for why those go last.
+    """
+    return sorted(groups, key=lambda group: "Comment" in columns(group))
+
+
+class BatchWriter:
+    """Collects a round's per-wallet `update`s and sends them a batch at a time.
+
+    Stands in for `GRIST` wherever the round writes a wallet's result: `update`
+    only buffers, and `flush` sends the buffer. The round calls `flush_if_due`
+    after every wallet (and on every heartbeat tick), which flushes once
+    `max_rows` rows are waiting or the oldest has waited `max_age` seconds, and
+    `flush` once more when it ends, whether it finished or not.
+
+    One `update_many` per set of columns, successes first — NOT one call with
+    `group_if_needed`. grist_api sends its groups in sorted column order, which
+    puts the failure rows (`Comment`, `Value`) ahead of the results; a document
+    without those two columns would reject that call and the results behind it
+    would never be sent. Here every group is sent, and the first error is
+    raised once all of them were tried.
+    """
+
+    def __init__(self, grist, max_rows, max_age=None, clock=time.monotonic):
+        self.grist = grist
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.clock = clock
+        self._records = []
+        self._since = None
+
+    def update(self, row_id, updates, table=None):
+        if table is not None:
+            raise ValueError("BatchWriter writes to the nodes table only")
+        if self._since is None:
+            self._since = self.clock()
+        self._records.append({"id": row_id, **updates})
+
+    def __len__(self):
+        return len(self._records)
+
+    def flush_if_due(self):
+        if not self._records:
+            return
+        if len(self._records) >= self.max_rows or \
+                (self.max_age is not None and self.clock() - self._since >= self.max_age):
+            self.flush()
+
+    def flush(self):
+        records, self._records, self._since = self._records, [], None
+        groups = {}
+        for record in records:
+            groups.setdefault(frozenset(record), []).append(record)
+        # Results before failures, whatever order the wallets finished in.
+        ordered = results_first(groups.values(), columns=lambda group: group[0])
+        first_error = None
+        for group in ordered:
+            try:
+                self.grist.update_many(group)
+            except Exception as error:
+                if first_error is None:
+                    first_error = error
+        if first_error is not None:
+            raise first_error
@@ -0,0 +1,80 @@
+"""Kept-alive `requests.Session`s for the purrfolio calls, one per proxy exit.
+
+`requests.get` builds a throwaway session for every call, so each of the three
+purrfolio requests a wallet costs used to open its own TCP connection, its own
+TLS handshake and — through the residential proxy — its own SOCKS or CONNECT
+negotiation. On that proxy the handshakes are most of the latency of a call.
+
+A session is bound to ONE generated proxy string, and that is the key of this
+pool, because the string is the exit: `generate_proxy` fills `{random_token}`
+with a new sticky-session token, and two tokens are two different exit IPs. Reusing
+a connection across tokens would quietly send the next wallet out through the
+previous exit, which is exactly what rotation exists to avoid.
+
+Lifecycle is explicit rather than left to the garbage collector: `rotate()` closes
+every session that does not belong to the new token (the loop calls it when it
+generates the round's proxy), the pool never holds more than `max_sessions`
+sessions (the least recently used one is closed first), and `close()` ends them
+all. The pool holds the proxy string — credentials included — only as a dict key
+and never logs it.
+"""
+
+import threading
+from collections import OrderedDict
+
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+
+# How many proxy exits may hold open sessions at once. One is in use per round
+# today; the headroom is for the round that is closing while the next one opens.
+DEFAULT_MAX_SESSIONS = 4
+
+# Connections kept alive per host inside one session. purrfolio.com is the only
+# host, so this is the number of requests that can reuse a connection in
+# parallel; requests' own default of 10 is kept as the floor.
+DEFAULT_POOL_MAXSIZE = 10
+
+
+class SessionPool:
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        self.max_sessions = max_sessions
+        self.pool_maxsize = pool_maxsize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get(self, proxy):
+        """The session for `proxy` (None is a direct connection), opened on first use."""
+        with self._lock:
+            session = self._sessions.get(proxy)
+            if session is not None:
+                self._sessions.move_to_end(proxy)
+                return session
+            session = self._new_session()
+            self._sessions[proxy] = session
+            while len(self._sessions) > self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                oldest.close()
+            return session
+
+    def rotate(self, proxy):
+        """Close every session except the one for `proxy`, and return that one."""
+        with self._lock:
+            for key in [key for key in self._sessions if key != proxy]:
+                self._sessions.pop(key).close()
+        return self.get(proxy)
+
+    def close(self):
+        with self._lock:
+            while self._sessions:
+                _, session = self._sessions.popitem()
+                session.close()
+
+    def __len__(self):
+        return len(self._sessions)
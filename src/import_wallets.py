@@ -0,0 +1,93 @@
+"""Add wallet addresses to the Wallets table in bulk, skipping the ones it has.
+
+    python -m src.import_wallets addresses.txt
+    some-export | python -m src.import_wallets -
+
+One address per line; blank lines and lines starting with `#` are skipped, and
+so is anything after the first whitespace or comma, so a CSV whose first column
+is the address imports as it is. Typing 50k rows into Grist, or adding them one
+call each, is not something an operator can do; this streams the input and adds
+the new rows `--chunk` at a time through `add_records`.
+
+An address is new when neither the table nor an earlier line of the input has
+it. The table's addresses are read once, `Address` column only, into a set, and
+compared case-insensitively — EVM addresses are hex, and a checksummed one and
+its lower-case form are the same wallet. A new row has only its `Address`; its
+two values are empty, which is what makes the loop check it.
+
+Configured like the loop, from the same GRIST_* environment variables. When
+GRIST_DOC_ID names several documents the import goes to the first, or to the
+one `--doc` names.
+"""
+
+import argparse
+import logging
+import sys
+
+from src.grist import GRIST
+
+DEFAULT_CHUNK = 5000
+
+
+def read_addresses(lines):
+    """The address of every line that has one, in input order."""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        address = line.replace(",", " ").split()[0]
+        if address:
+            yield address
+
+
+def import_wallets(grist, lines, chunk=DEFAULT_CHUNK, logger=None):
+    """Add every address of `lines` that the Wallets table does not have; (added, skipped)."""
+    known = {str(row.Address).lower() for row in grist.fetch_columns(["Address"]) if row.Address}
+    added = skipped = 0
+    pending = []
+    for address in read_addresses(lines):
+        key = address.lower()
+        if key in known:
+            skipped += 1
+            continue
+        known.add(key)
+        pending.append({"Address": address})
+        if len(pending) >= chunk:
+            added += len(grist.add_many(pending, chunk_size=chunk))
+            pending = []
+            if logger is not None:
+                logger.info(f"Import: {added} wallets added so far")
+    if pending:
+        added += len(grist.add_many(pending, chunk_size=chunk))
+    return added, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="file of addresses, or - for stdin")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="rows per add_records call")
+    parser.add_argument("--doc", help="Grist document id to import into (default: the first of GRIST_DOC_ID)")
+    args = parser.parse_args(argv)
+
+    # Imported here, not at the top: `--help` must work without a configured
+    # environment, and the settings object exits the process when it is not.
+    from src.checker import NODES_TABLE, SETTINGS_TABLE  # pylint: disable=import-outside-toplevel
+    from src.settings import settings  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger = logging.getLogger("airdrop_checker.import")
+    grist = GRIST(settings.grist_server, args.doc or settings.grist_doc_ids[0], settings.grist_api_key,
+                  NODES_TABLE, SETTINGS_TABLE, logger)
+    try:
+        if args.source == "-":
+            added, skipped = import_wallets(grist, sys.stdin, args.chunk, logger=logger)
+        else:
+            with open(args.source, encoding="utf-8") as lines:
+                added, skipped = import_wallets(grist, lines, args.chunk, logger=logger)
+    finally:
+        grist.close()
+    logger.info(f"Import: {added} wallets added, {skipped} already in the table")
+
+
+if __name__ == "__main__":
+    main()
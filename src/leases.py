@@ -0,0 +1,62 @@
+"""Wallet leases: several replicas against one Grist document without double work.
+
+Without them every container picks its round from the same pending rows, so two
+replicas check — and pay the proxy for — the same wallets. A lease is two columns
+on the Wallets table, written before a wallet is checked:
+
+  * `Lease_owner`   — the `WORKER_ID` of the replica that claimed the row;
+  * `Lease_expires` — a unix timestamp after which anyone may claim it again.
+
+Expiry is what reclaims the rows of a replica that died mid-round: nothing has to
+release them, they simply stop counting once the time has passed. A successful
+check does not clear its lease either; the values it writes take the wallet out
+of the pending set, which is what makes the lease irrelevant.
+
+Grist has no compare-and-swap, so a claim is WRITE-THEN-READ-BACK: the batch is
+written with our name on it, then the rows carrying our name are read again, and
+only the rows that still say so are kept. Two replicas claiming the same row at
+the same moment leave one name in the cell and the loser drops it. The remaining
+window — both writes landing before either read — costs one wallet checked twice,
+never a wrong value: that is the ceiling of what a spreadsheet can arbitrate, and
+it is the right trade for a service whose worst case used to be every wallet
+checked by every replica.
+
+Opt-in per document: leasing runs only while the `Lease minutes` row of the
+Settings table is set, because the two columns above exist only in a document
+whose owner added them.
+"""
+
+import time
+
+LEASE_OWNER_COLUMN = "Lease_owner"
+LEASE_EXPIRES_COLUMN = "Lease_expires"
+# What a wallet read has to carry for `is_claimable` to see the lease.
+LEASE_COLUMNS = (LEASE_OWNER_COLUMN, LEASE_EXPIRES_COLUMN)
+
+
+def is_claimable(wallet, owner, now):
+    """True when `wallet` carries no live lease of another replica."""
+    lease_owner = getattr(wallet, LEASE_OWNER_COLUMN, None)
+    if not lease_owner or lease_owner == owner:
+        return True
+    expires = getattr(wallet, LEASE_EXPIRES_COLUMN, None)
+    return not expires or float(expires) <= now
+
+
+def claim(grist, wallets, owner, lease_seconds, now=None, logger=None):
+    """Lease `wallets` to `owner` and return the ones the read-back confirms."""
+    if not wallets:
+        return []
+    now = time.time() if now is None else now
+    expires = int(now + lease_seconds)
+    grist.update_many([{"id": wallet.id, LEASE_OWNER_COLUMN: owner, LEASE_EXPIRES_COLUMN: expires}
+                       for wallet in wallets])
+    # Only the rows just written: leases are never cleared, so every row this
+    # replica ever leased still carries its name, and reading all of them back
+    # would grow each round's claim with everything it has checked so far.
+    ours = {row.id for row in grist.fetch_columns(["id"], filters={LEASE_OWNER_COLUMN: owner},
+                                                  ids=[wallet.id for wallet in wallets])}
+    claimed = [wallet for wallet in wallets if wallet.id in ours]
+    if logger is not None and len(claimed) < len(wallets):
+        logger.info(f"Lease: {len(wallets) - len(claimed)} of {len(wallets)} wallets were claimed by another worker")
+    return claimed
@@ -0,0 +1,77 @@
+"""The next round's Grist reads, made while the loop is still sleeping.
+
+A round starts with two reads that everything else waits for: the Settings
+snapshot and the pending wallets. On a remote Grist — and on a large document,
+where the wallet read is the slow one — that is the first seconds of every
+round spent with no lookup in flight, after a pause that did nothing at all.
+
+With `Prefetch seconds` set in the Settings table, the loop starts both reads
+on a background thread that many seconds before its pause ends, and the round
+that follows begins from their answers. Not earlier than that, and never while
+the previous round is still checking: a wallet read as pending before its row
+was written would be checked again. With WRITE_BEHIND the round's results can
+still be on their way to Grist during the pause, so the read also records which
+rows the queue held when it started (`in_flight`): a row that lands between the
+read and the round has left the queue by then, yet reads as pending, and the
+round leaves out both sets. The answers are at most `Prefetch seconds` old when the round uses them,
+which is the price of the mode — a Settings change made in that window waits for
+the next round. What the round decides from them stays in the round: the lease
+test is made with the round's own clock and `claim` reads its leases back, and
+the write-behind queue and the scheduler are asked at the round's start.
+
+A read that fails in the background is logged and the round reads again inline,
+so a failure surfaces exactly where it did without the mode.
+"""
+
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from src.balances import describe_error
+from src.leases import LEASE_COLUMNS
+
+# The answers of one prefetch: the Settings snapshot, the columns the wallet
+# rows were read with (the lease columns when leasing was on), the rows, and the
+# ids the write-behind queue held when the read started.
+Prefetched = namedtuple("Prefetched", "settings extra_columns pending in_flight")
+
+
+def read_round(grist, write_behind=None):
+    """The Grist reads a round starts with, in the order the round makes them."""
+    # Before the reads: a row written after this is in the rows read as well.
+    in_flight = frozenset(write_behind.pending_ids()) if write_behind is not None else frozenset()
+    snapshot = grist.settings_snapshot()
+    extra_columns = LEASE_COLUMNS if snapshot.find_optional_setting("Lease minutes") is not None else ()
+    return Prefetched(snapshot, extra_columns, grist.fetch_pending(extra_columns=extra_columns), in_flight)
+
+
+class RoundPrefetch:
+    def __init__(self, grist, logger=None, write_behind=None):
+        self.grist = grist
+        self.logger = logger
+        self.write_behind = write_behind
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._future = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start reading the next round, unless a read is already under way."""
+        with self._lock:
+            if self._future is None:
+                self._future = self._executor.submit(read_round, self.grist, self.write_behind)
+
+    def take(self):
+        """The `Prefetched` answers, waiting for them if need be; None when nothing was started or it failed."""
+        with self._lock:
+            future, self._future = self._future, None
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning(f"Prefetch of the next round failed, reading it now: {describe_error(e)}")
+            return None
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+"""A token bucket shared by every purrfolio request of the process.
+
+Without it the only throttle is the shape of the loop: a round sends its wallets'
+requests as fast as the proxy answers, then the loop sleeps for `Wait time
+min/max` minutes. That is a burst against purrfolio's limit followed by an idle
+proxy, and the sustained rate is whatever the two happen to average to.
+
+With `Rate limit` (requests per second) set in the Grist Settings table, every
+request — price, debank and hypercore, from either engine — first takes a token
+from ONE bucket that refills at that rate and holds at most `Rate burst` tokens.
+The service then runs at a steady rate just under the upstream limit, and the
+pause between rounds is dropped (see run() in src/checker.py): the bucket is the
+throttle, and the pause would only idle it.
+
+A request that finds the bucket empty RESERVES the next token before it waits
+rather than polling for it: the balance goes negative and the wait is exactly
+the time until that token exists. Waiters are served in the order they arrived,
+and no wake-up is spent finding the bucket still empty.
+
+Absent, the bucket is unlimited and costs one attribute read per request.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate=None, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._rate = None
+        self._burst = 1
+        self._tokens = 0.0
+        self._updated = clock()
+        self.configure(rate, burst)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    def configure(self, rate, burst=1):
+        """Set the refill rate (None: unlimited) and the capacity, keeping the balance.
+
+        Called at the start of every round with the values of the Settings table,
+        so it must not hand out a fresh burst each time: the balance is carried
+        over and only clipped to the new capacity.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("Setting Rate limit must be above 0, not {!r}".format(rate))
+        if burst < 1:
+            raise ValueError("Setting Rate burst must be at least 1, not {!r}".format(burst))
+        with self._lock:
+            if self._rate is None and rate is not None:
+                # Turning the limit on starts from a full bucket, like a new process.
+                self._tokens = float(burst)
+                self._updated = self.clock()
+            else:
+                self._refill()
+                self._tokens = min(self._tokens, float(burst))
+            self._rate = rate
+            self._burst = burst
+
+    def _refill(self):
+        now = self.clock()
+        if self._rate is not None:
+            self._tokens = min(float(self._burst), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _reserve(self):
+        """Take one token and return how long to wait before it is really there."""
+        with self._lock:
+            if self._rate is None:
+                return 0.0
+            self._refill()
+            self._tokens -= 1.0
+            return max(0.0, -self._tokens / self._rate)
+
+    def acquire(self):
+        """Block the calling thread until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+    async def acquire_async(self):
+        """`acquire` for a coroutine: the event loop keeps running while it waits."""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,238 @@
+"""Retries for transient purrfolio failures, and a circuit breaker per endpoint.
+
+One dropped connection used to cost a wallet its round: `check_balance` failed,
+`Value` became "--" with the error in `Comment`, and the wallet stayed out of the
+pending set until somebody cleared the cell — for a failure a second try a couple
+of seconds later would not have seen.
+
+`RetryPolicy.call` runs ONE request (not the whole wallet: the price and the
+lookup that did succeed are not paid for twice) and retries it while what it
+raises is transient:
+
+  * a connection, proxy or timeout error, from requests or from httpx;
+  * an answer with status 429 or 5xx — raised as `UpstreamStatusError` by the
+    request itself, since purrfolio's error pages are not the JSON the callers
+    expect and would otherwise fail as a misleading KeyError.
+
+Waits are exponential with full jitter (a uniform draw below base * 2**retry,
+capped), so the wallets of a pooled round that failed together do not come back
+together. Anything else — a KeyError, an unreadable amount — is the wallet's own
+answer and is raised at once.
+
+Each endpoint has a breaker. `threshold` requests in a row that still failed
+transiently after their retries open it, and for `cooldown` seconds every request
+to that endpoint raises `CircuitOpen` without being sent. `CircuitOpen` is not a
+wallet failure: it is never written to Grist, it ends the round, and run() waits
+out the cooldown before the next one. After the cooldown ONE request is let
+through as a trial, and every other keeps getting `CircuitOpen` until it is
+decided — success closes the breaker, one more failure opens it again. A trial
+that ends without either (the wallet's own bad answer, its deadline) hands the
+trial to the next request.
+
+With a wallet's `Deadline` (src/deadline.py) a wait that would not end before
+it does is not slept: the request gives up with `DeadlineExceeded` at once,
+rather than sleeping past `Wallet seconds` only to fail the same way after.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+import httpx  # type: ignore
+import requests  # type: ignore
+
+from src.deadline import DeadlineExceeded
+
+# The statuses that mean "ask again later" rather than "this is the answer".
+TRANSIENT_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,   # ProxyError and SSLError included
+    requests.exceptions.Timeout,
+    httpx.TransportError,                  # timeouts, network and proxy errors
+)
+
+DEFAULT_ATTEMPTS = 3          # the first try and two retries
+DEFAULT_BASE_DELAY = 1.0      # seconds; the ceiling of the first wait
+DEFAULT_MAX_DELAY = 8.0       # seconds; the ceiling of any wait
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 60.0  # seconds
+# What the other requests are told to wait while a trial is out: about one
+# request's timeout, the longest a trial should take.
+HALF_OPEN_RETRY_AFTER = 10.0  # seconds
+
+
+class UpstreamStatusError(Exception):
+    """purrfolio answered with a transient HTTP status instead of its JSON."""
+
+    def __init__(self, endpoint, status):
+        super().__init__(f"{endpoint} answered HTTP {status}")
+        self.endpoint = endpoint
+        self.status = status
+
+
+class CircuitOpen(Exception):
+    """An endpoint's breaker is open: nothing is sent to it until `retry_after` has passed."""
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"purrfolio {endpoint} keeps failing, requests to it are paused "
+                         f"for {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        # Filled in by the check loop it ends: the round's wallets whose
+        # result was never written.
+        self.unchecked = []
+
+
+def is_transient(error):
+    if isinstance(error, UpstreamStatusError):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def raise_for_transient_status(endpoint, response):
+    """Turn a 429/5xx answer into `UpstreamStatusError`; any other answer passes."""
+    if response.status_code in TRANSIENT_STATUSES:
+        raise UpstreamStatusError(endpoint, response.status_code)
+    return response
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 cooldown=DEFAULT_BREAKER_COOLDOWN, clock=time.monotonic):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def check(self, trial=False):
+        """Raise `CircuitOpen` while the breaker is open; True for the caller that is the trial.
+
+        `trial` is what the same request's previous check returned, so that the
+        trial's own retries are let through too.
+        """
+        with self._lock:
+            if self._trial:
+                if trial:
+                    return True
+                raise CircuitOpen(self.endpoint, HALF_OPEN_RETRY_AFTER)
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.cooldown - self.clock()
+            if remaining > 0:
+                raise CircuitOpen(self.endpoint, remaining)
+            # Half-open: this request is the trial, one failure from reopening.
+            self._opened_at = None
+            self._failures = self.threshold - 1
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures >= self.threshold and self._opened_at is None:
+                self._opened_at = self.clock()
+
+    def release(self):
+        """The trial ended without a verdict: the next request is the trial instead."""
+        with self._lock:
+            if self._trial:
+                self._trial = False
+                self._opened_at = self.clock() - self.cooldown
+
+
+class RetryPolicy:
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+                 breaker_cooldown=DEFAULT_BREAKER_COOLDOWN, clock=time.monotonic,
+                 sleep=time.sleep, jitter=random.uniform):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter = jitter
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(
+                    endpoint, self.breaker_threshold, self.breaker_cooldown, self.clock)
+            return self._breakers[endpoint]
+
+    def delay(self, retry):
+        """The wait before retry number `retry` (0 is the first retry)."""
+        return self.jitter(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def _wait(self, endpoint, attempt, error, deadline):
+        """The wait before the next attempt; raises DeadlineExceeded when `deadline` ends first."""
+        wait = self.delay(attempt)
+        if deadline is not None and wait >= deadline.remaining():
+            raise DeadlineExceeded(f"{endpoint} failed ({type(error).__name__}) and the wait before "
+                                   f"its retry outlasts the {deadline.seconds:g}s budget") from error
+        return wait
+
+    def call(self, endpoint, request, deadline=None):
+        """`request()`, retried while it fails transiently, behind `endpoint`'s breaker."""
+        breaker = self.breaker(endpoint)
+        trial = False
+        try:
+            for attempt in range(self.attempts):
+                trial = breaker.check(trial)
+                try:
+                    result = request()
+                except Exception as error:
+                    if not is_transient(error):
+                        raise
+                    if attempt + 1 == self.attempts:
+                        breaker.record_failure()
+                        trial = False
+                        raise
+                    self.sleep(self._wait(endpoint, attempt, error, deadline))
+                else:
+                    breaker.record_success()
+                    trial = False
+                    return result
+        finally:
+            if trial:
+                breaker.release()
+
+    async def call_async(self, endpoint, request, deadline=None):
+        """`call` for a coroutine function; the waits do not block the event loop."""
+        breaker = self.breaker(endpoint)
+        trial = False
+        try:
+            for attempt in range(self.attempts):
+                trial = breaker.check(trial)
+                try:
+                    result = await request()
+                except Exception as error:
+                    if not is_transient(error):
+                        raise
+                    if attempt + 1 == self.attempts:
+                        breaker.record_failure()
+                        trial = False
+                        raise
+                    await asyncio.sleep(self._wait(endpoint, attempt, error, deadline))
+                else:
+                    breaker.record_success()
+                    trial = False
+                    return result
+        finally:
+            if trial:
+                breaker.release()
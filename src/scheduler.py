@@ -0,0 +1,109 @@
+"""Which pending wallets a round takes: the longest-waiting first, failures later.
+
+`find_none_values` used to shuffle the pending wallets and take a random slice.
+On a document with more pending wallets than a round takes, that bounds nothing:
+a wallet can lose the draw round after round, while one whose lookup keeps
+failing — a failure writes `Comment`, not the values, so it stays pending — is
+drawn as often as any other and spends a place on every round that draws it.
+
+`WalletScheduler` remembers, per row id, when the wallet was last handed to a
+round and how many rounds it has been handed to without leaving the pending set.
+A wallet is due at
+
+    last attempt + min(retry_delay * 2 ** (failures - 1), max_retry_delay)
+
+(0 for one never tried), and a round takes the `count` wallets due earliest —
+`heapq.nsmallest`, a heap of `count` entries over the pending list rather than a
+sort of all of it. So a new wallet goes before every one already tried, a
+failing wallet steps back further each time, and none waits for longer than
+`max_retry_delay` past its last attempt before it is ahead of everything tried
+since. Wallets due at the same moment keep the order they are given in, which
+`find_none_values` still shuffles.
+
+A wallet that left the pending set (its values were written, or an operator
+removed the row) is forgotten at the next pick, so the state is never larger
+than the pending set. It lives in the process: a restart treats every wallet as
+new, which is the old behaviour for one round.
+
+The refresh mode (`find_stale_values`) keeps a scheduler of its own over the
+stale wallets: a refresh that fails leaves the row as old as it was, and without
+one it would stay the oldest and take a place in every round.
+"""
+
+import heapq
+import threading
+import time
+
+# Seconds a wallet waits after its first failed round, doubled with each
+# further one up to the ceiling: an hour, so even a wallet that never resolves
+# is retried at least that often.
+DEFAULT_RETRY_DELAY = 60.0
+DEFAULT_MAX_RETRY_DELAY = 3600.0
+
+
+class WalletScheduler:
+    def __init__(self, retry_delay=DEFAULT_RETRY_DELAY, max_retry_delay=DEFAULT_MAX_RETRY_DELAY, clock=time.time):
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.clock = clock
+        # row id -> (rounds handed to without leaving the pending set, when last).
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def due(self, row_id):
+        """When the wallet `row_id` is next due; 0 for one never handed to a round."""
+        with self._lock:
+            return self._due(row_id)
+
+    def _due(self, row_id):
+        failures, last = self._attempts.get(row_id, (0, None))
+        if last is None:
+            return 0.0
+        # Still pending after every round it was handed to: each one failed it.
+        return last + min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+
+    def pick(self, wallets, count, key=None, pending=None):
+        """The `count` wallets of the list `wallets` that are due earliest.
+
+        `pending` is the ids of every pending wallet, `wallets` among them; an id
+        the scheduler knows and that is not in it has left the pending set. It
+        defaults to the ids of `wallets`, and a caller that filtered the pending
+        list — wallets leased elsewhere, or still on their way to Grist — passes
+        the ids from before the filter: a wallet left out for a round is still
+        pending, and keeps its failures for when it is back.
+        `key`, when given, orders the wallets that are due at the same moment.
+        """
+        with self._lock:
+            if pending is None:
+                pending = {wallet.id for wallet in wallets}
+            for row_id in [row_id for row_id in self._attempts if row_id not in pending]:
+                del self._attempts[row_id]
+            if key is None:
+                return heapq.nsmallest(count, wallets, key=lambda wallet: self._due(wallet.id))
+            return heapq.nsmallest(count, wallets, key=lambda wallet: (self._due(wallet.id), key(wallet)))
+
+    def attempted(self, wallets, now=None):
+        """The round is about to check `wallets`."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            for wallet in wallets:
+                failures, _ = self._attempts.get(wallet.id, (0, None))
+                self._attempts[wallet.id] = (failures + 1, now)
+
+    def release(self, wallets):
+        """Take back `attempted` for `wallets`, which the round deferred without checking.
+
+        A wallet tried for the first time is new again and goes first next
+        round; one tried before keeps its failures from those earlier rounds.
+        """
+        with self._lock:
+            for wallet in wallets:
+                failures, last = self._attempts.get(wallet.id, (0, None))
+                if failures <= 1:
+                    self._attempts.pop(wallet.id, None)
+                else:
+                    self._attempts[wallet.id] = (failures - 1, last)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._attempts)
@@ -22,10 +22,15 @@ the wallets are in, so they can be changed by the operator without a redeploy.
 See `src/checker.py`.
 """
 
+import socket
+
+from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.balance_cache import DEFAULT_BALANCE_CACHE_FILE, DEFAULT_BALANCE_CACHE_TTL
 from src.config_errors import load_settings_or_exit
 from src.heartbeat import DEFAULT_HEARTBEAT_FILE, DEFAULT_HEARTBEAT_MAX_AGE
+from src.write_behind import DEFAULT_WRITE_SPOOL_FILE
 
 
 class Settings(BaseSettings):
@@ -34,6 +39,9 @@ class Settings(BaseSettings):
     # from the environment only — a default here would let a misconfigured
     # container talk to the wrong document, or to nothing, without saying so.
     grist_server: str
+    # One document id, or several separated by commas: one process then serves
+    # every one of them, each with its own Wallets and Settings tables (see
+    # run() in src/checker.py). Grist document ids never contain a comma.
     grist_doc_id: str
     grist_api_key: str
 
@@ -49,8 +57,59 @@ class Settings(BaseSettings):
     # for why it must not import this module.
     heartbeat_max_age: int = DEFAULT_HEARTBEAT_MAX_AGE
 
+    # The name this replica writes into `Lease_owner` when leasing is on (the
+    # `Lease minutes` row of the Grist Settings table, see src/leases.py). The
+    # hostname by default, which in a container is its id and therefore already
+    # distinct per replica; set WORKER_ID when something more readable is wanted
+    # in the document. Two replicas sharing one name would share their leases.
+    worker_id: str = Field(default_factory=socket.gethostname)
+
+    # Decode purrfolio and Grist answers with orjson instead of the stdlib (see
+    # src/fast_json.py). Off by default; the values are the same either way.
+    fast_json: bool = False
+
+    # Resolved wallets kept on disk for BALANCE_CACHE_TTL seconds, so a crash or a
+    # rejected Grist write does not re-pay the proxy for them (src/balance_cache.py).
+    # The default file is in the image's `data/` volume; a TTL of 0 turns it off.
+    balance_cache_file: str = DEFAULT_BALANCE_CACHE_FILE
+    balance_cache_ttl: int = DEFAULT_BALANCE_CACHE_TTL
+
+    # Where the copy of the pending Wallets rows is kept between restarts (see
+    # src/wallet_mirror.py). Empty keeps it in memory only; the copy itself is on
+    # either way, and off by itself on a Grist without the `states` endpoint.
+    wallet_mirror_file: str = ""
+
+    # Results written by a background thread from a spool in the data/ volume,
+    # retried until Grist takes them and replayed after a restart (see
+    # src/write_behind.py). Off by default: the round writes each row itself.
+    write_behind: bool = False
+    write_spool_file: str = DEFAULT_WRITE_SPOOL_FILE
+
+    # Wallets columns read along with the four a round needs (WALLET_COLUMNS in
+    # src/grist.py), separated by commas. Empty by default: the operators' own
+    # columns stay in Grist unless something running the rounds wants them.
+    wallet_extra_columns: str = ""
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
+    @field_validator("grist_doc_id")
+    @classmethod
+    def _names_a_document(cls, value):
+        if not [doc_id for doc_id in value.split(",") if doc_id.strip()]:
+            raise ValueError("must name at least one Grist document id")
+        return value
+
+    @property
+    def grist_doc_ids(self):
+        """GRIST_DOC_ID as a list, in the order given, without repeats."""
+        return list(dict.fromkeys(doc_id.strip() for doc_id in self.grist_doc_id.split(",") if doc_id.strip()))
+
+    @property
+    def wallet_columns(self):
+        """WALLET_EXTRA_COLUMNS as a tuple, in the order given, without repeats."""
+        return tuple(dict.fromkeys(column.strip() for column in self.wallet_extra_columns.split(",")
+                                   if column.strip()))
+
 
 # Build settings with clear startup errors: a missing/invalid variable prints a
 # readable message naming the env var and exits, instead of a raw pydantic
@@ -0,0 +1,114 @@
+"""A local copy of the round's Wallets rows, re-read only when the document changed.
+
+Every round used to start with a read of the pending wallets, however little had
+moved since the last one — and on a large document that read is the longest thing
+a round does before its first lookup. Grist numbers every action applied to a
+document (`GET /docs/{doc}/states`, the `n` of the newest state), so whether the
+rows are still what they were is one small request:
+
+  * the number is what it was when the rows were read, plus one per write THIS
+    process made since: nothing else touched the document, and the copy — with
+    those writes applied to it as they were sent — is the document's answer;
+  * anything else means someone else wrote (an operator, another replica, a
+    write of ours that failed after Grist applied it), and the rows are read
+    again.
+
+The copy never decides more than a re-read would: it holds what `fetch_pending`
+returned, and `find_none_values` applies its own filter to it as it does to a
+fresh answer, so a wallet our own write completed drops out the same way.
+
+Optionally kept in a JSON file (WALLET_MIRROR_FILE, in the data/ volume), so a
+restarted container checks the number instead of reading the table. Like the
+balance cache it is an optimisation and never a dependency: a file that cannot be
+read or written is logged and ignored.
+"""
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+
+class WalletMirror:
+    def __init__(self, path=None, logger=None):
+        self.path = path
+        self.logger = logger
+        # The action number the rows were read at, the number of writes made
+        # since, and what the rows were read for: (table, columns).
+        self.state = None
+        self.writes = 0
+        self.key = None
+        self._rows = {}
+        # The write-behind thread applies its writes while the loop reads.
+        self._lock = threading.RLock()
+        if path:
+            self.load()
+
+    def _warn(self, action, error):
+        if self.logger is not None:
+            self.logger.warning(f"Wallet mirror: {action} {self.path} failed: {type(error).__name__}: {error}")
+
+    def is_fresh(self, state, key):
+        """True when the document at `state` can only differ by our own writes."""
+        with self._lock:
+            return self.state is not None and key == self.key and state == self.state + self.writes
+
+    def rows(self):
+        with self._lock:
+            if not self._rows:
+                return []
+            Record = namedtuple("Record", next(iter(self._rows.values())).keys())  # pylint: disable=invalid-name
+            return [Record(**fields) for fields in self._rows.values()]
+
+    def replace(self, state, key, rows):
+        """Start over from `rows`, read from the document at action number `state`."""
+        with self._lock:
+            self.state, self.writes, self.key = state, 0, key
+            self._rows = {row.id: row._asdict() for row in rows}
+
+    def forget(self):
+        with self._lock:
+            self.state, self.writes, self.key, self._rows = None, 0, None, {}
+
+    def applied(self, table, records, actions=1):
+        """Our own write of `records` to `table` went through as `actions` actions."""
+        with self._lock:
+            if self.state is None:
+                return
+            self.writes += actions
+            if self.key is None or table != self.key[0]:
+                return
+            for record in records:
+                row = self._rows.get(record["id"])
+                if row is not None:
+                    row.update((column, value) for column, value in record.items() if column in row)
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                saved = json.load(file)
+            self.state, self.writes = saved["state"], saved["writes"]
+            self.key = (saved["key"][0], tuple(saved["key"][1]))
+            self._rows = {row["id"]: row for row in saved["rows"]}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as error:
+            self._warn("reading", error)
+            self.forget()
+
+    def save(self):
+        if not self.path or self.state is None:
+            return
+        temporary = self.path + ".tmp"
+        try:
+            with self._lock, open(temporary, "w", encoding="utf-8") as file:
+                json.dump({"state": self.state, "writes": self.writes, "key": list(self.key),
+                           "rows": list(self._rows.values())}, file)
+            # A crash mid-write leaves the previous copy, never half of one.
+            os.replace(temporary, self.path)
+        except (OSError, TypeError, ValueError) as error:
+            self._warn("writing", error)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
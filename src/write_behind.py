@@ -0,0 +1,225 @@
+"""Grist writes behind the round: a queue, a writer thread and a spool on disk.
+
+With the writes inline, every wallet's result waits for its Grist call, and a
+call that fails loses a result the proxy was already paid for — the wallet stays
+pending and is checked again some rounds later. With WRITE_BEHIND on, the round
+hands each row to `WriteBehind.update` and moves on:
+
+  * the row is appended to the spool file (JSON lines, flushed and fsynced)
+    BEFORE it is queued, so from then on a crash cannot lose it;
+  * one writer thread takes rows off a bounded queue, up to `batch_rows` at a
+    time, and sends them with `update_many`, one call per table and set of
+    columns, results before failures (as BatchWriter does, for the same reason);
+  * a call that fails transiently — no connection, a timeout, 429 or 5xx — is
+    retried with exponential backoff until it goes through. Any other answer is
+    Grist refusing those rows for good (a 400 for a column the document does not
+    have); they are logged and dropped, and the rest is still written;
+  * when everything spooled has been written the spool is emptied, and a spool
+    left over by a crash is replayed when the next process starts.
+
+A replayed row may already have been written before the crash; writing it again
+sets the same cells to the same values. The queue is bounded (`maxsize`), so a
+Grist that stays down eventually makes `update` wait — the spool keeps the rows
+either way, and the restart that a stuck loop earns replays them.
+
+The rows still on their way are `pending_ids()`, which the next round's selection
+skips: until they land, those wallets look unchecked in the document.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests  # type: ignore
+
+from src.balances import describe_error
+from src.grist import results_first
+from src.retry import TRANSIENT_ERRORS, TRANSIENT_STATUSES, RetryPolicy
+
+# In the same data/ volume as the balance cache (DEFAULT_BALANCE_CACHE_FILE).
+DEFAULT_WRITE_SPOOL_FILE = "data/write_spool.jsonl"
+
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_BATCH_ROWS = 100
+
+
+def is_transient_write_error(error):
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is None or response.status_code in TRANSIENT_STATUSES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class WriteBehind:
+    def __init__(self, grist, path, maxsize=DEFAULT_QUEUE_SIZE, batch_rows=DEFAULT_BATCH_ROWS,
+                 logger=None, backoff=None, sleep=time.sleep):
+        self.grist = grist
+        self.path = path
+        self.batch_rows = batch_rows
+        self.logger = logger
+        # Only its delays are used: a write is retried until it lands.
+        self.backoff = backoff or RetryPolicy(base_delay=1.0, max_delay=60.0)
+        self.sleep = sleep
+        self._queue = queue.Queue(maxsize)
+        # Guards the spool file and the count of rows spooled but not written.
+        self._lock = threading.Condition()
+        self._pending = {}
+        self._unwritten = 0
+        self._thread = None
+        # Read now, so rows this process spools before `start` are not replayed.
+        self._replay = self._read_spool()
+
+    def start(self):
+        """Start the writer thread and queue whatever a previous process left in the spool."""
+        self._thread = threading.Thread(target=self._run, name="grist-writer", daemon=True)
+        self._thread.start()
+        replayed, self._replay = self._replay, []
+        if replayed:
+            if self.logger is not None:
+                self.logger.info(f"Write-behind: replaying {len(replayed)} rows spooled before the restart")
+            with self._lock:
+                self._count(replayed, 1)
+            for record in replayed:
+                self._queue.put(record)
+        return self
+
+    def _read_spool(self):
+        records = []
+        torn = False
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # The torn last line of a crash mid-append: that row was
+                        # never queued, so the round that made it did not move on.
+                        torn = True
+        except FileNotFoundError:
+            pass
+        if torn:
+            # Rewritten without it: the next append would otherwise continue the
+            # torn line, and its first row would be lost with it on a replay.
+            self._rewrite_spool(records)
+        return records
+
+    def _rewrite_spool(self, records):
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.writelines(json.dumps(record) + "\n" for record in records)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except OSError as error:
+            self._log_error(f"Write-behind: rewriting {self.path} failed: {describe_error(error)}")
+            # Then at least end the torn line, so what is appended starts a new one.
+            try:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write("\n")
+            except OSError:
+                pass
+
+    def _empty_spool(self):
+        try:
+            open(self.path, "w", encoding="utf-8").close()
+        except OSError as error:
+            # Not fatal, and it must not end the writer thread: nothing else
+            # drains the queue, and a full queue blocks the round. The rows left
+            # in the spool are written, so a replay only writes them again.
+            self._log_error(f"Write-behind: emptying {self.path} failed, its rows will be replayed on the "
+                            f"next start: {describe_error(error)}")
+
+    def _log_error(self, message):
+        if self.logger is not None:
+            self.logger.error(message)
+
+    def _count(self, records, step):
+        for record in records:
+            row_id = record["id"]
+            self._pending[row_id] = self._pending.get(row_id, 0) + step
+            if not self._pending[row_id]:
+                del self._pending[row_id]
+        self._unwritten += step * len(records)
+
+    def pending_ids(self):
+        with self._lock:
+            return set(self._pending)
+
+    def __len__(self):
+        with self._lock:
+            return self._unwritten
+
+    def update(self, row_id, updates, table=None):
+        """`GRIST.update`, returning once the row is in the spool rather than in Grist."""
+        self.update_many([{"id": row_id, **updates}], table=table)
+
+    def update_many(self, records, table=None):
+        """`GRIST.update_many`, returning once the rows are in the spool.
+
+        A datetime becomes the timestamp Grist stores before anything is
+        written: the spool is JSON, and a row that could not be encoded must not
+        leave the rows before it spooled but never queued.
+        """
+        records = [{"table": table, "id": record["id"],
+                    "updates": {column: self.grist.to_timestamp(value) if isinstance(value, datetime) else value
+                                for column, value in record.items() if column != "id"}}
+                   for record in records]
+        if not records:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(record) + "\n" for record in records)
+                file.flush()
+                os.fsync(file.fileno())
+            self._count(records, 1)
+        # Outside the lock: a full queue waits for the writer, which needs it.
+        for record in records:
+            self._queue.put(record)
+
+    def join(self, timeout=None):
+        """Wait until every spooled row is written; False if `timeout` ran out first."""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._unwritten == 0, timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._deliver(batch)
+            with self._lock:
+                self._count(batch, -1)
+                if self._unwritten == 0:
+                    self._empty_spool()
+                    self._lock.notify_all()
+
+    def _deliver(self, batch):
+        groups = {}
+        for record in batch:
+            groups.setdefault((record["table"], frozenset(record["updates"])), []).append(
+                {"id": record["id"], **record["updates"]})
+        for (table, columns), rows in results_first(groups.items(), columns=lambda group: group[0][1]):
+            attempt = 0
+            while True:
+                try:
+                    self.grist.update_many(rows, table=table)
+                    break
+                except Exception as error:
+                    if not is_transient_write_error(error):
+                        if self.logger is not None:
+                            self.logger.error(f"Write-behind: Grist refused {len(rows)} rows, dropped: "
+                                              f"{describe_error(error)}")
+                        break
+                    delay = self.backoff.delay(attempt)
+                    if self.logger is not None:
+                        self.logger.warning(f"Write-behind: {len(rows)} rows not written, retrying in "
+                                            f"{delay:.1f}s: {describe_error(error)}")
+                    self.sleep(delay)
+                    attempt += 1
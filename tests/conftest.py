@@ -21,40 +21,30 @@ os.environ.setdefault("GRIST_API_KEY", "test-key")
 import pytest  # noqa: E402 - must come after the environment is seeded
 import requests  # noqa: E402
 
-import src.http_timeout  # noqa: E402
+import src.fast_json  # noqa: E402
 
-# `src.http_timeout` holds the ONLY module-level mutable state in this package:
-# an `_installed` flag plus the `requests.Session.request` it swaps out. It is
-# installed here, once, so the whole session starts from the same state the real
-# program runs in. `src.checker` installs it at the top of `run()` — not at import
-# time, deliberately — so the tests that drive `run()` would otherwise flip that
-# state somewhere in the middle of the session and make the baseline depend on
-# collection order.
-src.http_timeout.install_default_timeout()
-
-_BASELINE_INSTALLED = src.http_timeout._installed
-_BASELINE_SESSION_REQUEST = requests.Session.request
+# The decoder switch of `src.fast_json` is the package's module-level mutable
+# state. It is off unless FAST_JSON says otherwise, and `run()` sets it from
+# `settings`; a test that turns it on has to turn it off again.
+_BASELINE_FAST_JSON = src.fast_json._fast
+_SESSION_REQUEST = requests.Session.request
 
 
 @pytest.fixture(autouse=True)
 def module_state_is_pristine():
-    """Fail the test that leaves `src.http_timeout` altered — before AND after.
+    """Fail the test that leaves `src.fast_json` switched — before AND after.
 
     Checked on both sides on purpose. The post-condition names the test that did
     the damage; the pre-condition is what keeps the NEXT test from being blamed
     for it, which is how a state leak normally presents itself: a failure in a
     test that is perfectly correct and only fails when run after another one.
-    Stacking a second wrapper on `Session.request` is the concrete accident here
-    — it would double every timeout in the process quietly.
+    `requests` itself is never patched: every Grist call carries its own timeout
+    (src/grist.py), so the library is the same in here as anywhere else.
     """
-    reason = "src.http_timeout state leaked {}: _installed={!r}, Session.request patched={}"
-    assert src.http_timeout._installed is _BASELINE_INSTALLED and \
-        requests.Session.request is _BASELINE_SESSION_REQUEST, \
-        reason.format("INTO this test (an earlier test did not restore it)",
-                      src.http_timeout._installed,
-                      requests.Session.request is not _BASELINE_SESSION_REQUEST)
+    assert requests.Session.request is _SESSION_REQUEST, "requests.Session.request was patched"
+    assert src.fast_json._fast is _BASELINE_FAST_JSON, \
+        "src.fast_json switch leaked INTO this test: _fast={!r}".format(src.fast_json._fast)
     yield
-    assert src.http_timeout._installed is _BASELINE_INSTALLED and \
-        requests.Session.request is _BASELINE_SESSION_REQUEST, \
-        reason.format("OUT of this test", src.http_timeout._installed,
-                      requests.Session.request is not _BASELINE_SESSION_REQUEST)
+    assert requests.Session.request is _SESSION_REQUEST, "requests.Session.request was patched"
+    assert src.fast_json._fast is _BASELINE_FAST_JSON, \
+        "src.fast_json switch leaked OUT of this test: _fast={!r}".format(src.fast_json._fast)
@@ -0,0 +1,94 @@
+"""The on-disk balance cache: what it keeps, for how long, and how it fails.
+
+Every test that needs a file gets one under pytest's tmp_path; the rest run on
+SQLite's `:memory:`. The failure tests pin the promise in the module docstring —
+the cache may turn itself off, it may never fail a wallet.
+"""
+
+import sqlite3
+
+from src.balance_cache import BalanceCache, open_balance_cache
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class _RecordingLogger:
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message, *args, **kwargs):
+        self.warnings.append(message)
+
+
+def test_an_answer_is_returned_until_its_ttl_runs_out():
+    clock = _Clock()
+    cache = BalanceCache(":memory:", ttl=60, clock=clock)
+    assert cache.get("0xaaa") is None
+    cache.put("0xaaa", 1.5, 2.5)
+    clock.now += 59
+    assert cache.get("0xaaa") == (1.5, 2.5)
+    clock.now += 1
+    assert cache.get("0xaaa") is None
+
+
+def test_a_newer_answer_replaces_the_older_one():
+    clock = _Clock()
+    cache = BalanceCache(":memory:", ttl=60, clock=clock)
+    cache.put("0xaaa", 1.0, 1.0)
+    clock.now += 30
+    cache.put("0xaaa", 2.0, 3.0)
+    clock.now += 45
+    assert cache.get("0xaaa") == (2.0, 3.0)
+    assert len(cache) == 1
+
+
+def test_answers_survive_a_restart_and_expired_ones_are_pruned_on_open(tmp_path):
+    path = str(tmp_path / "balance_cache.sqlite3")
+    clock = _Clock()
+    cache = BalanceCache(path, ttl=60, clock=clock)
+    cache.put("0xold", 1.0, 1.0)
+    clock.now += 50
+    cache.put("0xnew", 2.0, 2.0)
+    cache.close()
+
+    clock.now += 20
+    reopened = BalanceCache(path, ttl=60, clock=clock)
+    assert reopened.get("0xnew") == (2.0, 2.0)
+    assert len(reopened) == 1
+
+
+def test_a_ttl_of_zero_turns_the_cache_off():
+    assert open_balance_cache(":memory:", 0) is None
+
+
+def test_a_file_that_cannot_be_opened_turns_the_cache_off_with_a_warning(tmp_path):
+    logger = _RecordingLogger()
+    assert open_balance_cache(str(tmp_path / "missing" / "cache.sqlite3"), 60, logger=logger) is None
+    assert len(logger.warnings) == 1 and "running without it" in logger.warnings[0]
+
+
+def test_a_broken_cache_is_a_miss_and_a_warning_never_an_error():
+    logger = _RecordingLogger()
+    cache = BalanceCache(":memory:", ttl=60, logger=logger)
+    cache._db.close()
+    assert cache.get("0xaaa") is None
+    cache.put("0xaaa", 1.0, 2.0)
+    assert [message.split(":")[1].strip() for message in logger.warnings] == \
+        ["read failed, going to the network", "write failed, going to the network"]
+
+
+def test_the_file_is_plain_sqlite_with_one_row_per_address(tmp_path):
+    # Readable with the sqlite3 CLI inside the container, which is how anyone
+    # debugging a restart will look at it.
+    path = str(tmp_path / "balance_cache.sqlite3")
+    cache = BalanceCache(path, ttl=60, clock=_Clock(5.0))
+    cache.put("0xaaa", 1.0, 2.0)
+    cache.close()
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT * FROM balances").fetchall() == [("0xaaa", 1.0, 2.0, 5.0)]
@@ -0,0 +1,44 @@
+"""Round and wallet budgets, on a fake clock."""
+
+import pytest
+
+from src.deadline import Deadline, DeadlineExceeded, RoundBudget, WalletDeferred
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Wallet:
+    Address = "0xaaa"
+
+
+def test_a_request_timeout_is_the_ceiling_or_what_is_left():
+    clock = _Clock()
+    deadline = Deadline(25, clock)
+    assert deadline.timeout() == 10
+    clock.now += 22
+    assert deadline.timeout() == pytest.approx(3)
+    assert deadline.timeout(ceiling=2) == 2
+    clock.now += 3
+    assert deadline.expired() and deadline.remaining() == 0
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout()
+
+
+def test_a_budget_without_limits_never_defers_and_gives_no_deadline():
+    assert RoundBudget().start_wallet(_Wallet()) is None
+
+
+def test_a_wallet_starting_after_the_round_deadline_is_deferred():
+    clock = _Clock()
+    budget = RoundBudget(round_seconds=60, wallet_seconds=20, clock=clock)
+    clock.now += 59
+    assert budget.start_wallet(_Wallet()).expires == clock.now + 20
+    clock.now += 1
+    with pytest.raises(WalletDeferred, match="0xaaa"):
+        budget.start_wallet(_Wallet())
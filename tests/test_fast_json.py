@@ -0,0 +1,67 @@
+"""The FAST_JSON decoder switch.
+
+What is pinned is that the switch changes the decoder and nothing else: off, a
+response is decoded by its own `json()` exactly as before; on, by orjson from the
+raw bytes, to the same value; on without orjson, by `json()` again, and
+`enable_fast_json` reports that it did not take.
+"""
+
+import json
+
+import pytest
+
+import src.fast_json
+from src.fast_json import enable_fast_json, response_json
+
+PAYLOAD = {"grandTotal": "1234.5", "holdings": [{"coin": "HYPE", "total": 1.5e-3}], "name": "ünï"}
+
+
+class _Response:
+    """Both halves of a requests/httpx response the decoder may read."""
+
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode("utf-8")
+        self.json_calls = 0
+
+    def json(self):
+        self.json_calls += 1
+        return json.loads(self.content)
+
+
+@pytest.fixture
+def switch(monkeypatch):
+    """Restores the process-wide switch after the test, whatever it was set to."""
+    monkeypatch.setattr(src.fast_json, "_fast", src.fast_json._fast)
+    return enable_fast_json
+
+
+def test_off_by_default_the_response_decodes_itself():
+    response = _Response(PAYLOAD)
+    assert response_json(response) == PAYLOAD
+    assert response.json_calls == 1
+
+
+def test_on_the_bytes_go_to_orjson_and_the_value_is_the_same(switch):
+    assert switch(True) is True
+    response = _Response(PAYLOAD)
+    assert response_json(response) == PAYLOAD
+    assert response.json_calls == 0
+
+
+def test_on_without_orjson_falls_back_and_says_so(switch, monkeypatch):
+    monkeypatch.setattr(src.fast_json, "orjson", None)
+    assert switch(True) is False
+    response = _Response(PAYLOAD)
+    assert response_json(response) == PAYLOAD
+    assert response.json_calls == 1
+
+
+def test_a_malformed_body_is_still_a_value_error(switch):
+    # check_balance reports the exception's class and text in the wallet's
+    # Comment; a decoder that raised something outside ValueError would read as
+    # a different kind of failure there.
+    switch(True)
+    response = _Response(PAYLOAD)
+    response.content = b'{"grandTotal": '
+    with pytest.raises(ValueError):
+        response_json(response)
@@ -1,35 +1,66 @@
 """The Grist wrapper, against a recording double instead of a Grist server.
 
-`GristDocAPI` is replaced wholesale, so nothing here opens a socket. What is
+`DocAPI` (grist_api's client) is replaced wholesale, so nothing here opens a socket. What is
 tested is the translation layer between this service and that client: the column
 names it rewrites and the timestamps it converts. Both are silent failure modes —
 an unrewritten "Wait time max" is simply rejected by Grist, and a timestamp read
 in the wrong zone looks like data rather than like a bug.
 """
 
+import json
 from datetime import datetime, timedelta, timezone
 
 import pytest
+import requests
 
+import src.fast_json
 import src.grist
-from src.grist import GRIST
+from src.grist import GRIST, BatchWriter
+from src.wallet_mirror import WalletMirror
 
 
 class FakeGristDocAPI:
     """Records what the real client would have been asked to do."""
 
-    def __init__(self, doc_id, server=None, api_key=None):
+    def __init__(self, doc_id, server=None, api_key=None, session=None, timeout=None):
         self.doc_id = doc_id
         self.server = server
         self.api_key = api_key
+        self.session = session
+        self.timeout = timeout
         self.updates = []
         self.tables = {}
-
-    def update_records(self, table, records):
+        self.queries = []
+        self.sql_error = None
+        self.state = 1
+        self.states_error = None
+
+    def call(self, url, json_data=None, method=None, prefix=None):
+        if url == "states":
+            if self.states_error is not None:
+                raise self.states_error
+            return {"states": [{"n": self.state, "h": "hash"}, {"n": self.state - 1, "h": "older"}]}
+        assert url == "sql"
+        self.queries.append((json_data["sql"], json_data["args"]))
+        if self.sql_error is not None:
+            raise self.sql_error
+        return {"records": [{"fields": dict(row.__dict__)} for row in self.tables.get("sql", [])]}
+
+    def add_records(self, table, records, chunk_size=None):
+        self.added = getattr(self, "added", []) + [(table, records, chunk_size)]
+        self.state += 1
+        return list(range(100, 100 + len(records)))
+
+    def update_records(self, table, records, group_if_needed=False):
         self.updates.append((table, records))
+        self.state += len({frozenset(record) for record in records}) if group_if_needed else 1
+        self.grouped = group_if_needed
 
-    def fetch_table(self, table):
-        return self.tables.get(table, [])
+    def fetch_table(self, table, filters=None):
+        rows = self.tables.get(table, [])
+        for column, value in (filters or {}).items():
+            rows = [row for row in rows if getattr(row, column, None) == value]
+        return rows
 
 
 class Row:
@@ -50,14 +81,14 @@ class _NullLogger:
 
 @pytest.fixture
 def grist(monkeypatch):
-    monkeypatch.setattr(src.grist, "GristDocAPI", FakeGristDocAPI)
+    monkeypatch.setattr(src.grist, "DocAPI", FakeGristDocAPI)
     return GRIST("http://grist.invalid", "doc-1", "key-1", "Wallets", "Settings", _NullLogger())
 
 
 # --- construction ------------------------------------------------------------
 
 def test_table_names_are_sanitised_at_construction(monkeypatch):
-    monkeypatch.setattr(src.grist, "GristDocAPI", FakeGristDocAPI)
+    monkeypatch.setattr(src.grist, "DocAPI", FakeGristDocAPI)
     client = GRIST("s", "d", "k", "My Wallets", "Node Settings", _NullLogger())
     assert client.nodes_table == "My_Wallets"
     assert client.settings_table == "Node_Settings"
@@ -119,6 +150,95 @@ def test_non_datetime_values_travel_untouched(grist):
     assert records == [{"id": 7, "Comment": "Error: boom", "Value": "--"}]
 
 
+def test_update_many_sends_every_row_in_one_call_and_rewrites_them_like_update(grist):
+    moment = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    grist.update_many([{"id": 1, "Lease owner": "a", "Checked": moment},
+                       {"id": 2, "Comment": "Error: boom"}])
+    [(table, records)] = grist.grist.updates
+    assert table == "Wallets"
+    assert records == [{"id": 1, "Lease_owner": "a", "Checked": int(moment.timestamp())},
+                       {"id": 2, "Comment": "Error: boom"}]
+    # Two different column sets in one batch: grist_api must be told to split it.
+    assert grist.grist.grouped is True
+
+
+def test_add_many_rewrites_column_names_and_returns_the_new_ids(grist):
+    assert grist.add_many([{"Address": "0xa", "Some Column": 1}], chunk_size=500) == [100]
+    assert grist.grist.added == [("Wallets", [{"Address": "0xa", "Some_Column": 1}], 500)]
+    assert grist.add_many([]) == []
+
+
+def test_update_many_with_nothing_to_write_makes_no_call(grist):
+    grist.update_many([])
+    assert grist.grist.updates == []
+
+
+# --- batched writes ----------------------------------------------------------
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_a_batch_buffers_until_it_is_full(grist):
+    batch = BatchWriter(grist, max_rows=2)
+    batch.update(1, {"hypercore_hype_value": 1.0})
+    batch.flush_if_due()
+    assert grist.grist.updates == [] and len(batch) == 1
+    batch.update(2, {"hypercore_hype_value": 2.0})
+    batch.flush_if_due()
+    assert grist.grist.updates == [("Wallets", [{"id": 1, "hypercore_hype_value": 1.0},
+                                                {"id": 2, "hypercore_hype_value": 2.0}])]
+    assert len(batch) == 0
+
+
+def test_a_batch_is_due_once_its_oldest_row_is_old_enough(grist):
+    clock = _Clock()
+    batch = BatchWriter(grist, max_rows=100, max_age=5, clock=clock)
+    batch.update(1, {"A": 1})
+    clock.now = 4.9
+    batch.flush_if_due()
+    assert grist.grist.updates == []
+    clock.now = 5.0
+    batch.flush_if_due()
+    assert grist.grist.updates == [("Wallets", [{"id": 1, "A": 1}])]
+
+
+def test_a_flush_sends_results_before_failures_one_call_per_column_set(grist):
+    batch = BatchWriter(grist, max_rows=100)
+    batch.update(1, {"Comment": "Error: boom", "Value": "--"})
+    batch.update(2, {"A": 2})
+    batch.update(3, {"A": 3})
+    batch.flush()
+    assert [[record["id"] for record in records] for _, records in grist.grist.updates] == [[2, 3], [1]]
+
+
+def test_a_failed_group_does_not_stop_the_others_and_is_raised_after_them(grist):
+    calls = []
+
+    def update_many(records, table=None):
+        calls.append([record["id"] for record in records])
+        if "Comment" not in records[0]:
+            raise requests.HTTPError("boom")
+
+    grist.update_many = update_many
+    batch = BatchWriter(grist, max_rows=100)
+    batch.update(1, {"A": 1})
+    batch.update(2, {"Comment": "Error: x", "Value": "--"})
+    with pytest.raises(requests.HTTPError):
+        batch.flush()
+    assert calls == [[1], [2]] and len(batch) == 0
+
+
+def test_an_empty_batch_makes_no_call(grist):
+    BatchWriter(grist, max_rows=1).flush_if_due()
+    BatchWriter(grist, max_rows=1).flush()
+    assert grist.grist.updates == []
+
+
 # --- reads -------------------------------------------------------------------
 
 def test_fetch_table_defaults_to_the_nodes_table(grist):
@@ -126,6 +246,11 @@ def test_fetch_table_defaults_to_the_nodes_table(grist):
     assert [row.id for row in grist.fetch_table()] == [1]
 
 
+def test_fetch_table_passes_its_filters_through(grist):
+    grist.grist.tables["Wallets"] = [Row(id=1, Lease_owner="a"), Row(id=2, Lease_owner="b")]
+    assert [row.id for row in grist.fetch_table(filters={"Lease_owner": "b"})] == [2]
+
+
 def test_find_settings_returns_the_value_column_of_the_matching_row(grist):
     grist.grist.tables["Settings"] = [
         Row(Setting="Proxy", Value="http://proxy.invalid"),
@@ -163,3 +288,312 @@ def test_find_settings_raises_when_no_name_is_given(grist):
 def test_find_settings_sanitises_an_overridden_table_name(grist):
     grist.grist.tables["Other_Settings"] = [Row(Setting="Proxy", Value="x")]
     assert grist.find_settings("Proxy", table="Other Settings") == "x"
+
+
+def test_a_settings_snapshot_answers_every_lookup_from_one_fetch(grist, monkeypatch):
+    grist.grist.tables["Settings"] = [Row(Setting="Proxy", Value="x"), Row(Setting="Concurrency", Value="4")]
+    fetches = []
+    fetch_table = grist.grist.fetch_table
+    monkeypatch.setattr(grist.grist, "fetch_table", lambda table, filters=None: fetches.append(table) or fetch_table(table))
+    snapshot = grist.settings_snapshot()
+    assert snapshot.find_settings("Proxy") == "x"
+    assert snapshot.find_optional_setting("Concurrency") == "4"
+    assert snapshot.find_optional_setting("Engine", "threads") == "threads"
+    assert fetches == ["Settings"]
+
+
+def test_a_settings_snapshot_raises_like_find_settings(grist):
+    grist.grist.tables["Settings"] = [Row(Setting="Proxy", Value="")]
+    snapshot = grist.settings_snapshot()
+    with pytest.raises(ValueError, match="empty"):
+        snapshot.find_settings("Proxy")
+    with pytest.raises(ValueError, match="not found"):
+        snapshot.find_settings("Wait time max")
+    assert snapshot.find_optional_setting("Proxy", "fallback") == "fallback"
+
+
+def test_the_first_row_of_a_repeated_setting_wins(grist):
+    grist.grist.tables["Settings"] = [Row(Setting="Proxy", Value="first"), Row(Setting="Proxy", Value="second")]
+    assert grist.settings_snapshot().find_settings("Proxy") == "first"
+    assert grist.find_optional_setting("Proxy") == "first"
+
+
+# --- pending wallets -----------------------------------------------------------
+
+def test_pending_wallets_are_selected_by_grist(grist):
+    grist.grist.tables["sql"] = [Row(id=4, Address="0xb", hypercore_hype_value=None, hyperevm_hype_value=2.0)]
+    grist.grist.tables["Wallets"] = [Row(id=3, Address="0xa"), Row(id=4, Address="0xb")]
+    rows = grist.fetch_pending()
+    assert [(row.id, row.Address, row.hyperevm_hype_value) for row in rows] == [(4, "0xb", 2.0)]
+    [(query, _)] = grist.grist.queries
+    assert 'FROM "Wallets"' in query and '"hypercore_hype_value" IS NULL' in query
+
+
+def test_a_wallet_read_asks_for_the_wallet_columns_only(grist):
+    grist.fetch_pending(extra_columns=("Lease owner", "id"))
+    [(query, _)] = grist.grist.queries
+    assert query.startswith('SELECT "id", "Address", "hypercore_hype_value", "hyperevm_hype_value", '
+                            '"Lease_owner" FROM "Wallets" WHERE ')
+
+
+def test_the_wallet_columns_take_additions(monkeypatch):
+    monkeypatch.setattr(src.grist, "DocAPI", FakeGristDocAPI)
+    grist = GRIST("http://grist.invalid", "doc-1", "key-1", "Wallets", "Settings", _NullLogger(),
+                  wallet_columns=("Owner", "Address"))
+    grist.fetch_pending()
+    [(query, _)] = grist.grist.queries
+    assert query.startswith('SELECT "id", "Address", "hypercore_hype_value", "hyperevm_hype_value", '
+                            '"Owner" FROM "Wallets" WHERE ')
+
+
+def test_fetch_columns_projects_and_filters_by_value(grist):
+    grist.grist.tables["sql"] = [Row(id=2)]
+    assert [row.id for row in grist.fetch_columns(["id"], filters={"Lease owner": "me"})] == [2]
+    assert grist.grist.queries == [('SELECT "id" FROM "Wallets" WHERE "Lease_owner" = ?', ["me"])]
+
+
+def test_fetch_columns_narrowed_to_ids(grist):
+    grist.grist.tables["sql"] = [Row(id=2), Row(id=5)]
+    assert [row.id for row in grist.fetch_columns(["id"], filters={"Lease owner": "me"}, ids=[2, 3])] == [2]
+    assert grist.grist.queries == [('SELECT "id" FROM "Wallets" WHERE "Lease_owner" = ? AND "id" IN (?, ?)',
+                                    ["me", 2, 3])]
+    assert grist.fetch_columns(["id"], ids=[]) == []
+    assert len(grist.grist.queries) == 1
+
+
+def test_fetch_columns_without_sql_narrows_the_whole_table_to_ids(grist):
+    grist.grist.sql_error = _http_error(404, "Not Found")
+    grist.grist.tables["Wallets"] = [Row(id=1, Lease_owner="me"), Row(id=2, Lease_owner="me")]
+    assert [row.id for row in grist.fetch_columns(["id"], filters={"Lease owner": "me"}, ids=[2])] == [2]
+
+
+def test_fetch_columns_without_sql_is_the_filtered_fetch_table(grist):
+    grist.grist.sql_error = _http_error(403, "Forbidden")
+    grist.grist.tables["Wallets"] = [Row(id=1, Lease_owner="a"), Row(id=2, Lease_owner="me")]
+    assert [row.id for row in grist.fetch_columns(["id"], filters={"Lease owner": "me"})] == [2]
+
+
+def test_no_pending_wallets_is_an_empty_list(grist):
+    assert grist.fetch_pending() == []
+
+
+def test_a_refused_sql_endpoint_falls_back_to_the_whole_table_for_good(grist):
+    grist.grist.sql_error = _http_error(404, "Not Found")
+    grist.grist.tables["Wallets"] = [Row(id=3, Address="0xa")]
+    assert [row.id for row in grist.fetch_pending()] == [3]
+    assert [row.id for row in grist.fetch_pending()] == [3]
+    # Asked once: a Grist without the endpoint is not asked again every round.
+    assert len(grist.grist.queries) == 1
+
+
+def test_a_sql_endpoint_that_says_it_is_not_supported_is_turned_off(grist):
+    grist.grist.sql_error = _http_error(400, "SQL is not supported by this Grist")
+    grist.fetch_pending()
+    assert not grist.sql_enabled
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503])
+def test_a_transient_sql_error_fails_the_round_and_keeps_the_endpoint(grist, status):
+    # A 502 from the reverse proxy once must not send every later round of the
+    # process to the whole-table read.
+    grist.grist.sql_error = _http_error(status, "try later")
+    with pytest.raises(requests.HTTPError):
+        grist.fetch_pending()
+    assert grist.sql_enabled
+    grist.grist.sql_error = None
+    grist.fetch_pending()
+    assert len(grist.grist.queries) == 2
+
+
+def test_an_unreachable_grist_is_not_mistaken_for_a_missing_endpoint(grist):
+    grist.grist.sql_error = requests.ConnectionError("refused")
+    with pytest.raises(requests.ConnectionError):
+        grist.fetch_pending()
+    assert grist.sql_enabled
+
+
+# --- the wallet mirror -------------------------------------------------------
+
+@pytest.fixture
+def mirrored(grist):
+    grist.mirror = WalletMirror()
+    grist.grist.tables["sql"] = [Row(id=1, Address="0xa", hypercore_hype_value=None, hyperevm_hype_value=None),
+                                 Row(id=2, Address="0xb", hypercore_hype_value=None, hyperevm_hype_value=None)]
+    return grist
+
+
+def test_an_unchanged_document_is_not_read_again(mirrored):
+    first = mirrored.fetch_pending()
+    assert mirrored.fetch_pending() == first
+    assert len(mirrored.grist.queries) == 1
+
+
+def test_our_own_writes_land_in_the_mirror_without_a_re_read(mirrored):
+    mirrored.fetch_pending()
+    mirrored.update(1, {"hypercore_hype_value": 1.0, "hyperevm_hype_value": 2.0})
+    mirrored.update_many([{"id": 2, "Comment": "Error: x", "Value": "--"}, {"id": 9, "Address": "0xz"}])
+    rows = {row.id: row for row in mirrored.fetch_pending()}
+    assert len(mirrored.grist.queries) == 1
+    assert (rows[1].hypercore_hype_value, rows[1].hyperevm_hype_value) == (1.0, 2.0)
+    # Columns the mirror was not read with are not invented for it.
+    assert not hasattr(rows[2], "Comment") and 9 not in rows
+
+
+def test_a_change_made_by_anyone_else_is_read_again(mirrored):
+    mirrored.fetch_pending()
+    mirrored.grist.state += 1
+    mirrored.fetch_pending()
+    assert len(mirrored.grist.queries) == 2
+
+
+def test_other_columns_are_read_again(mirrored):
+    mirrored.fetch_pending()
+    mirrored.fetch_pending(extra_columns=("Lease_owner",))
+    assert len(mirrored.grist.queries) == 2
+
+
+def test_stale_rows_are_selected_by_grist_with_their_stamp(grist):
+    grist.grist.tables["sql"] = [Row(id=3, Address="0xc", hypercore_hype_value=1, hyperevm_hype_value=2,
+                                     Checked_at=None)]
+    rows = grist.fetch_stale(1_700_000_000)
+    assert [row.id for row in rows] == [3]
+    query, args = grist.grist.queries[-1]
+    assert query == 'SELECT "id", "Address", "hypercore_hype_value", "hyperevm_hype_value", "Checked_at" ' \
+                    'FROM "Wallets" WHERE ' + src.grist.STALE_CONDITION
+    assert args == [1_700_000_000]
+
+
+def test_added_rows_make_the_mirror_read_again(mirrored):
+    mirrored.fetch_pending()
+    mirrored.add_many([{"Address": "0xnew"}])
+    mirrored.fetch_pending()
+    assert len(mirrored.grist.queries) == 2
+
+
+def test_a_grist_without_states_turns_the_mirror_off(mirrored):
+    mirrored.grist.states_error = _http_error(403, "Forbidden")
+    mirrored.fetch_pending()
+    mirrored.fetch_pending()
+    assert mirrored.mirror is None and len(mirrored.grist.queries) == 2
+
+
+def test_a_transient_states_error_fails_the_round_and_keeps_the_mirror(mirrored):
+    mirror = mirrored.mirror
+    mirrored.grist.states_error = _http_error(503, "Service Unavailable")
+    with pytest.raises(requests.HTTPError):
+        mirrored.fetch_pending()
+    assert mirrored.mirror is mirror
+
+
+# --- optional settings -------------------------------------------------------
+
+def test_an_optional_setting_returns_its_value_when_present(grist):
+    grist.grist.tables["Settings"] = [Row(Setting="Price max age", Value="300")]
+    assert grist.find_optional_setting("Price max age") == "300"
+
+
+@pytest.mark.parametrize("rows", [[], [Row(Setting="Price max age", Value="")],
+                                  [Row(Setting="Price max age", Value=None)]])
+def test_an_absent_or_empty_optional_setting_gives_the_default(grist, rows):
+    # A document that predates the knob has no such row, and that must not stop
+    # a service that was running the day before the upgrade.
+    grist.grist.tables["Settings"] = rows
+    assert grist.find_optional_setting("Price max age") is None
+    assert grist.find_optional_setting("Price max age", default=7) == 7
+
+
+# --- DocAPI: grist_api's client over a kept-alive session ----------------------
+#
+# The one piece of this module that talks HTTP, so it runs against real
+# `requests.Response` objects handed out by a stand-in for the session.
+
+def _http_error(status, text):
+    response = requests.Response()
+    response.status_code = status
+    response._content = text.encode("utf-8")
+    return requests.HTTPError(text, response=response)
+
+
+def _response(status, payload):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(payload).encode("utf-8")
+    return response
+
+
+class _RecordingSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.timeouts = []
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        self.calls.append((method, url, data, headers))
+        self.timeouts.append(timeout)
+        return self.responses.pop(0)
+
+
+def _doc_api(session, **kwargs):
+    return src.grist.DocAPI("doc-1", server="http://grist.invalid", api_key="key-1", session=session, **kwargs)
+
+
+COLUMNS = {"id": [1, 2], "Address": ["0xa", "0xb"], "Value": [None, 1.5]}
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_doc_api_fetches_the_same_rows_with_either_decoder(monkeypatch, fast):
+    monkeypatch.setattr(src.fast_json, "_fast", fast)
+    request = _RecordingSession(_response(200, COLUMNS))
+    rows = _doc_api(request).fetch_table("Wallets")
+    assert [(row.id, row.Address, row.Value) for row in rows] == [(1, "0xa", None), (2, "0xb", 1.5)]
+    method, url, data, headers = request.calls[0]
+    assert (method, url, data) == ("GET", "http://grist.invalid/api/docs/doc-1/tables/Wallets/data", None)
+    assert headers["Authorization"] == "Bearer key-1"
+
+
+def test_doc_api_posts_sql_to_the_documents_sql_endpoint():
+    request = _RecordingSession(_response(200, {"statement": "...", "records": [{"fields": {"id": 2}}]}))
+    answer = _doc_api(request).call(
+        "sql", json_data={"sql": "SELECT id FROM Wallets", "args": []})
+    assert answer["records"] == [{"fields": {"id": 2}}]
+    method, url, data, _ = request.calls[0]
+    assert (method, url) == ("POST", "http://grist.invalid/api/docs/doc-1/sql")
+    assert json.loads(data) == {"sql": "SELECT id FROM Wallets", "args": []}
+
+
+def test_doc_api_keeps_the_librarys_error_message_and_busy_retry(monkeypatch):
+    monkeypatch.setattr(src.grist.time, "sleep", lambda seconds: None)
+    request = _RecordingSession(_response(500, {"error": "SQLITE_BUSY: database is locked"}),
+                                _response(400, {"error": "Invalid column \"Nope\""}))
+    api = _doc_api(request)
+    with pytest.raises(requests.HTTPError, match='Invalid column "Nope"'):
+        api.update_records("Wallets", [{"id": 1, "Nope": 1}])
+    assert len(request.calls) == 2
+
+
+def test_every_call_carries_the_timeout_the_library_never_sets():
+    # grist_api passes none, and a stalled Grist connection would hang the loop.
+    request = _RecordingSession(_response(200, COLUMNS), _response(200, {"states": [{"n": 1}]}))
+    api = _doc_api(request, timeout=7)
+    api.fetch_table("Wallets")
+    api.call("states", method="GET")
+    assert request.timeouts == [7, 7]
+    assert _doc_api(_RecordingSession())._timeout == src.grist.DEFAULT_GRIST_TIMEOUT
+
+
+def test_a_client_keeps_one_session_for_all_its_calls_and_closes_only_its_own(monkeypatch):
+    monkeypatch.setattr(src.grist, "DocAPI", FakeGristDocAPI)
+    own = GRIST("s", "d", "k", "Wallets", "Settings", _NullLogger())
+    assert isinstance(own.session, requests.Session)
+    assert own.grist.session is own.session and own.grist.timeout == src.grist.DEFAULT_GRIST_TIMEOUT
+    adapter = own.session.get_adapter("https://grist.invalid")
+    assert adapter._pool_maxsize == src.grist.DEFAULT_GRIST_POOL_SIZE
+
+    shared = requests.Session()
+    closed = []
+    monkeypatch.setattr(shared, "close", lambda: closed.append(True))
+    borrowed = GRIST("s", "d", "k", "Wallets", "Settings", _NullLogger(), session=shared, timeout=5)
+    assert borrowed.grist.session is shared and borrowed.grist.timeout == 5
+    borrowed.close()
+    assert closed == []
+    own.close()
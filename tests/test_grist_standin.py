@@ -0,0 +1,92 @@
+"""The Grist stand-in of benchmarks/, against the real client over real HTTP.
+
+Load numbers measured against it are only worth something if it answers the way
+Grist does, so this drives `GRIST` itself — no double in between — through the
+calls the service makes.
+"""
+
+import logging
+from datetime import datetime, timezone
+
+import pytest
+import requests
+
+from benchmarks.grist_standin import DOC_ID, Document, GristStandIn, populate
+from src.balances import find_stale_values
+from src.grist import GRIST
+from src.import_wallets import import_wallets
+from src.wallet_mirror import WalletMirror
+
+
+@pytest.fixture
+def standin():
+    document = Document()
+    populate(document, 50, checked=0.5)
+    with GristStandIn(document) as server:
+        yield server
+
+
+def _client(standin, mirror=None):
+    return GRIST(standin.url, DOC_ID, "key", "Wallets", "Settings", logging.getLogger("test"), mirror=mirror)
+
+
+def test_the_settings_table_is_there_for_a_round(standin):
+    snapshot = _client(standin).settings_snapshot()
+    assert snapshot.find_settings("Walled count max") == "100"
+    assert snapshot.find_optional_setting("Concurrency", 1) == 1
+
+
+def test_the_sql_read_and_the_whole_table_pick_the_same_pending_wallets(standin):
+    grist = _client(standin)
+    pending = sorted(row.id for row in grist.fetch_pending())
+    everything = grist.fetch_table()
+    assert pending == sorted(row.id for row in everything
+                             if row.hypercore_hype_value is None or row.hyperevm_hype_value is None)
+    assert set(grist.fetch_pending()[0]._fields) == set(grist.wallet_columns)
+
+
+def test_writes_land_and_move_the_action_counter(standin):
+    grist = _client(standin, mirror=WalletMirror())
+    wallet = grist.fetch_pending()[0]
+    before = grist.doc_state()
+    grist.update_many([{"id": wallet.id, "hypercore_hype_value": 1.0, "hyperevm_hype_value": 2.0},
+                       {"id": wallet.id, "Comment": "x"}])
+    assert grist.doc_state() == before + 2
+    assert [row.hypercore_hype_value for row in grist.fetch_table() if row.id == wallet.id] == [1.0]
+    # Our own two writes only: the mirror answers, with the write applied.
+    assert grist.mirror.is_fresh(before + 2, grist.mirror.key)
+    assert [row.hypercore_hype_value for row in grist.fetch_pending() if row.id == wallet.id] == [1.0]
+
+
+def test_an_unknown_column_is_refused_like_grist_refuses_it(standin):
+    with pytest.raises(requests.HTTPError, match='Invalid column "Nope"'):
+        _client(standin).update(1, {"Nope": 1})
+
+
+def test_an_import_adds_only_the_addresses_the_table_lacks(standin):
+    grist = _client(standin)
+    existing = grist.fetch_table()[0].Address
+    added, skipped = import_wallets(grist, [existing.upper().replace("0X", "0x"), "0xnew1", "0xnew1", "0xnew2"],
+                                    chunk=1)
+    assert (added, skipped) == (2, 2)
+    assert [row.Address for row in grist.fetch_table()][-2:] == ["0xnew1", "0xnew2"]
+
+
+def test_a_client_makes_all_its_calls_over_one_kept_alive_connection(standin):
+    grist = _client(standin)
+    grist.settings_snapshot()
+    grist.fetch_pending()
+    grist.update(1, {"Comment": "checked"})
+    grist.doc_state()
+    assert standin.connections == [1]
+    grist.close()
+
+
+def test_a_stamped_wallet_is_stale_only_once_its_stamp_is_old(standin):
+    grist = _client(standin)
+    checked = [row.id for row in grist.fetch_table() if row.hypercore_hype_value is not None]
+    grist.update(checked[0], {"Checked at": datetime(2024, 1, 1, tzinfo=timezone.utc)})
+    stale = find_stale_values(grist, before=grist.to_timestamp(datetime(2023, 1, 1, tzinfo=timezone.utc)),
+                              count=len(checked))
+    # Unstamped rows are all stale; the stamped one is newer than `before`.
+    assert sorted(wallet.id for wallet in stale) == checked[1:]
@@ -0,0 +1,48 @@
+"""The bulk import: which lines become rows, and how many calls that takes."""
+
+from src.import_wallets import import_wallets, read_addresses
+
+
+class _Row:
+    def __init__(self, Address):
+        self.Address = Address
+
+
+class _Grist:
+    def __init__(self, addresses=()):
+        self.rows = [_Row(address) for address in addresses]
+        self.calls = []
+
+    def fetch_columns(self, columns, table=None, filters=None):
+        assert list(columns) == ["Address"]
+        return list(self.rows)
+
+    def add_many(self, records, table=None, chunk_size=None):
+        self.calls.append([record["Address"] for record in records])
+        return list(range(len(records)))
+
+
+def test_blank_lines_comments_and_extra_columns_are_skipped():
+    lines = ["0xaaa\n", "\n", "  # a note\n", "0xbbb, label\n", "  0xccc   2024-01-01\n"]
+    assert list(read_addresses(lines)) == ["0xaaa", "0xbbb", "0xccc"]
+
+
+def test_known_and_repeated_addresses_are_not_added_again():
+    grist = _Grist(["0xAbC", "", None])
+    added, skipped = import_wallets(grist, ["0xabc", "0xdef", "0xDEF", "0x123"])
+    assert (added, skipped) == (2, 2)
+    # The first spelling of an address is the one written.
+    assert grist.calls == [["0xdef", "0x123"]]
+
+
+def test_new_rows_go_out_a_chunk_at_a_time_while_the_input_streams():
+    grist = _Grist()
+    added, _ = import_wallets(grist, ("0x{}".format(n) for n in range(5)), chunk=2)
+    assert added == 5
+    assert grist.calls == [["0x0", "0x1"], ["0x2", "0x3"], ["0x4"]]
+
+
+def test_nothing_new_makes_no_call():
+    grist = _Grist(["0xaaa"])
+    assert import_wallets(grist, ["0xaaa"]) == (0, 1)
+    assert grist.calls == []
@@ -0,0 +1,92 @@
+"""Wallet leases, against a recording double of the Grist wrapper.
+
+The claim is write-then-read-back, because Grist cannot compare-and-swap. What
+is pinned here is the part that decides whether two replicas check the same
+wallet: which leases count as live, and that a row whose read-back carries
+another replica's name is dropped rather than checked.
+"""
+
+from src.leases import LEASE_EXPIRES_COLUMN, LEASE_OWNER_COLUMN, claim, is_claimable
+
+
+class _Wallet:
+    def __init__(self, id, owner=None, expires=None):
+        self.id = id
+        setattr(self, LEASE_OWNER_COLUMN, owner)
+        setattr(self, LEASE_EXPIRES_COLUMN, expires)
+
+
+class _Grist:
+    """Applies writes to its rows; `overwrite` is another replica winning a row."""
+
+    def __init__(self, overwrite=None):
+        self.rows = {}
+        self.overwrite = overwrite or {}
+        self.writes = []
+        self.read_ids = []
+
+    def update_many(self, records, table=None):
+        self.writes.append(records)
+        for record in records:
+            self.rows.setdefault(record["id"], {}).update(record)
+        for row_id, owner in self.overwrite.items():
+            self.rows[row_id][LEASE_OWNER_COLUMN] = owner
+
+    def fetch_columns(self, columns, table=None, filters=None, ids=None):
+        assert list(columns) == ["id"]
+        self.read_ids.append(ids)
+        return [_Wallet(row_id, row[LEASE_OWNER_COLUMN], row[LEASE_EXPIRES_COLUMN])
+                for row_id, row in self.rows.items()
+                if (ids is None or row_id in ids) and all(row.get(column) == value for column, value in (filters or {}).items())]
+
+
+def test_an_unleased_wallet_is_claimable():
+    assert is_claimable(_Wallet(1), "me", 1000)
+    assert is_claimable(_Wallet(1, owner="", expires=None), "me", 1000)
+
+
+def test_our_own_lease_is_claimable_again():
+    # A wallet whose check failed is still pending; the replica holding it may retry.
+    assert is_claimable(_Wallet(1, owner="me", expires=5000), "me", 1000)
+
+
+def test_a_live_lease_of_another_replica_is_not_claimable():
+    assert not is_claimable(_Wallet(1, owner="other", expires=1001), "me", 1000)
+
+
+def test_an_expired_lease_is_reclaimed():
+    # A replica that died mid-round releases nothing; expiry is what frees its rows.
+    assert is_claimable(_Wallet(1, owner="other", expires=1000), "me", 1000)
+    assert is_claimable(_Wallet(1, owner="other", expires=None), "me", 1000)
+
+
+def test_a_claim_writes_owner_and_expiry_in_one_batch():
+    grist = _Grist()
+    claimed = claim(grist, [_Wallet(1), _Wallet(2)], "me", 300, now=1000)
+    assert [wallet.id for wallet in claimed] == [1, 2]
+    assert grist.writes == [[
+        {"id": 1, LEASE_OWNER_COLUMN: "me", LEASE_EXPIRES_COLUMN: 1300},
+        {"id": 2, LEASE_OWNER_COLUMN: "me", LEASE_EXPIRES_COLUMN: 1300},
+    ]]
+
+
+def test_a_row_the_read_back_gives_to_another_replica_is_dropped():
+    grist = _Grist(overwrite={2: "other"})
+    claimed = claim(grist, [_Wallet(1), _Wallet(2), _Wallet(3)], "me", 300, now=1000)
+    assert [wallet.id for wallet in claimed] == [1, 3]
+
+
+def test_the_read_back_asks_for_the_claimed_rows_only():
+    # Leases are never cleared: every row this replica leased in earlier rounds
+    # still carries its name, and must not come back with this round's claim.
+    grist = _Grist()
+    claim(grist, [_Wallet(1), _Wallet(2)], "me", 300, now=1000)
+    claimed = claim(grist, [_Wallet(3)], "me", 300, now=2000)
+    assert [wallet.id for wallet in claimed] == [3]
+    assert grist.read_ids == [[1, 2], [3]]
+
+
+def test_claiming_nothing_touches_nothing():
+    grist = _Grist()
+    assert claim(grist, [], "me", 300) == []
+    assert grist.writes == []
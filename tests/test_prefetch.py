@@ -0,0 +1,94 @@
+"""The background read of the next round, against a recording Grist double."""
+
+import threading
+
+from src.leases import LEASE_COLUMNS
+from src.prefetch import RoundPrefetch, read_round
+
+
+class _Snapshot:
+    def __init__(self, values):
+        self.values = values
+
+    def find_optional_setting(self, setting, default=None):
+        return self.values.get(setting, default)
+
+
+class _Grist:
+    def __init__(self, values=None, fail=None):
+        self.values = values or {}
+        self.fail = fail
+        self.calls = []
+        self.threads = set()
+
+    def settings_snapshot(self):
+        self.calls.append("settings")
+        self.threads.add(threading.current_thread().name)
+        if self.fail is not None:
+            raise self.fail
+        return _Snapshot(self.values)
+
+    def fetch_pending(self, table=None, extra_columns=()):
+        self.calls.append(("pending", tuple(extra_columns)))
+        return ["row"]
+
+
+class _Logger:
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+def test_a_round_reads_its_settings_first_and_the_rows_it_needs_after():
+    grist = _Grist({"Lease minutes": "5"})
+    prefetched = read_round(grist)
+    assert grist.calls == ["settings", ("pending", tuple(LEASE_COLUMNS))]
+    assert prefetched.extra_columns == LEASE_COLUMNS and prefetched.pending == ["row"]
+    assert read_round(_Grist()).extra_columns == ()
+
+
+class _WriteBehind:
+    def __init__(self, grist, ids):
+        self.grist = grist
+        self.ids = ids
+
+    def pending_ids(self):
+        self.grist.calls.append("queue")
+        return set(self.ids)
+
+
+def test_the_queued_ids_are_recorded_before_the_rows_are_read():
+    grist = _Grist()
+    prefetched = read_round(grist, _WriteBehind(grist, {3, 4}))
+    assert prefetched.in_flight == {3, 4}
+    assert grist.calls[0] == "queue"
+    assert read_round(_Grist()).in_flight == frozenset()
+
+
+def test_nothing_started_is_nothing_taken():
+    grist = _Grist()
+    assert RoundPrefetch(grist).take() is None
+    assert grist.calls == []
+
+
+def test_a_started_read_runs_once_in_the_background_and_is_taken_once():
+    grist = _Grist()
+    prefetch = RoundPrefetch(grist)
+    prefetch.start()
+    prefetch.start()
+    assert prefetch.take().pending == ["row"]
+    assert prefetch.take() is None
+    assert grist.calls == ["settings", ("pending", ())]
+    assert all(name.startswith("prefetch") for name in grist.threads)
+    prefetch.close()
+
+
+def test_a_failed_read_is_logged_and_left_to_the_round():
+    logger = _Logger()
+    prefetch = RoundPrefetch(_Grist(fail=ConnectionError("grist down")), logger=logger)
+    prefetch.start()
+    assert prefetch.take() is None
+    assert "grist down" in logger.warnings[0]
+    prefetch.close()
@@ -0,0 +1,132 @@
+"""The token bucket every purrfolio request goes through.
+
+A fake clock and a recording sleep stand in for time, so the schedule the
+bucket produces is checked exactly and nothing here waits for real — except the
+one test that proves the threads really share the bucket.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.rate_limit import TokenBucket
+
+
+class _Time:
+    """A clock that `sleep` advances, recording every wait."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _bucket(rate, burst=1):
+    fake = _Time()
+    return TokenBucket(rate, burst, clock=fake.clock, sleep=fake.sleep), fake
+
+
+def test_an_unlimited_bucket_never_waits():
+    bucket, fake = _bucket(None)
+    for _ in range(100):
+        bucket.acquire()
+    assert fake.sleeps == []
+
+
+def test_the_burst_goes_out_at_once_and_the_rest_at_the_rate():
+    bucket, fake = _bucket(rate=4, burst=3)
+    for _ in range(6):
+        bucket.acquire()
+    assert fake.sleeps == [0.25, 0.25, 0.25]
+
+
+def test_the_sustained_rate_is_the_configured_one():
+    bucket, fake = _bucket(rate=10, burst=5)
+    for _ in range(105):
+        bucket.acquire()
+    # 5 from the burst, then 100 at 10/s.
+    assert fake.now == pytest.approx(10.0)
+
+
+def test_an_idle_bucket_refills_only_up_to_its_burst():
+    bucket, fake = _bucket(rate=1, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    fake.now += 3600
+    for _ in range(3):
+        bucket.acquire()
+    assert fake.sleeps == [1.0]
+
+
+def test_reconfiguring_every_round_does_not_hand_out_a_fresh_burst():
+    # run() calls configure() with the Settings table's values at the start of
+    # each round; a reset there would turn every round into a burst again.
+    bucket, fake = _bucket(rate=1, burst=5)
+    for _ in range(5):
+        bucket.acquire()
+    bucket.configure(1, 5)
+    bucket.acquire()
+    assert fake.sleeps == [1.0]
+
+
+def test_a_smaller_burst_clips_the_balance_and_a_new_rate_applies_at_once():
+    bucket, fake = _bucket(rate=1, burst=10)
+    bucket.configure(2, 2)
+    for _ in range(3):
+        bucket.acquire()
+    assert fake.sleeps == [0.5]
+
+
+def test_turning_the_limit_off_and_on_again():
+    bucket, fake = _bucket(rate=1)
+    bucket.configure(None)
+    for _ in range(10):
+        bucket.acquire()
+    bucket.configure(1, 2)
+    for _ in range(3):
+        bucket.acquire()
+    assert fake.sleeps == [1.0]
+
+
+@pytest.mark.parametrize("rate,burst", [(0, 1), (-1, 1), (1, 0)])
+def test_a_nonsense_setting_is_refused_naming_it(rate, burst):
+    bucket, _ = _bucket(None)
+    with pytest.raises(ValueError, match="Setting Rate"):
+        bucket.configure(rate, burst)
+
+
+def test_the_coroutine_waits_for_its_token_without_blocking_the_loop(monkeypatch):
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr("src.rate_limit.asyncio.sleep", fake_sleep)
+    bucket, fake = _bucket(rate=2, burst=1)
+
+    async def three():
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(3)))
+
+    asyncio.run(three())
+    # Reserved in order with the clock standing still: each waits one token longer.
+    assert waits == [0.5, 1.0]
+    assert fake.sleeps == []
+
+
+def test_threads_share_one_bucket():
+    bucket = TokenBucket(rate=200, burst=1)
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(20)]
+    started = bucket.clock()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 19 tokens past the first at 200/s: no thread got one for free.
+    assert bucket.clock() - started >= 19 / 200 * 0.9
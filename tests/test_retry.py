@@ -0,0 +1,240 @@
+"""Retries of transient purrfolio failures, and the per-endpoint breakers.
+
+The policy runs against a fake clock, a recording sleep and a jitter that
+returns its ceiling, so every wait it chooses is checked exactly.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from src.deadline import Deadline, DeadlineExceeded
+from src.retry import (
+    HALF_OPEN_RETRY_AFTER,
+    CircuitBreaker,
+    CircuitOpen,
+    RetryPolicy,
+    UpstreamStatusError,
+    is_transient,
+    raise_for_transient_status,
+)
+
+
+class _Time:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _policy(**kwargs):
+    fake = _Time()
+    policy = RetryPolicy(clock=fake.clock, sleep=fake.sleep, jitter=lambda low, high: high, **kwargs)
+    return policy, fake
+
+
+class _Flaky:
+    """Raises the given errors in turn, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "answer"
+
+
+class _Answer:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError(),
+    requests.exceptions.ProxyError(),
+    requests.exceptions.ReadTimeout(),
+    httpx.ConnectError("refused"),
+    httpx.ReadTimeout("slow"),
+    UpstreamStatusError("debank", 429),
+    UpstreamStatusError("debank", 503),
+])
+def test_what_counts_as_transient(error):
+    assert is_transient(error)
+
+
+@pytest.mark.parametrize("error", [
+    KeyError("grandTotal"),
+    ValueError("grandTotal is not an amount: 'x'"),
+    UpstreamStatusError("debank", 404),
+])
+def test_what_is_the_wallets_own_answer(error):
+    assert not is_transient(error)
+
+
+def test_only_429_and_5xx_answers_are_turned_into_errors():
+    for status in (200, 404):
+        answer = _Answer(status)
+        assert raise_for_transient_status("price", answer) is answer
+    with pytest.raises(UpstreamStatusError, match="price answered HTTP 502"):
+        raise_for_transient_status("price", _Answer(502))
+
+
+def test_a_transient_failure_is_retried_with_growing_waits():
+    policy, fake = _policy(attempts=3, base_delay=1.0)
+    request = _Flaky(requests.exceptions.ConnectionError(), UpstreamStatusError("debank", 503))
+    assert policy.call("debank", request) == "answer"
+    assert request.calls == 3
+    assert fake.sleeps == [1.0, 2.0]
+
+
+def test_the_waits_are_capped_and_jittered_below_the_cap():
+    policy, _ = _policy(base_delay=1.0, max_delay=8.0)
+    assert [policy.delay(retry) for retry in range(6)] == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+    drawn = []
+    policy.jitter = lambda low, high: drawn.append((low, high)) or low
+    assert policy.delay(2) == 0
+    assert drawn == [(0, 4.0)]
+
+
+def test_the_last_transient_error_is_raised_when_the_attempts_run_out():
+    policy, fake = _policy(attempts=2)
+    last = requests.exceptions.ConnectionError("still down")
+    with pytest.raises(requests.exceptions.ConnectionError) as exc_info:
+        policy.call("debank", _Flaky(requests.exceptions.ConnectionError(), last))
+    assert exc_info.value is last
+    assert len(fake.sleeps) == 1
+
+
+def test_a_wait_is_slept_only_while_it_ends_inside_the_wallets_budget():
+    policy, fake = _policy(attempts=3, base_delay=1.0)
+    deadline = Deadline(2.5, clock=fake.clock)
+    request = _Flaky(requests.exceptions.ConnectionError(), UpstreamStatusError("debank", 503))
+    # 1s is slept; the 2s wait after it would end past the 2.5s budget, so the
+    # request gives up there instead of sleeping into it.
+    with pytest.raises(DeadlineExceeded, match="debank failed \\(UpstreamStatusError\\)"):
+        policy.call("debank", request, deadline=deadline)
+    assert fake.sleeps == [1.0] and request.calls == 2
+
+
+def test_the_coroutine_twin_gives_up_at_the_budget_too(monkeypatch):
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr("src.retry.asyncio.sleep", fake_sleep)
+    policy, fake = _policy(attempts=3, base_delay=1.0)
+    flaky = _Flaky(httpx.ConnectError("refused"))
+
+    async def request():
+        return flaky()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(policy.call_async("price", request, deadline=Deadline(0.5, clock=fake.clock)))
+    assert waits == []
+
+
+def test_anything_else_is_raised_at_once():
+    policy, fake = _policy()
+    request = _Flaky(KeyError("usd_value"))
+    with pytest.raises(KeyError):
+        policy.call("debank", request)
+    assert request.calls == 1 and fake.sleeps == []
+
+
+def test_the_breaker_opens_after_threshold_failed_requests_and_stops_sending():
+    policy, fake = _policy(attempts=1, breaker_threshold=3, breaker_cooldown=60)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            policy.call("hypercore", _Flaky(requests.exceptions.ConnectionError()))
+    request = _Flaky()
+    with pytest.raises(CircuitOpen) as exc_info:
+        policy.call("hypercore", request)
+    assert request.calls == 0
+    assert exc_info.value.endpoint == "hypercore" and exc_info.value.retry_after == 60
+    # Each endpoint has its own.
+    assert policy.call("debank", _Flaky()) == "answer"
+
+
+def test_a_success_resets_the_count():
+    policy, _ = _policy(attempts=1, breaker_threshold=2)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            policy.call("price", _Flaky(requests.exceptions.ConnectionError()))
+        assert policy.call("price", _Flaky()) == "answer"
+
+
+def test_after_the_cooldown_one_trial_decides():
+    fake = _Time()
+    breaker = CircuitBreaker("debank", threshold=2, cooldown=30, clock=fake.clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    fake.now += 30
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    fake.now += 30
+    breaker.check()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.check()
+
+
+def test_while_the_trial_is_out_every_other_request_is_still_refused():
+    # With Concurrency > 1 every wallet in flight reaches the breaker at once
+    # after the cooldown; only one of them may go to the endpoint.
+    fake = _Time()
+    breaker = CircuitBreaker("debank", threshold=1, cooldown=30, clock=fake.clock)
+    breaker.record_failure()
+    fake.now += 30
+    assert breaker.check() is True
+    with pytest.raises(CircuitOpen) as exc_info:
+        breaker.check()
+    assert exc_info.value.retry_after == HALF_OPEN_RETRY_AFTER
+    # The trial's own retries go through.
+    assert breaker.check(trial=True) is True
+    breaker.record_success()
+    assert breaker.check() is False
+
+
+def test_a_trial_without_a_verdict_hands_the_trial_on():
+    policy, fake = _policy(attempts=1, breaker_threshold=1, breaker_cooldown=30)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.call("price", _Flaky(requests.exceptions.ConnectionError()))
+    fake.now += 30
+    # The wallet's own bad answer says nothing about the endpoint being up.
+    with pytest.raises(KeyError):
+        policy.call("price", _Flaky(KeyError("price")))
+    assert policy.call("price", _Flaky()) == "answer"
+    assert policy.breaker("price").check() is False
+
+
+def test_the_coroutine_twin_retries_without_blocking_the_loop(monkeypatch):
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr("src.retry.asyncio.sleep", fake_sleep)
+    policy, fake = _policy(attempts=3)
+    flaky = _Flaky(httpx.ConnectError("refused"))
+
+    async def request():
+        return flaky()
+
+    assert asyncio.run(policy.call_async("price", request)) == "answer"
+    assert waits == [1.0] and fake.sleeps == []
@@ -0,0 +1,106 @@
+"""The wallet scheduler: which pending wallets a round takes, and in what order.
+
+A fake clock stands in for time, so the due times below are exact.
+"""
+
+from src.scheduler import WalletScheduler
+
+
+class _Wallet:
+    def __init__(self, id):
+        self.id = id
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _wallets(*ids):
+    return [_Wallet(row_id) for row_id in ids]
+
+
+def _ids(wallets):
+    return [wallet.id for wallet in wallets]
+
+
+def _scheduler():
+    clock = _Clock()
+    return WalletScheduler(retry_delay=60, max_retry_delay=600, clock=clock), clock
+
+
+def test_wallets_never_tried_go_first_in_the_order_given():
+    scheduler, _ = _scheduler()
+    scheduler.attempted(_wallets(1))
+    assert _ids(scheduler.pick(_wallets(3, 1, 2), 2)) == [3, 2]
+
+
+def test_a_key_orders_the_wallets_due_together():
+    scheduler, _ = _scheduler()
+    scheduler.attempted(_wallets(1))
+    assert _ids(scheduler.pick(_wallets(1, 2, 3, 4), 3, key=lambda wallet: -wallet.id)) == [4, 3, 2]
+
+
+def test_every_pending_wallet_is_reached_within_a_bounded_number_of_rounds():
+    # The case a random slice never bounded: more pending wallets than a round
+    # takes, none of them resolving.
+    scheduler, clock = _scheduler()
+    pending = _wallets(*range(10))
+    seen = set()
+    for _ in range(4):
+        picked = scheduler.pick(pending, 3)
+        scheduler.attempted(picked)
+        seen.update(_ids(picked))
+        clock.now += 1
+    assert seen == set(range(10))
+
+
+def test_a_failing_wallet_steps_back_further_after_each_failed_round():
+    scheduler, clock = _scheduler()
+    for delay in (60, 120, 240, 480, 600, 600):
+        scheduler.attempted(_wallets(7))
+        assert scheduler.due(7) == clock.now + delay
+
+
+def test_the_longest_waiting_wallet_is_taken_before_a_recent_one():
+    scheduler, clock = _scheduler()
+    scheduler.attempted(_wallets(1))
+    clock.now += 30
+    scheduler.attempted(_wallets(2))
+    assert _ids(scheduler.pick(_wallets(2, 1), 1)) == [1]
+
+
+def test_wallets_that_left_the_pending_set_are_forgotten():
+    scheduler, _ = _scheduler()
+    scheduler.attempted(_wallets(1, 2, 3))
+    scheduler.pick(_wallets(2), 5)
+    assert len(scheduler) == 1
+    assert scheduler.due(1) == 0.0
+
+
+def test_a_wallet_filtered_out_for_a_round_keeps_its_failures():
+    # Still pending, only not takeable this round (leased elsewhere, or its
+    # failure still on its way to Grist): it must not come back as new.
+    scheduler, _ = _scheduler()
+    scheduler.attempted(_wallets(1))
+    scheduler.pick(_wallets(2), 5, pending={1, 2})
+    assert len(scheduler) == 1
+    assert _ids(scheduler.pick(_wallets(1, 2), 1)) == [2]
+
+
+def test_a_deferred_wallet_is_handed_back_as_it_was_before_the_pick():
+    scheduler, clock = _scheduler()
+    scheduler.attempted(_wallets(1, 2))
+    clock.now += 100
+    scheduler.attempted(_wallets(1, 2))
+    scheduler.release(_wallets(1))
+    scheduler.release(_wallets(3))
+    # Wallet 1 keeps its earlier failure; a first-timer would be new again.
+    assert scheduler.due(1) == clock.now + 60
+    assert scheduler.due(2) == clock.now + 120
+    scheduler.attempted(_wallets(5))
+    scheduler.release(_wallets(5))
+    assert scheduler.due(5) == 0.0
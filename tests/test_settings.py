@@ -16,6 +16,8 @@ test is trying to remove, making these pass for the wrong reason on one machine
 and fail on another.
 """
 
+import socket
+
 import pytest
 from pydantic import ValidationError
 
@@ -33,7 +35,9 @@ def _fill_required(monkeypatch):
 
 
 def _clear_optional(monkeypatch):
-    for name in ("HEARTBEAT_FILE", "HEARTBEAT_MAX_AGE"):
+    for name in ("HEARTBEAT_FILE", "HEARTBEAT_MAX_AGE", "WORKER_ID", "FAST_JSON",
+                 "BALANCE_CACHE_FILE", "BALANCE_CACHE_TTL", "WALLET_MIRROR_FILE",
+                 "WRITE_BEHIND", "WRITE_SPOOL_FILE", "WALLET_EXTRA_COLUMNS"):
         monkeypatch.delenv(name, raising=False)
 
 
@@ -118,3 +122,75 @@ def test_extra_environment_variables_do_not_break_startup(monkeypatch):
     _fill_required(monkeypatch)
     monkeypatch.setenv("SOMETHING_UNRELATED", "value")
     assert Settings(_env_file=None).grist_doc_id == "doc-1"
+
+
+def test_the_lease_owner_defaults_to_the_hostname_and_can_be_named(monkeypatch):
+    # In a container the hostname is its id, which is what keeps two replicas'
+    # leases apart without anyone having to configure them.
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    assert Settings(_env_file=None).worker_id == socket.gethostname()
+    monkeypatch.setenv("WORKER_ID", "replica-a")
+    assert Settings(_env_file=None).worker_id == "replica-a"
+
+
+def test_the_fast_decoder_is_opt_in(monkeypatch):
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    assert Settings(_env_file=None).fast_json is False
+    monkeypatch.setenv("FAST_JSON", "true")
+    assert Settings(_env_file=None).fast_json is True
+
+
+def test_the_balance_cache_lives_in_the_data_volume_by_default(monkeypatch):
+    # Relative to WORKDIR /app: the directory the Dockerfile creates for `app`
+    # and the entrypoint checks is writable.
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    s = Settings(_env_file=None)
+    assert s.balance_cache_file == "data/balance_cache.sqlite3"
+    assert s.balance_cache_ttl == 3600
+    monkeypatch.setenv("BALANCE_CACHE_TTL", "0")
+    assert Settings(_env_file=None).balance_cache_ttl == 0
+
+
+def test_the_wallet_mirror_stays_in_memory_unless_given_a_file(monkeypatch):
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    assert Settings(_env_file=None).wallet_mirror_file == ""
+    monkeypatch.setenv("WALLET_MIRROR_FILE", "data/wallet_mirror.json")
+    assert Settings(_env_file=None).wallet_mirror_file == "data/wallet_mirror.json"
+
+
+def test_write_behind_is_off_by_default_and_spools_into_the_data_volume(monkeypatch):
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    s = Settings(_env_file=None)
+    assert s.write_behind is False
+    assert s.write_spool_file == "data/write_spool.jsonl"
+
+
+def test_one_document_id_is_a_list_of_one(monkeypatch):
+    _fill_required(monkeypatch)
+    assert Settings(_env_file=None).grist_doc_ids == ["doc-1"]
+
+
+def test_several_document_ids_are_split_on_commas_in_order(monkeypatch):
+    _fill_required(monkeypatch)
+    monkeypatch.setenv("GRIST_DOC_ID", " doc-2, doc-1 ,doc-2,")
+    assert Settings(_env_file=None).grist_doc_ids == ["doc-2", "doc-1"]
+
+
+def test_a_document_list_without_a_document_is_rejected(monkeypatch):
+    _fill_required(monkeypatch)
+    monkeypatch.setenv("GRIST_DOC_ID", " , ")
+    with pytest.raises(ValidationError, match="at least one Grist document id"):
+        Settings(_env_file=None)
+
+
+def test_a_wallet_read_adds_no_columns_unless_named(monkeypatch):
+    _fill_required(monkeypatch)
+    _clear_optional(monkeypatch)
+    assert Settings(_env_file=None).wallet_columns == ()
+    monkeypatch.setenv("WALLET_EXTRA_COLUMNS", " Comment, Owner ,Comment,")
+    assert Settings(_env_file=None).wallet_columns == ("Comment", "Owner")
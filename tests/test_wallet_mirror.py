@@ -0,0 +1,70 @@
+"""The wallet mirror on its own: when it answers, and what it keeps on disk.
+
+The round trips it saves are pinned in tests/test_grist.py, against the Grist
+wrapper that consults it. Files live under pytest's tmp_path.
+"""
+
+from collections import namedtuple
+
+from src.wallet_mirror import WalletMirror
+
+Record = namedtuple("Record", ["id", "Address", "hypercore_hype_value"])
+KEY = ("Wallets", ("id", "Address", "hypercore_hype_value"))
+
+
+class _Logger:
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+def test_an_empty_mirror_is_never_fresh():
+    assert not WalletMirror().is_fresh(1, KEY)
+
+
+def test_fresh_only_at_the_read_state_plus_our_writes():
+    mirror = WalletMirror()
+    mirror.replace(10, KEY, [Record(1, "0xa", None)])
+    assert mirror.is_fresh(10, KEY)
+    mirror.applied("Wallets", [{"id": 1, "hypercore_hype_value": 1.5}], actions=2)
+    assert not mirror.is_fresh(10, KEY) and not mirror.is_fresh(13, KEY)
+    assert mirror.is_fresh(12, KEY)
+    assert not mirror.is_fresh(12, ("Wallets", ("id",)))
+    assert mirror.rows() == [Record(1, "0xa", 1.5)]
+
+
+def test_a_write_to_another_table_counts_but_changes_no_row():
+    mirror = WalletMirror()
+    mirror.replace(10, KEY, [Record(1, "0xa", None)])
+    mirror.applied("Settings", [{"id": 1, "hypercore_hype_value": 3.0}])
+    assert mirror.is_fresh(11, KEY) and mirror.rows() == [Record(1, "0xa", None)]
+
+
+def test_the_mirror_survives_a_restart_through_its_file(tmp_path):
+    path = str(tmp_path / "mirror.json")
+    mirror = WalletMirror(path)
+    mirror.replace(10, KEY, [Record(1, "0xa", None), Record(2, "0xb", 2.0)])
+    mirror.applied("Wallets", [{"id": 2, "hypercore_hype_value": 3.0}])
+    mirror.save()
+    restarted = WalletMirror(path)
+    assert restarted.is_fresh(11, KEY)
+    assert [tuple(row) for row in restarted.rows()] == [(1, "0xa", None), (2, "0xb", 3.0)]
+
+
+def test_an_unreadable_file_is_logged_and_ignored(tmp_path):
+    path = tmp_path / "mirror.json"
+    path.write_text("{not json")
+    logger = _Logger()
+    mirror = WalletMirror(str(path), logger=logger)
+    assert len(mirror) == 0 and not mirror.is_fresh(1, KEY)
+    assert logger.warnings
+
+
+def test_a_file_that_cannot_be_written_is_logged_and_ignored(tmp_path):
+    logger = _Logger()
+    mirror = WalletMirror(str(tmp_path / "missing" / "mirror.json"), logger=logger)
+    mirror.replace(1, KEY, [])
+    mirror.save()
+    assert logger.warnings
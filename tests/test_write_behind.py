@@ -0,0 +1,177 @@
+"""The write-behind queue: what reaches Grist, what is retried, what survives a crash.
+
+A recording double stands in for the Grist wrapper, the spool lives under
+pytest's tmp_path, and the backoff does not sleep. Every test waits for the
+writer thread through `join`, with a timeout, so a lost row fails rather than
+hangs.
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+import requests
+
+from src.grist import BatchWriter
+from src.write_behind import WriteBehind, is_transient_write_error
+
+
+class _Grist:
+    def __init__(self, failures=()):
+        self.calls = []
+        self.failures = list(failures)
+
+    def to_timestamp(self, dtime):
+        return int(dtime.timestamp())
+
+    def update_many(self, records, table=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.calls.append((table, [dict(record) for record in records]))
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError("status {}".format(status), response=response)
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / "spool.jsonl")
+
+
+def _writer(grist, spool, **kwargs):
+    return WriteBehind(grist, spool, sleep=lambda seconds: None, **kwargs)
+
+
+def test_rows_reach_grist_and_the_spool_is_emptied(spool):
+    grist = _Grist()
+    writer = _writer(grist, spool).start()
+    writer.update(1, {"hypercore_hype_value": 1.0, "hyperevm_hype_value": 2.0})
+    writer.update(2, {"Value": "--", "Comment": "Error: x"})
+    assert writer.join(timeout=5)
+    written = {record["id"]: record for _, records in grist.calls for record in records}
+    assert written[1] == {"id": 1, "hypercore_hype_value": 1.0, "hyperevm_hype_value": 2.0}
+    assert written[2] == {"id": 2, "Value": "--", "Comment": "Error: x"}
+    assert open(spool).read() == "" and writer.pending_ids() == set()
+
+
+def test_a_row_is_in_the_spool_before_it_is_written(spool):
+    # Not started: nothing drains the queue, so the spool is all there is.
+    writer = _writer(_Grist(), spool)
+    writer.update(7, {"hypercore_hype_value": 1.0})
+    assert [json.loads(line) for line in open(spool)] == \
+        [{"table": None, "id": 7, "updates": {"hypercore_hype_value": 1.0}}]
+    assert writer.pending_ids() == {7}
+
+
+def test_a_spool_left_by_a_crash_is_replayed_on_start(spool):
+    _writer(_Grist(), spool).update(7, {"hypercore_hype_value": 1.0})
+    with open(spool, "a") as file:
+        file.write('{"table": null, "id": 8, "upd')       # torn by the crash
+    grist = _Grist()
+    writer = _writer(grist, spool).start()
+    assert writer.join(timeout=5)
+    assert grist.calls == [(None, [{"id": 7, "hypercore_hype_value": 1.0}])]
+
+
+def test_a_transient_failure_is_retried_until_it_lands(spool):
+    grist = _Grist(failures=[requests.ConnectionError(), _http_error(502)])
+    writer = _writer(grist, spool).start()
+    writer.update(1, {"hypercore_hype_value": 1.0})
+    assert writer.join(timeout=5)
+    assert grist.calls == [(None, [{"id": 1, "hypercore_hype_value": 1.0}])]
+
+
+def test_a_refused_group_is_dropped_and_the_rest_still_written(spool):
+    # Failures go last, so a document without Value/Comment still gets its results.
+    grist = _Grist()
+    original = grist.update_many
+
+    def update_many(records, table=None):
+        if "Comment" in records[0]:
+            raise _http_error(400)
+        original(records, table)
+
+    grist.update_many = update_many
+    writer = _writer(grist, spool, batch_rows=10)
+    writer.update(1, {"Value": "--", "Comment": "Error: x"})
+    writer.update(2, {"hypercore_hype_value": 1.0})
+    writer.start()
+    assert writer.join(timeout=5)
+    assert grist.calls == [(None, [{"id": 2, "hypercore_hype_value": 1.0}])]
+
+
+@pytest.mark.parametrize("error, transient", [
+    (requests.ConnectionError(), True),
+    (requests.Timeout(), True),
+    (_http_error(429), True),
+    (_http_error(503), True),
+    (_http_error(400), False),
+    (ValueError("no"), False),
+])
+def test_which_write_errors_are_retried(error, transient):
+    assert is_transient_write_error(error) is transient
+
+
+def test_a_batch_of_stamped_rows_is_spooled_as_timestamps(spool):
+    # Refresh mode stamps `Checked_at` with a datetime, and with `Write batch
+    # size` above 1 it reaches the spool through BatchWriter.flush ->
+    # update_many, not through update.
+    grist = _Grist()
+    writer = _writer(grist, spool)
+    stamp = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    batch = BatchWriter(writer, max_rows=2)
+    batch.update(1, {"hypercore_hype_value": 1.0, "hyperevm_hype_value": 2.0, "Checked_at": stamp})
+    batch.update(2, {"hypercore_hype_value": 3.0, "hyperevm_hype_value": 4.0, "Checked_at": stamp})
+    batch.flush()
+    spooled = [json.loads(line) for line in open(spool)]
+    assert [record["updates"]["Checked_at"] for record in spooled] == [int(stamp.timestamp())] * 2
+    writer.start()
+    assert writer.join(timeout=5)
+    written = {record["id"]: record for _, records in grist.calls for record in records}
+    assert written[1]["Checked_at"] == written[2]["Checked_at"] == int(stamp.timestamp())
+
+
+def test_a_torn_line_is_dropped_before_anything_is_appended(spool):
+    _writer(_Grist(), spool).update(7, {"hypercore_hype_value": 1.0})
+    with open(spool, "a") as file:
+        file.write('{"table": null, "id": 8, "upd')       # torn by the crash
+    writer = _writer(_Grist(), spool)
+    writer.update(9, {"hypercore_hype_value": 3.0})
+    # The new row is on a line of its own, so the next replay reads it.
+    assert [record["id"] for record in writer._read_spool()] == [7, 9]
+
+
+class _Logger:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def warning(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+
+def test_a_spool_that_cannot_be_emptied_does_not_stop_the_writer(spool, monkeypatch):
+    real_open = open
+
+    def failing_open(path, mode="r", **kwargs):
+        if path == spool and mode == "w":
+            raise OSError(28, "No space left on device")
+        return real_open(path, mode, **kwargs)
+
+    monkeypatch.setattr("src.write_behind.open", failing_open, raising=False)
+    grist, logger = _Grist(), _Logger()
+    writer = _writer(grist, spool, logger=logger).start()
+    writer.update(1, {"hypercore_hype_value": 1.0})
+    assert writer.join(timeout=5)
+    writer.update(2, {"hypercore_hype_value": 2.0})
+    assert writer.join(timeout=5)
+    assert [record["id"] for _, records in grist.calls for record in records] == [1, 2]
+    assert "No space left on device" in logger.errors[0]